@@ -1,12 +1,33 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import asyncio
+import base64
 import boto3
+import contextlib
+from collections import OrderedDict
+import gzip
+import itertools
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
-from typing import Dict, Any, List
+import threading
+import zlib
+import time
+from typing import Dict, Any, Awaitable, Callable, Iterator, List, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # Only needed for the async serving mode
+    httpx = None
+
+try:
+    import orjson
+except ImportError:  # Optional speedup; the standard library codec is used without it
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
@@ -15,141 +36,816 @@ CORS(app)
 OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
 OPENSEARCH_USERNAME = os.environ.get('OPENSEARCH_USERNAME', 'admin')
 OPENSEARCH_PASSWORD = os.environ.get('OPENSEARCH_PASSWORD')
+OPENSEARCH_POOL_SIZE = int(os.environ.get('OPENSEARCH_POOL_SIZE', 20))
+OPENSEARCH_CONNECT_TIMEOUT = float(os.environ.get('OPENSEARCH_CONNECT_TIMEOUT', 3))
+OPENSEARCH_READ_TIMEOUT = float(os.environ.get('OPENSEARCH_READ_TIMEOUT', 30))
+OPENSEARCH_MAX_RETRIES = int(os.environ.get('OPENSEARCH_MAX_RETRIES', 3))
+OPENSEARCH_RETRY_BACKOFF = float(os.environ.get('OPENSEARCH_RETRY_BACKOFF', 0.2))
+OPENSEARCH_COMPRESSION = os.environ.get('OPENSEARCH_COMPRESSION', 'true').lower() == 'true'
+
+INDEX_PREFIX = os.environ.get('INDEX_NAME', 'logs')
+# Queries spanning more monthly indices than this fall back to the wildcard
+MAX_TARGET_INDICES = int(os.environ.get('MAX_TARGET_INDICES', 24))
+# The ingest Lambda picks the index once per batch, so documents can trail into the next month
+INDEX_BOUNDARY_SLACK = timedelta(minutes=15)
+
+# Per-minute count documents written by the ingest Lambda; aggregations over these
+# dimensions with minute-aligned bounds read them instead of scanning raw logs
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', 'true').lower() == 'true'
+ROLLUP_INDEX_PREFIX = os.environ.get('ROLLUP_INDEX_NAME', f'rollup-{INDEX_PREFIX}')
+# Rollups also count status_code, but raw documents only hold it under parsed_fields, so
+# rollup buckets for it would not match a raw aggregation of the same field
+ROLLUP_FIELDS = ('source', 'service', 'level')
+
+# How long an idle point in time survives between cursor pages
+PIT_KEEP_ALIVE = os.environ.get('PIT_KEEP_ALIVE', '2m')
+
+# Point in time sort; the _id tiebreaker gives hits sharing a timestamp a stable order across pages
+PIT_SORT = [
+    {"timestamp": {"order": "desc"}},
+    {"_id": {"order": "asc"}}
+]
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', 1000))
+
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', 15))
+
+# Query result cache: windows ending within CACHE_TIME_BUCKET seconds of "now" live for the
+# per-endpoint TTL, windows entirely in the past for CACHE_PAST_TTL
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_TIME_BUCKET = int(os.environ.get('CACHE_TIME_BUCKET', 60))
+CACHE_PAST_TTL = float(os.environ.get('CACHE_PAST_TTL', 3600))
+CACHE_TTLS = {
+    "search": float(os.environ.get('SEARCH_CACHE_TTL', 5)),
+    "aggregations": float(os.environ.get('AGGREGATIONS_CACHE_TTL', 30)),
+    "stats": STATS_CACHE_TTL
+}
+
+# 'wsgi' serves the Flask app; 'asgi' serves the async app from create_asgi_app()
+API_SERVER_MODE = os.environ.get('API_SERVER_MODE', 'wsgi').lower()
+OPENSEARCH_ASYNC_POOL_SIZE = int(os.environ.get('OPENSEARCH_ASYNC_POOL_SIZE', 200))
+
+# Request bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+# Months with no index yet must not fail the whole search
+SEARCH_PARAMS = {"ignore_unavailable": "true", "allow_no_indices": "true"}
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp into a naive UTC datetime
+    """
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def resolve_indices(start_time: str = None, end_time: str = None, prefix: str = None) -> str:
+    """
+    Resolve a time range to the monthly indices ({prefix}-YYYY-MM) that can hold it
+    """
+    prefix = prefix or INDEX_PREFIX
+    wildcard = f"{prefix}-*"
+    if not start_time or not end_time:
+        return wildcard
+    
+    try:
+        start = parse_timestamp(start_time) - INDEX_BOUNDARY_SLACK
+        end = parse_timestamp(end_time)
+    except ValueError:
+        return wildcard
+    
+    if end < start:
+        return wildcard
+    
+    indices = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        indices.append(f"{prefix}-{year:04d}-{month:02d}")
+        if len(indices) > MAX_TARGET_INDICES:
+            return wildcard
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    
+    return ",".join(indices)
+
+def use_rollups(start_time: str = None, end_time: str = None, field: str = None) -> bool:
+    """
+    Whether a count aggregation can read the per-minute rollups: the field must be a
+    rollup dimension (None for the fixed stats fields) and both bounds whole minutes.
+    Open-ended ranges reach back before rollups were written, so they scan raw logs
+    """
+    if not ROLLUPS_ENABLED or (field is not None and field not in ROLLUP_FIELDS):
+        return False
+    
+    for value in (start_time, end_time):
+        if not value:
+            return False
+        try:
+            bound = parse_timestamp(value)
+        except ValueError:
+            return False
+        if bound.second or bound.microsecond:
+            return False
+    
+    return True
+
+def rollup_doc_counts(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Give rollup buckets the doc_count of the raw aggregation (their summed per-minute
+    counts) so callers see the same shape whichever index answered
+    """
+    for aggregation in results.get("aggregations", {}).values():
+        for bucket in aggregation.get("buckets", []):
+            if "count" in bucket:
+                bucket["doc_count"] = int(bucket.pop("count")["value"])
+    
+    return results
+
+def json_loads(data: Any) -> Any:
+    """
+    Decode JSON from bytes (or str) without an intermediate UTF-8 decode
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # Inputs orjson is stricter about (NaN, huge integers) get the standard library's verdict
+            pass
+    return json.loads(data)
+
+def json_dumps(value: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # e.g. integers beyond 64 bits or lone surrogates
+            pass
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+class RawJSON:
+    """
+    An OpenSearch response body served to clients as-is, without decoding and re-encoding it
+    """
+    __slots__ = ('data',)
+    
+    def __init__(self, data: bytes):
+        self.data = data
+    
+    def loads(self) -> Any:
+        return json_loads(self.data)
+
+def encode_result(result: Any) -> bytes:
+    return result.data if isinstance(result, RawJSON) else json_dumps(result)
+
+def json_size(value: Any) -> int:
+    return len(value.data) if isinstance(value, RawJSON) else len(json_dumps(value))
+
+def is_cacheable(result: Any) -> bool:
+    return isinstance(result, RawJSON) or "error" not in result
+
+def encode_body(body: Dict[str, Any], compression: bool) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Serialize a request body, gzipping it when compression is on and it is large enough
+    """
+    data = json_dumps(body)
+    if compression and len(data) >= GZIP_MIN_BYTES:
+        return gzip.compress(data), {"Content-Encoding": "gzip"}
+    return data, {}
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """
+    Encode pagination state as an opaque URL-safe token
+    """
+    return base64.urlsafe_b64encode(json_dumps(state)).decode('ascii')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        state = json_loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict) or "pit_id" not in state:
+        raise ValueError("Invalid cursor")
+    return state
 
 class LogSearchAPI:
-    def __init__(self):
+    def __init__(self, pool_size: int = OPENSEARCH_POOL_SIZE,
+                 timeout: tuple = (OPENSEARCH_CONNECT_TIMEOUT, OPENSEARCH_READ_TIMEOUT),
+                 max_retries: int = OPENSEARCH_MAX_RETRIES, retry_backoff: float = OPENSEARCH_RETRY_BACKOFF,
+                 compression: bool = OPENSEARCH_COMPRESSION, cache_max_bytes: int = CACHE_MAX_BYTES):
         self.opensearch_url = f"https://{OPENSEARCH_ENDPOINT}"
+        self.cache = TTLCache(max_bytes=cache_max_bytes)
         self.auth = HTTPBasicAuth(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD)
+        self.timeout = timeout
+        self.compression = compression
+        
+        # One keep-alive session shared by all request threads; urllib3's pool is thread-safe
+        # and the session itself is never mutated after construction
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset(['GET', 'POST']),  # _search bodies are read-only
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate" if compression else "identity"
+        })
+    
+    def _post(self, path: str, body: Dict[str, Any], params: Dict[str, str] = None) -> requests.Response:
+        """
+        POST a JSON body to OpenSearch over the pooled session
+        """
+        data, headers = encode_body(body, self.compression)
+        
+        return self.session.post(
+            f"{self.opensearch_url}/{path}",
+            data=data,
+            params=params,
+            headers=headers,
+            timeout=self.timeout
+        )
+    
+    def _search(self, body: Dict[str, Any], start_time: str = None, end_time: str = None,
+                prefix: str = None) -> requests.Response:
+        """
+        Run a _search against only the monthly indices covering the time range
+        """
+        return self._post(f"{resolve_indices(start_time, end_time, prefix)}/_search", body, params=SEARCH_PARAMS)
+    
+    def _run(self, body: Dict[str, Any], start_time: str, end_time: str, failure: str,
+             prefix: str = None, raw: bool = False) -> Any:
+        """
+        Run a search built by one of the *_query methods and return its JSON result,
+        left undecoded as RawJSON when raw is set
+        """
+        try:
+            response = self._search(body, start_time, end_time, prefix)
+            
+            if response.status_code == 200:
+                return RawJSON(response.content) if raw else json_loads(response.content)
+            else:
+                return {"error": f"{failure}: {response.text}"}
+                
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _cached(self, key: str, ttl: float, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        return self.cache.get_or_compute(key, ttl, compute, cacheable=is_cacheable)
+    
+    def build_query(self, query: str = None, start_time: str = None, end_time: str = None,
+                    log_level: str = None, source: str = None) -> Dict[str, Any]:
+        """
+        Build the bool query shared by searches, pagination and exports
+        """
+        bool_query = {
+            "must": [],
+            "filter": []
+        }
+        
+        # Add text search
+        if query:
+            bool_query["must"].append({
+                "multi_match": {
+                    "query": query,
+                    "fields": ["message", "parsed_fields.*"],
+                    "type": "best_fields"
+                }
+            })
+        
+        # Add time range filter
+        if start_time or end_time:
+            time_filter = {"range": {"timestamp": {}}}
+            if start_time:
+                time_filter["range"]["timestamp"]["gte"] = start_time
+            if end_time:
+                time_filter["range"]["timestamp"]["lte"] = end_time
+            bool_query["filter"].append(time_filter)
+        
+        # Add log level filter
+        if log_level:
+            bool_query["filter"].append({
+                "term": {"level.keyword": log_level}
+            })
+        
+        # Add source filter
+        if source:
+            bool_query["filter"].append({
+                "term": {"source.keyword": source}
+            })
+        
+        return {"bool": bool_query}
+    
+    def search_query(self, query: str = None, start_time: str = None, end_time: str = None,
+                     log_level: str = None, source: str = None, limit: int = 100,
+                     fields: List[str] = None) -> Dict[str, Any]:
+        """
+        Build the request body for a plain log search
+        """
+        es_query = {
+            "query": self.build_query(query, start_time, end_time, log_level, source),
+            "sort": [
+                {"timestamp": {"order": "desc"}}
+            ],
+            "size": limit
+        }
+        
+        # Only return the requested document fields
+        if fields:
+            es_query["_source"] = fields
+        
+        return es_query
     
     def search_logs(self, query: str, start_time: str = None, end_time: str = None, 
-                   log_level: str = None, source: str = None, limit: int = 100) -> Dict[str, Any]:
+                   log_level: str = None, source: str = None, limit: int = 100,
+                   fields: List[str] = None) -> Any:
         """
         Search logs with various filters
+
+        Results need no reshaping, so a successful search is returned (and cached) as the
+        RawJSON OpenSearch response; failures are {"error": ...} dicts.
+        """
+        es_query = self.search_query(query, start_time, end_time, log_level, source, limit, fields)
+        
+        # Execute search against the monthly indices covering the time range
+        return self._cached(
+            cache_key("search", query=query, start_time=start_time, end_time=end_time,
+                      log_level=log_level, source=source, limit=limit, fields=fields),
+            cache_ttl("search", end_time),
+            lambda: self._run(es_query, start_time, end_time, "Search failed", raw=True)
+        )
+    
+    def open_pit(self, start_time: str = None, end_time: str = None) -> str:
+        """
+        Open a point in time over the indices covering the time range (OpenSearch 2.4+)
+        """
+        response = self._post(
+            f"{resolve_indices(start_time, end_time)}/_search/point_in_time",
+            {},
+            params={"keep_alive": PIT_KEEP_ALIVE, "ignore_unavailable": "true", "allow_no_indices": "true"}
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Opening point in time failed: {response.text}")
+        return json_loads(response.content)["pit_id"]
+    
+    def close_pit(self, pit_id: str) -> None:
+        """
+        Release a point in time; failures only delay cleanup until keep_alive expires
+        """
+        try:
+            self.session.delete(
+                f"{self.opensearch_url}/_search/point_in_time",
+                data=json.dumps({"pit_id": [pit_id]}),
+                timeout=self.timeout
+            )
+        except requests.RequestException:
+            pass
+    
+    def search_page(self, query: str = None, start_time: str = None, end_time: str = None,
+                    log_level: str = None, source: str = None, limit: int = 100,
+                    fields: List[str] = None, cursor: str = None) -> Dict[str, Any]:
+        """
+        Fetch one page of a point-in-time search
+
+        Without a cursor a new point in time is opened for the given filters. The response
+        carries next_cursor, an opaque token holding the filters, the point in time and the
+        search_after position; it is None once the last page has been returned.
         """
         try:
-            # Build Elasticsearch query
+            if cursor:
+                state = decode_cursor(cursor)
+            else:
+                state = {
+                    "params": {
+                        "query": query,
+                        "start_time": start_time,
+                        "end_time": end_time,
+                        "log_level": log_level,
+                        "source": source
+                    },
+                    "limit": limit,
+                    "fields": fields,
+                    "pit_id": self.open_pit(start_time, end_time),
+                    "search_after": None
+                }
+            
             es_query = {
-                "query": {
-                    "bool": {
-                        "must": [],
-                        "filter": []
-                    }
-                },
-                "sort": [
-                    {"timestamp": {"order": "desc"}}
-                ],
-                "size": limit
+                "query": self.build_query(**state["params"]),
+                "sort": PIT_SORT,
+                "size": state["limit"],
+                "pit": {"id": state["pit_id"], "keep_alive": PIT_KEEP_ALIVE}
             }
+            if state["search_after"]:
+                es_query["search_after"] = state["search_after"]
+            if state["fields"]:
+                es_query["_source"] = state["fields"]
             
-            # Add text search
-            if query:
-                es_query["query"]["bool"]["must"].append({
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["message", "parsed_fields.*"],
-                        "type": "best_fields"
-                    }
-                })
+            # Point in time searches name their indices through the PIT, not the path
+            response = self._post("_search", es_query)
             
-            # Add time range filter
-            if start_time or end_time:
-                time_filter = {"range": {"timestamp": {}}}
-                if start_time:
-                    time_filter["range"]["timestamp"]["gte"] = start_time
-                if end_time:
-                    time_filter["range"]["timestamp"]["lte"] = end_time
-                es_query["query"]["bool"]["filter"].append(time_filter)
+            if response.status_code != 200:
+                return {"error": f"Search failed: {response.text}"}
             
-            # Add log level filter
-            if log_level:
-                es_query["query"]["bool"]["filter"].append({
-                    "term": {"level.keyword": log_level}
-                })
+            results = json_loads(response.content)
+            hits = results.get("hits", {}).get("hits", [])
+            # OpenSearch may hand back a refreshed PIT id with each page
+            state["pit_id"] = results.pop("pit_id", state["pit_id"])
             
-            # Add source filter
-            if source:
-                es_query["query"]["bool"]["filter"].append({
-                    "term": {"source.keyword": source}
-                })
+            if len(hits) < state["limit"]:
+                self.close_pit(state["pit_id"])
+                results["next_cursor"] = None
+            else:
+                state["search_after"] = hits[-1]["sort"]
+                results["next_cursor"] = encode_cursor(state)
             
-            # Execute search
-            index_name = "logs-*"  # Search across all monthly indices
-            response = requests.post(
-                f"{self.opensearch_url}/{index_name}/_search",
-                json=es_query,
-                auth=self.auth,
-                headers={"Content-Type": "application/json"}
-            )
+            return results
             
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"error": f"Search failed: {response.text}"}
-                
         except Exception as e:
             return {"error": str(e)}
     
-    def get_aggregations(self, field: str, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+    def export_logs(self, query: str = None, start_time: str = None, end_time: str = None,
+                    log_level: str = None, source: str = None, fields: List[str] = None,
+                    max_rows: int = None, page_size: int = None) -> Iterator[List[Dict[str, Any]]]:
         """
-        Get aggregations for analytics
+        Yield pages of matching documents' _source, walking a point in time with search_after
+
+        Only one page is held in memory at a time. The point in time is released when the
+        generator finishes or is closed early (e.g. the client disconnects).
         """
+        page_size = page_size or EXPORT_PAGE_SIZE
+        pit_id = self.open_pit(start_time, end_time)
         try:
-            es_query = {
-                "size": 0,
-                "aggs": {
-                    "field_values": {
-                        "terms": {
-                            "field": f"{field}.keyword",
-                            "size": 20
-                        }
-                    },
-                    "timeline": {
-                        "date_histogram": {
-                            "field": "timestamp",
-                            "calendar_interval": "1h"
+            search_after = None
+            remaining = max_rows
+            
+            while remaining is None or remaining > 0:
+                size = page_size if remaining is None else min(page_size, remaining)
+                es_query = {
+                    "query": self.build_query(query, start_time, end_time, log_level, source),
+                    "sort": PIT_SORT,
+                    "size": size,
+                    "pit": {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+                }
+                if search_after:
+                    es_query["search_after"] = search_after
+                if fields:
+                    es_query["_source"] = fields
+                
+                response = self._post("_search", es_query)
+                if response.status_code != 200:
+                    raise RuntimeError(f"Export failed: {response.text}")
+                
+                results = json_loads(response.content)
+                pit_id = results.get("pit_id", pit_id)
+                hits = results.get("hits", {}).get("hits", [])
+                
+                if hits:
+                    yield [hit.get("_source", {}) for hit in hits]
+                if len(hits) < size:
+                    return
+                
+                search_after = hits[-1]["sort"]
+                if remaining is not None:
+                    remaining -= len(hits)
+        finally:
+            self.close_pit(pit_id)
+    
+    def time_range_query(self, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+        return {
+            "bool": {
+                "filter": [{
+                    "range": {
+                        "timestamp": {
+                            "gte": start_time,
+                            "lte": end_time
                         }
                     }
+                }]
+            }
+        }
+    
+    def aggregations_query(self, field: str, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+        """
+        Build the request body for field value counts and the hourly timeline
+        """
+        es_query = {
+            "size": 0,
+            "aggs": {
+                "field_values": {
+                    "terms": {
+                        "field": f"{field}.keyword",
+                        "size": 20
+                    }
+                },
+                "timeline": {
+                    "date_histogram": {
+                        "field": "timestamp",
+                        "calendar_interval": "1h"
+                    }
                 }
             }
-            
-            # Add time range filter if provided
-            if start_time or end_time:
-                es_query["query"] = {
-                    "bool": {
-                        "filter": [{
-                            "range": {
-                                "timestamp": {
-                                    "gte": start_time,
-                                    "lte": end_time
-                                }
-                            }
-                        }]
+        }
+        
+        # Add time range filter if provided
+        if start_time or end_time:
+            es_query["query"] = self.time_range_query(start_time, end_time)
+        
+        return es_query
+    
+    def rollup_range_query(self, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+        """
+        Build a filter on the rollup "minute" field; the end bound is exclusive because
+        the minute starting at end_time lies outside the window
+        """
+        range_filter = {}
+        if start_time:
+            range_filter["gte"] = start_time
+        if end_time:
+            range_filter["lt"] = end_time
+        
+        return {"bool": {"filter": [{"range": {"minute": range_filter}}]}}
+    
+    def rollup_aggregations(self, fields: Dict[str, str], start_time: str = None,
+                            end_time: str = None) -> Dict[str, Any]:
+        """
+        Build terms aggregations (name -> field) plus the hourly timeline over rollup
+        documents, each summing the per-minute counts
+        """
+        count = {"count": {"sum": {"field": "count"}}}
+        aggs = {
+            name: {
+                "terms": {
+                    "field": f"{field}.keyword",
+                    "size": 20,
+                    "order": {"count": "desc"}
+                },
+                "aggs": count
+            }
+            for name, field in fields.items()
+        }
+        aggs["timeline"] = {
+            "date_histogram": {
+                "field": "minute",
+                "calendar_interval": "1h"
+            },
+            "aggs": count
+        }
+        
+        return {
+            "size": 0,
+            "query": self.rollup_range_query(start_time, end_time),
+            "aggs": aggs
+        }
+    
+    def aggregations_request(self, field: str, start_time: str = None,
+                             end_time: str = None) -> Tuple[Dict[str, Any], str]:
+        """
+        Return the aggregations request body and the index prefix it targets
+        """
+        if use_rollups(start_time, end_time, field):
+            return self.rollup_aggregations({"field_values": field}, start_time, end_time), ROLLUP_INDEX_PREFIX
+        
+        return self.aggregations_query(field, start_time, end_time), INDEX_PREFIX
+    
+    def get_aggregations(self, field: str, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+        """
+        Get aggregations for analytics
+        """
+        es_query, prefix = self.aggregations_request(field, start_time, end_time)
+        return self._cached(
+            cache_key("aggregations", field=field, start_time=start_time, end_time=end_time),
+            cache_ttl("aggregations", end_time),
+            lambda: rollup_doc_counts(self._run(es_query, start_time, end_time, "Aggregation failed", prefix))
+        )
+    
+    def stats_query(self, start_time: str, end_time: str) -> Dict[str, Any]:
+        """
+        Build the request body for level counts, source counts and the hourly timeline
+        """
+        return {
+            "size": 0,
+            "query": self.time_range_query(start_time, end_time),
+            "aggs": {
+                "levels": {
+                    "terms": {
+                        "field": "level.keyword",
+                        "size": 20
+                    }
+                },
+                "sources": {
+                    "terms": {
+                        "field": "source.keyword",
+                        "size": 20
+                    }
+                },
+                "timeline": {
+                    "date_histogram": {
+                        "field": "timestamp",
+                        "calendar_interval": "1h"
                     }
                 }
+            }
+        }
+    
+    def stats_request(self, start_time: str, end_time: str) -> Tuple[Dict[str, Any], str]:
+        """
+        Return the stats request body and the index prefix it targets
+        """
+        if use_rollups(start_time, end_time):
+            fields = {"levels": "level", "sources": "source"}
+            return self.rollup_aggregations(fields, start_time, end_time), ROLLUP_INDEX_PREFIX
+        
+        return self.stats_query(start_time, end_time), INDEX_PREFIX
+    
+    def get_stats(self, start_time: str, end_time: str) -> Dict[str, Any]:
+        """
+        Get level counts, source counts and the hourly timeline in one query
+        """
+        es_query, prefix = self.stats_request(start_time, end_time)
+        return rollup_doc_counts(self._run(es_query, start_time, end_time, "Stats query failed", prefix))
+
+class TTLCache:
+    """
+    In-process LRU cache with per-entry TTLs and a memory cap, where concurrent misses
+    for one key share a single computation
+    """
+    def __init__(self, max_bytes: int = None, sizeof: Callable[[Any], int] = None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or json_size
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.total_bytes -= size
+    
+    def _live(self, key: str) -> Any:
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._remove(key)
+        return None
+    
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """
+        Return (True, value) for a live entry and mark it recently used, else (False, None)
+        """
+        with self._lock:
+            entry = self._live(key)
+        return (True, entry[1]) if entry is not None else (False, None)
+    
+    def put(self, key: str, ttl: float, value: Any) -> None:
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, size)
+            self.total_bytes += size
             
-            response = requests.post(
-                f"{self.opensearch_url}/logs-*/_search",
-                json=es_query,
-                auth=self.auth,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"error": f"Aggregation failed: {response.text}"}
+            # Evict least recently used entries until back under the cap
+            while self.max_bytes and self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Any],
+                       cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        while True:
+            with self._lock:
+                entry = self._live(key)
+                if entry is not None:
+                    return entry[1]
                 
-        except Exception as e:
-            return {"error": str(e)}
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = self._inflight[key] = threading.Event()
+                    self.misses += 1
+            
+            if not leader:
+                # Wait for the leader, then re-check; if its result was not cacheable we take over
+                event.wait()
+                continue
+            
+            try:
+                value = compute()
+                if cacheable(value):
+                    self.put(key, ttl, value)
+                return value
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                event.set()
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def snap_time_range(start_time: str = None, end_time: str = None,
+                    bucket_seconds: int = None) -> Tuple[str, str]:
+    """
+    Widen a time range outwards to whole buckets so near-identical ranges share a cache key
+    """
+    bucket_seconds = bucket_seconds or CACHE_TIME_BUCKET
+    
+    def snap(value: str, round_up: bool) -> str:
+        if not value:
+            return value
+        try:
+            parsed = parse_timestamp(value)
+        except ValueError:
+            return value
+        epoch = int((parsed - datetime(1970, 1, 1)).total_seconds())
+        snapped = epoch - epoch % bucket_seconds
+        if round_up and snapped < (parsed - datetime(1970, 1, 1)).total_seconds():
+            snapped += bucket_seconds
+        return datetime.utcfromtimestamp(snapped).isoformat()
+    
+    return snap(start_time, False), snap(end_time, True)
+
+def cache_ttl(endpoint: str, end_time: str = None) -> float:
+    """
+    TTL for a cached result: windows ending well in the past no longer change
+    """
+    if end_time:
+        try:
+            if parse_timestamp(end_time) <= datetime.utcnow() - timedelta(seconds=CACHE_TIME_BUCKET):
+                return CACHE_PAST_TTL
+        except ValueError:
+            pass
+    return CACHE_TTLS.get(endpoint, CACHE_TTLS["search"])
+
+def normalize_timestamp(value: str) -> str:
+    """
+    Canonical spelling of an ISO 8601 timestamp (naive UTC); unparseable values are kept
+    """
+    try:
+        return parse_timestamp(value).isoformat()
+    except ValueError:
+        return value
+
+def cache_key(endpoint: str, **params: Any) -> str:
+    """
+    Canonical cache key: parameters in sorted order, empty filters dropped and time bounds
+    normalized, so "Z" and "+00:00" spellings of one instant share an entry
+    """
+    params = {name: value for name, value in params.items() if value not in (None, '', [])}
+    for name in ("start_time", "end_time"):
+        if name in params:
+            params[name] = normalize_timestamp(params[name])
+    return f"{endpoint}:{json.dumps(params, sort_keys=True, separators=(',', ':'))}"
 
 # Initialize search API
 search_api = LogSearchAPI()
 
+def json_response(results: Any) -> Response:
+    """
+    Serve results through the fast codec, passing RawJSON bodies through untouched
+    """
+    return Response(encode_result(results), mimetype='application/json')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
 
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Query result cache metrics"""
+    return jsonify(search_api.cache.metrics())
+
 @app.route('/api/search', methods=['GET'])
 def search_logs():
     """
@@ -160,7 +856,10 @@ def search_logs():
     - end_time: end time (ISO format)
     - level: log level filter
     - source: source filter
-    - limit: maximum number of results
+    - limit: maximum number of results (page size when paginating)
+    - fields: comma-separated document fields to return (e.g. timestamp,level,message)
+    - paginate: start a cursor-paginated search; the response carries next_cursor
+    - cursor: next_cursor from the previous page (all other parameters are ignored)
     """
     try:
         query = request.args.get('q', '')
@@ -169,17 +868,81 @@ def search_logs():
         log_level = request.args.get('level')
         source = request.args.get('source')
         limit = int(request.args.get('limit', 100))
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+        cursor = request.args.get('cursor')
         
-        results = search_api.search_logs(
-            query=query,
-            start_time=start_time,
-            end_time=end_time,
-            log_level=log_level,
-            source=source,
-            limit=limit
+        if cursor or request.args.get('paginate', '').lower() in ('1', 'true'):
+            results = search_api.search_page(
+                query=query,
+                start_time=start_time,
+                end_time=end_time,
+                log_level=log_level,
+                source=source,
+                limit=limit,
+                fields=fields,
+                cursor=cursor
+            )
+        else:
+            results = search_api.search_logs(
+                query=query,
+                start_time=start_time,
+                end_time=end_time,
+                log_level=log_level,
+                source=source,
+                limit=limit,
+                fields=fields
+            )
+        
+        return json_response(results)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_logs():
+    """
+    Stream matching logs as NDJSON, one document per line
+    Query parameters:
+    - q, start_time, end_time, level, source, fields: as for /api/search
+    - limit: maximum number of documents to export (default: all)
+    The body is gzip-encoded when the client sends Accept-Encoding: gzip. Failures opening
+    the point in time or fetching the first page return a 500; errors after streaming has
+    started are reported as a final {"error": ...} line.
+    """
+    try:
+        limit = request.args.get('limit')
+        pages = search_api.export_logs(
+            query=request.args.get('q', ''),
+            start_time=request.args.get('start_time'),
+            end_time=request.args.get('end_time'),
+            log_level=request.args.get('level'),
+            source=request.args.get('source'),
+            fields=[f for f in request.args.get('fields', '').split(',') if f] or None,
+            max_rows=int(limit) if limit else None
         )
+        # Fetch the first page before the response starts, so setup failures get a real status
+        first = next(pages, None)
+        use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '').lower()
         
-        return jsonify(results)
+        def generate():
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+            try:
+                for page in itertools.chain([first] if first is not None else [], pages):
+                    chunk = b''.join(json_dumps(doc) + b'\n' for doc in page)
+                    if compressor is not None:
+                        # Sync flush so each page reaches the client as soon as it is fetched
+                        chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                    yield chunk
+            except Exception as e:
+                chunk = json_dumps({"error": str(e)}) + b'\n'
+                yield compressor.compress(chunk) if compressor is not None else chunk
+            finally:
+                pages.close()
+            if compressor is not None:
+                yield compressor.flush()
+        
+        headers = {"Content-Encoding": "gzip"} if use_gzip else {}
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson', headers=headers)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -199,7 +962,7 @@ def get_aggregations(field):
             end_time=end_time
         )
         
-        return jsonify(results)
+        return json_response(results)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -210,56 +973,271 @@ def get_stats():
     Get overall log statistics
     """
     try:
-        # Get stats for the last 24 hours
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(hours=24)
-        
-        stats = {
-            "total_logs": 0,
-            "error_logs": 0,
-            "warning_logs": 0,
-            "sources": [],
-            "timeline": []
-        }
-        
-        # Get level aggregations
-        level_aggs = search_api.get_aggregations(
-            field="level",
-            start_time=start_time.isoformat(),
-            end_time=end_time.isoformat()
+        stats = search_api.cache.get_or_compute(
+            "stats", STATS_CACHE_TTL, compute_stats,
+            cacheable=lambda result: "error" not in result
         )
         
-        if "aggregations" in level_aggs:
-            for bucket in level_aggs["aggregations"]["field_values"]["buckets"]:
-                if bucket["key"] == "ERROR":
-                    stats["error_logs"] = bucket["doc_count"]
-                elif bucket["key"] == "WARNING":
-                    stats["warning_logs"] = bucket["doc_count"]
-                stats["total_logs"] += bucket["doc_count"]
+        return json_response(stats)
         
-        # Get source aggregations
-        source_aggs = search_api.get_aggregations(
-            field="source",
-            start_time=start_time.isoformat(),
-            end_time=end_time.isoformat()
-        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def stats_window() -> Tuple[str, str]:
+    """
+    Return the (start_time, end_time) of the last 24 hours, snapped to whole minutes so
+    the stats can be served from rollups
+    """
+    end_time = datetime.utcnow()
+    start_time = end_time - timedelta(hours=24)
+    return snap_time_range(start_time.isoformat(), end_time.isoformat(), bucket_seconds=60)
+
+def shape_stats(results: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Turn a stats query result into the /api/stats payload
+    """
+    stats = {
+        "total_logs": 0,
+        "error_logs": 0,
+        "warning_logs": 0,
+        "sources": [],
+        "timeline": []
+    }
+    
+    if "error" in results:
+        # Serve empty stats as before, but keep the failure out of the cache
+        stats["error"] = results["error"]
+        return stats
+    
+    aggregations = results.get("aggregations", {})
+    
+    for bucket in aggregations.get("levels", {}).get("buckets", []):
+        if bucket["key"] == "ERROR":
+            stats["error_logs"] = bucket["doc_count"]
+        elif bucket["key"] == "WARNING":
+            stats["warning_logs"] = bucket["doc_count"]
+        stats["total_logs"] += bucket["doc_count"]
+    
+    stats["sources"] = [
+        {"name": bucket["key"], "count": bucket["doc_count"]}
+        for bucket in aggregations.get("sources", {}).get("buckets", [])
+    ]
+    
+    stats["timeline"] = [
+        {"time": bucket["key_as_string"], "count": bucket["doc_count"]}
+        for bucket in aggregations.get("timeline", {}).get("buckets", [])
+    ]
+    
+    return stats
+
+def compute_stats() -> Dict[str, Any]:
+    """
+    Build the 24 hour statistics payload from a single aggregation query
+    """
+    start_time, end_time = stats_window()
+    return shape_stats(search_api.get_stats(start_time=start_time, end_time=end_time))
+
+class AsyncTTLCache:
+    """
+    asyncio counterpart of TTLCache: concurrent misses for one key await a single task.
+    Entries are kept in a TTLCache, so its LRU memory cap applies
+    """
+    def __init__(self, entries: TTLCache = None):
+        self.entries = entries if entries is not None else TTLCache()
+        self._inflight = {}
+    
+    async def get_or_compute(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]],
+                             cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        found, value = self.entries.lookup(key)
+        if found:
+            return value
         
-        if "aggregations" in source_aggs:
-            stats["sources"] = [
-                {"name": bucket["key"], "count": bucket["doc_count"]}
-                for bucket in source_aggs["aggregations"]["field_values"]["buckets"]
-            ]
+        task = self._inflight.get(key)
+        if task is None:
+            self.entries.misses += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._fill(key, ttl, compute, cacheable))
+        # Shield so one cancelled request does not cancel the computation others are awaiting
+        return await asyncio.shield(task)
+    
+    async def _fill(self, key: str, ttl: float, compute: Callable[[], Awaitable[Any]],
+                    cacheable: Callable[[Any], bool]) -> Any:
+        try:
+            value = await compute()
+            if cacheable(value):
+                self.entries.put(key, ttl, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+class AsyncLogSearchAPI:
+    """
+    Async transport for the queries built by LogSearchAPI
+
+    Requests share one httpx connection pool, so a single process can keep hundreds of
+    OpenSearch requests in flight without tying up a worker thread per request.
+    """
+    def __init__(self, queries: LogSearchAPI, pool_size: int = OPENSEARCH_ASYNC_POOL_SIZE,
+                 transport: Any = None):
+        self.queries = queries
+        self.pool_size = pool_size
+        self.transport = transport
+        self.client = None
+        # Search and aggregation results share the capped query cache with the sync API
+        self.cache = AsyncTTLCache(queries.cache)
+        self.stats_cache = AsyncTTLCache()
+    
+    async def start(self) -> None:
+        # Created inside the running loop, on application startup
+        connect_timeout, read_timeout = self.queries.timeout
+        self.client = httpx.AsyncClient(
+            base_url=self.queries.opensearch_url,
+            auth=(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD or ''),
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=self.transport or httpx.AsyncHTTPTransport(retries=OPENSEARCH_MAX_RETRIES),
+            headers={
+                "Content-Type": "application/json",
+                "Accept-Encoding": "gzip, deflate" if self.queries.compression else "identity"
+            }
+        )
+    
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+    
+    async def _run(self, body: Dict[str, Any], start_time: str, end_time: str, failure: str,
+                   prefix: str = None, raw: bool = False) -> Any:
+        try:
+            data, headers = encode_body(body, self.queries.compression)
+            response = await self.client.post(
+                f"/{resolve_indices(start_time, end_time, prefix)}/_search",
+                content=data,
+                params=SEARCH_PARAMS,
+                headers=headers
+            )
             
-            # Timeline data
-            stats["timeline"] = [
-                {"time": bucket["key_as_string"], "count": bucket["doc_count"]}
-                for bucket in source_aggs["aggregations"]["timeline"]["buckets"]
-            ]
+            if response.status_code == 200:
+                return RawJSON(response.content) if raw else json_loads(response.content)
+            else:
+                return {"error": f"{failure}: {response.text}"}
+                
+        except Exception as e:
+            return {"error": str(e)}
+    
+    async def search_logs(self, query: str, start_time: str = None, end_time: str = None,
+                          log_level: str = None, source: str = None, limit: int = 100,
+                          fields: List[str] = None) -> Any:
+        es_query = self.queries.search_query(query, start_time, end_time, log_level, source, limit, fields)
+        return await self.cache.get_or_compute(
+            cache_key("search", query=query, start_time=start_time, end_time=end_time,
+                      log_level=log_level, source=source, limit=limit, fields=fields),
+            cache_ttl("search", end_time),
+            lambda: self._run(es_query, start_time, end_time, "Search failed", raw=True),
+            cacheable=is_cacheable
+        )
+    
+    async def get_aggregations(self, field: str, start_time: str = None, end_time: str = None) -> Dict[str, Any]:
+        es_query, prefix = self.queries.aggregations_request(field, start_time, end_time)
         
-        return jsonify(stats)
+        async def compute():
+            return rollup_doc_counts(await self._run(es_query, start_time, end_time, "Aggregation failed", prefix))
         
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return await self.cache.get_or_compute(
+            cache_key("aggregations", field=field, start_time=start_time, end_time=end_time),
+            cache_ttl("aggregations", end_time),
+            compute,
+            cacheable=is_cacheable
+        )
+    
+    async def get_stats(self, start_time: str, end_time: str) -> Dict[str, Any]:
+        es_query, prefix = self.queries.stats_request(start_time, end_time)
+        return rollup_doc_counts(await self._run(es_query, start_time, end_time, "Stats query failed", prefix))
+    
+    async def compute_stats(self) -> Dict[str, Any]:
+        start_time, end_time = stats_window()
+        return shape_stats(await self.get_stats(start_time=start_time, end_time=end_time))
+
+def create_asgi_app(transport: Any = None):
+    """
+    Build the async (ASGI) app serving /health, /api/search, /api/aggregations/<field>
+    and /api/stats; cursor pagination and /api/export stay on the Flask app
+
+    Run with: uvicorn --factory search_api:create_asgi_app
+    """
+    from starlette.applications import Starlette
+    from starlette.middleware import Middleware
+    from starlette.middleware.cors import CORSMiddleware
+    from starlette.responses import JSONResponse, Response as StarletteResponse
+    from starlette.routing import Route
+    
+    async_api = AsyncLogSearchAPI(search_api, transport=transport)
+    
+    def json_result(results):
+        return StarletteResponse(encode_result(results), media_type='application/json')
+    
+    async def health_check(request):
+        return JSONResponse({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
+    
+    async def search_logs(request):
+        try:
+            args = request.query_params
+            results = await async_api.search_logs(
+                query=args.get('q', ''),
+                start_time=args.get('start_time'),
+                end_time=args.get('end_time'),
+                log_level=args.get('level'),
+                source=args.get('source'),
+                limit=int(args.get('limit', 100)),
+                fields=[f for f in args.get('fields', '').split(',') if f] or None
+            )
+            return json_result(results)
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+    
+    async def get_aggregations(request):
+        try:
+            results = await async_api.get_aggregations(
+                field=request.path_params['field'],
+                start_time=request.query_params.get('start_time'),
+                end_time=request.query_params.get('end_time')
+            )
+            return json_result(results)
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+    
+    async def get_stats(request):
+        try:
+            stats = await async_api.stats_cache.get_or_compute(
+                "stats", STATS_CACHE_TTL, async_api.compute_stats,
+                cacheable=lambda result: "error" not in result
+            )
+            return json_result(stats)
+        except Exception as e:
+            return JSONResponse({"error": str(e)}, status_code=500)
+    
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await async_api.start()
+        try:
+            yield
+        finally:
+            await async_api.close()
+    
+    return Starlette(
+        routes=[
+            Route('/health', health_check, methods=['GET']),
+            Route('/api/search', search_logs, methods=['GET']),
+            Route('/api/aggregations/{field}', get_aggregations, methods=['GET']),
+            Route('/api/stats', get_stats, methods=['GET'])
+        ],
+        middleware=[Middleware(CORSMiddleware, allow_origins=['*'])],
+        lifespan=lifespan
+    )
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    if API_SERVER_MODE == 'asgi':
+        import uvicorn
+        uvicorn.run(create_asgi_app(), host='0.0.0.0', port=5000)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -1,14 +1,49 @@
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+import time
 from datetime import datetime, timedelta
 
 app = Flask(__name__)
 
 API_URL = "http://api:5000/search"  # Assuming the API service is running on this URL
 API_BASE_URL = "http://localhost:5000/api"
+API_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+
+# Seconds an API response is reused, across reruns and across browser sessions
+STATS_CACHE_TTL = 30
+SEARCH_CACHE_TTL = 30
+SEARCH_CACHE_ENTRIES = 256
+
+# Seconds between auto-refreshes; each one only fetches logs newer than those on screen
+REFRESH_INTERVAL = 30
+# Reruns from widget interactions fetch new logs at most this often
+MIN_FETCH_INTERVAL = 5
+# Full searches use windows snapped to this many seconds so open tabs share cache entries
+WINDOW_SNAP_SECONDS = 60
+# Row limits offered for the log table, and the rows shown per table page
+LOG_LIMITS = [500, 2000, 5000]
+PAGE_SIZE = 1000
+TABLE_HEIGHT = 600
+
+# Document fields the log table shows; only these are requested from the API
+LOG_COLUMNS = ['timestamp', 'level', 'source', 'service', 'host', 'message']
+
+LEVEL_STYLES = {
+    'ERROR': 'background-color: #ffebee',
+    'WARNING': 'background-color: #fff3e0'
+}
+DEFAULT_LEVEL_STYLE = 'background-color: #e8f5e8'
+
+TIME_RANGES = {
+    "Last 1 Hour": timedelta(hours=1),
+    "Last 24 Hours": timedelta(hours=24),
+    "Last 7 Days": timedelta(days=7)
+}
 
 # Configure Streamlit
 st.set_page_config(
@@ -32,57 +67,129 @@ st.markdown("""
         border-radius: 10px; 
         margin: 0.5rem; 
     } 
-    .error-log { 
-        background-color: #ffebee; 
-        border-left: 4px solid #f44336; 
-        padding: 10px; 
-        margin: 5px 0; 
-    } 
-    .warning-log { 
-        background-color: #fff3e0; 
-        border-left: 4px solid #ff9800; 
-        padding: 10px; 
-        margin: 5px 0; 
-    } 
-    .info-log { 
-        background-color: #e8f5e8; 
-        border-left: 4px solid #4caf50; 
-        padding: 10px; 
-        margin: 5px 0; 
-    } 
 </style> 
 """, unsafe_allow_html=True)
 
-def fetch_data(endpoint: str, params: dict = None) -> dict:
-    """Fetch data from API"""
+class APIError(Exception):
+    """The API answered with a non-200 status"""
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """Keep-alive session shared by every browser session of this server"""
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def request_json(endpoint: str, params: dict = None) -> dict:
+    """GET an API endpoint over the pooled session"""
+    response = get_session().get(f"{API_BASE_URL}/{endpoint}", params=params, timeout=API_TIMEOUT)
+    if response.status_code != 200:
+        raise APIError(f"API Error: {response.status_code}")
+    return response.json()
+
+# Failed requests raise, and Streamlit does not cache exceptions, so errors are retried
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def cached_stats() -> dict:
+    return request_json("stats")
+
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_ENTRIES, show_spinner=False)
+def cached_search(params: dict) -> dict:
+    return request_json("search", params)
+
+def fetch_data(endpoint: str, params: dict = None, cache: bool = True) -> dict:
+    """Fetch data from API, through the response cache unless cache is False"""
     try:
-        response = requests.get(f"{API_BASE_URL}/{endpoint}", params=params)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error(f"API Error: {response.status_code}")
-            return {}
+        if cache and endpoint == "stats":
+            return cached_stats()
+        if cache and endpoint == "search":
+            return cached_search(params)
+        return request_json(endpoint, params)
+    except APIError as e:
+        st.error(str(e))
+        return {}
     except Exception as e:
         st.error(f"Connection Error: {str(e)}")
         return {}
 
-def format_log_entry(log: dict) -> str:
-    """Format log entry for display"""
-    timestamp = log.get('_source', {}).get('timestamp', '')
-    level = log.get('_source', {}).get('level', 'INFO')
-    message = log.get('_source', {}).get('message', '')
-    source = log.get('_source', {}).get('source', '')
-    
-    return f"**{timestamp}** [{level}] {source}: {message}"
+def snap_datetime(value: datetime, seconds: int, round_up: bool = False) -> datetime:
+    """Round a datetime down (or up) to a whole number of seconds since midnight"""
+    midnight = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = (value - midnight).total_seconds()
+    snapped = offset - offset % seconds
+    if round_up and snapped < offset:
+        snapped += seconds
+    return midnight + timedelta(seconds=snapped)
+
+def time_window(time_range: str, custom_range: tuple = None) -> tuple:
+    """(start, end) naive UTC datetimes of the selected range; relative ranges end now
+
+    Log timestamps are stored in UTC, and load_logs compares them with these bounds.
+    """
+    if custom_range is not None:
+        return custom_range
+    end_datetime = datetime.utcnow()
+    return end_datetime - TIME_RANGES[time_range], end_datetime
+
+def hit_timestamp(hit: dict) -> str:
+    return hit.get('_source', {}).get('timestamp', '')
+
+def load_logs(filters: dict, time_range: str, custom_range: tuple = None,
+              limit: int = LOG_LIMITS[0]) -> pd.DataFrame:
+    """Return the newest logs for the filters, fetching only what is new since the last call
+
+    The first call for a set of filters runs a full search over a snapped window, which is
+    served from the shared cache when another tab asked recently. For relative ranges later
+    calls only ask for logs at or after the newest timestamp already held, merge them in by
+    _id and drop logs that have aged out of the window. Custom ranges are fixed, so they are
+    searched once. The table is rebuilt only when a fetch changes the logs.
+    """
+    key = (tuple(sorted(filters.items())), time_range, custom_range, limit)
+    view = st.session_state.get("log_view")
+    start_datetime, end_datetime = time_window(time_range, custom_range)
+
+    if view is None or view["key"] != key:
+        params = dict(filters, limit=limit, fields=','.join(LOG_COLUMNS),
+                      start_time=snap_datetime(start_datetime, WINDOW_SNAP_SECONDS).isoformat(),
+                      end_time=snap_datetime(end_datetime, WINDOW_SNAP_SECONDS, round_up=True).isoformat())
+        hits = fetch_data("search", params).get('hits', {}).get('hits', [])
+        frame = build_log_frame(hits)
+        st.session_state["log_view"] = {"key": key, "hits": hits, "frame": frame, "fetched": time.monotonic()}
+        return frame
+
+    hits = view["hits"]
+    if custom_range is not None or time.monotonic() - view["fetched"] < MIN_FETCH_INTERVAL:
+        return view["frame"]
+    view["fetched"] = time.monotonic()
+
+    params = dict(filters, limit=limit, fields=','.join(LOG_COLUMNS),
+                  start_time=hit_timestamp(hits[0]) if hits else start_datetime.isoformat(),
+                  end_time=end_datetime.isoformat())
+    new_hits = fetch_data("search", params, cache=False).get('hits', {}).get('hits', [])
+    if new_hits:
+        seen = {hit.get('_id') for hit in hits}
+        new_hits = [hit for hit in new_hits if hit.get('_id') is None or hit.get('_id') not in seen]
+
+    # Both lists are newest first, so the merged list is too
+    cutoff = start_datetime.isoformat()
+    merged = [hit for hit in (new_hits + hits)[:limit] if hit_timestamp(hit) >= cutoff]
+    if len(merged) != len(hits) or new_hits:
+        view["hits"] = merged
+        view["frame"] = build_log_frame(merged)
+    return view["frame"]
+
+def build_log_frame(hits: list) -> pd.DataFrame:
+    """Columnar table of the hits' documents, newest first"""
+    frame = pd.DataFrame.from_records([hit.get('_source', {}) for hit in hits], columns=LOG_COLUMNS)
+    frame['level'] = frame['level'].fillna('INFO')
+    return frame
 
-def get_log_style_class(level: str) -> str:
-    """Get CSS class for log level"""
-    if level == 'ERROR':
-        return 'error-log'
-    elif level == 'WARNING':
-        return 'warning-log'
-    else:
-        return 'info-log'
+def level_styles(frame: pd.DataFrame) -> pd.DataFrame:
+    """Cell styles for a page of logs: every cell in a row gets its level's background"""
+    row_styles = frame['level'].map(LEVEL_STYLES).fillna(DEFAULT_LEVEL_STYLE)
+    return pd.DataFrame({column: row_styles for column in frame.columns}, index=frame.index)
 
 # Main Dashboard
 def main():
@@ -95,25 +202,17 @@ def main():
         # Time range selector
         time_range = st.selectbox(
             "Time Range",
-            ["Last 1 Hour", "Last 24 Hours", "Last 7 Days", "Custom"]
+            list(TIME_RANGES) + ["Custom"]
         )
         
+        custom_range = None
         if time_range == "Custom":
             start_date = st.date_input("Start Date")
-            start_time = st.time_input("Start Time")
+            start_time = st.time_input("Start Time (UTC)")
             end_date = st.date_input("End Date")
-            end_time = st.time_input("End Time")
+            end_time = st.time_input("End Time (UTC)")
             
-            start_datetime = datetime.combine(start_date, start_time)
-            end_datetime = datetime.combine(end_date, end_time)
-        else:
-            end_datetime = datetime.now()
-            if time_range == "Last 1 Hour":
-                start_datetime = end_datetime - timedelta(hours=1)
-            elif time_range == "Last 24 Hours":
-                start_datetime = end_datetime - timedelta(hours=24)
-            elif time_range == "Last 7 Days":
-                start_datetime = end_datetime - timedelta(days=7)
+            custom_range = (datetime.combine(start_date, start_time), datetime.combine(end_date, end_time))
         
         # Other filters
         log_level = st.selectbox(
@@ -126,11 +225,38 @@ def main():
         
         # Apply filters button
         apply_filters = st.button("🔄 Apply Filters")
+        
+        log_limit = st.selectbox("Max Logs", LOG_LIMITS)
+        
+        auto_refresh = st.checkbox("🔄 Auto-refresh (30 seconds)")
+    
+    # Build search filters
+    filters = {}
+    
+    if search_query:
+        filters['q'] = search_query
+    
+    if log_level != "All":
+        filters['level'] = log_level
+    
+    if source_filter:
+        filters['source'] = source_filter
+    
+    if apply_filters:
+        # Start the log list over from a full search
+        st.session_state.pop("log_view", None)
     
+    # Fragments rerun on their own timer without rerunning the rest of the page
+    run_every = REFRESH_INTERVAL if auto_refresh else None
+    st.fragment(render_stats, run_every=run_every)()
+    st.fragment(render_recent_logs, run_every=run_every)(filters, time_range, custom_range, log_limit)
+
+def render_stats():
+    """Metric cards and charts from /api/stats"""
     # Main content area
     col1, col2, col3, col4 = st.columns(4)
     
-    # Fetch statistics
+    # Fetch statistics (cached for STATS_CACHE_TTL seconds)
     stats = fetch_data("stats")
     
     with col1:
@@ -214,45 +340,42 @@ def main():
         }
     )
     st.plotly_chart(fig, use_container_width=True)
-    
+
+def render_recent_logs(filters: dict, time_range: str, custom_range: tuple = None,
+                       limit: int = LOG_LIMITS[0]):
+    """Newest logs for the filters, topped up incrementally on each refresh"""
     # Recent Logs Section
     st.header("📋 Recent Logs")
     
-    # Build search parameters
-    search_params = {
-        'start_time': start_datetime.isoformat(),
-        'end_time': end_datetime.isoformat(),
-        'limit': 50
-    }
-    
-    if search_query:
-        search_params['q'] = search_query
-    
-    if log_level != "All":
-        search_params['level'] = log_level
-    
-    if source_filter:
-        search_params['source'] = source_filter
-    
     # Fetch logs
-    logs_data = fetch_data("search", search_params)
+    logs = load_logs(filters, time_range, custom_range, limit)
     
-    if 'hits' in logs_data and logs_data['hits']['hits']:
-        logs = logs_data['hits']['hits']
-        
-        # Display logs with styling
-        for log in logs:
-            log_level = log.get('_source', {}).get('level', 'INFO')
-            log_class = get_log_style_class(log_level)
-            formatted_log = format_log_entry(log)
-            
-            st.markdown(f'<div class="{log_class}">{formatted_log}</div>', unsafe_allow_html=True)
-    else:
+    if logs.empty:
         st.info("No logs found for the selected filters")
+        return
     
-    # Auto-refresh option
-    if st.checkbox("🔄 Auto-refresh (30 seconds)"):
-        st.experimental_rerun()
+    # Page through the table; st.dataframe only draws the rows scrolled into view
+    pages = -(-len(logs) // PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1)
+    rows = logs.iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    st.caption(f"Showing logs {rows.index[0] + 1:,}-{rows.index[-1] + 1:,} of {len(logs):,}")
+    
+    st.dataframe(
+        rows.style.apply(level_styles, axis=None),
+        use_container_width=True,
+        hide_index=True,
+        height=TABLE_HEIGHT,
+        column_config={
+            'timestamp': st.column_config.TextColumn("Timestamp"),
+            'level': st.column_config.TextColumn("Level", width="small"),
+            'source': st.column_config.TextColumn("Source"),
+            'service': st.column_config.TextColumn("Service"),
+            'host': st.column_config.TextColumn("Host"),
+            'message': st.column_config.TextColumn("Message", width="large")
+        }
+    )
 
 if __name__ == "__main__":
     main()
@@ -2,156 +2,699 @@ import json
 import boto3
 import base64
 import gzip
+import hashlib
+import math
 import re
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Iterator, Optional, Tuple
 import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase, HTTPBasicAuth
+from botocore.auth import SigV4Auth
+from botocore.config import Config
+from botocore.awsrequest import AWSRequest
 
-# Initialize AWS clients
-opensearch_client = boto3.client('opensearchserverless')
-s3_client = boto3.client('s3')
+try:
+    import orjson
+except ImportError:  # Optional speedup; the standard library codec is used without it
+    orjson = None
 
-# Environment variables
-OPENSEARCH_ENDPOINT = os.environ['OPENSEARCH_ENDPOINT']
-S3_BUCKET = os.environ['S3_BUCKET']
-INDEX_NAME = os.environ['INDEX_NAME']
+# Environment variables; checked when the sinks are first used, so the module imports
+# without any configuration (e.g. for scripts/benchmark_lambda.py)
+OPENSEARCH_ENDPOINT = os.environ.get('OPENSEARCH_ENDPOINT')
+S3_BUCKET = os.environ.get('S3_BUCKET')
+INDEX_NAME = os.environ.get('INDEX_NAME', 'logs')
+OPENSEARCH_USERNAME = os.environ.get('OPENSEARCH_USERNAME')
+OPENSEARCH_PASSWORD = os.environ.get('OPENSEARCH_PASSWORD')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', 5 * 1024 * 1024))
+BULK_MAX_RETRIES = int(os.environ.get('BULK_MAX_RETRIES', 3))
+
+PIPELINE_CONCURRENCY = int(os.environ.get('PIPELINE_CONCURRENCY', 8))
+INDEX_FLUSH_RECORDS = int(os.environ.get('INDEX_FLUSH_RECORDS', 250))
+
+# Per-minute rollups kept alongside the raw indices; the name must not match f"{INDEX_NAME}-*"
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', 'true').lower() == 'true'
+ROLLUP_INDEX_NAME = os.environ.get('ROLLUP_INDEX_NAME', f"rollup-{INDEX_NAME}")
+# One batch summary document per invocation: counts and latency/size quantile sketches
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_INDEX_NAME = os.environ.get('METRICS_INDEX_NAME', f"metrics-{INDEX_NAME}")
+# Paths beyond this many groups per batch are folded into one overflow group
+METRICS_MAX_GROUPS = int(os.environ.get('METRICS_MAX_GROUPS', 200))
+# Optional unstructured formats to register at startup (comma-separated, e.g. "syslog,logfmt")
+EXTRA_LOG_FORMATS = os.environ.get('EXTRA_LOG_FORMATS', '')
+
+# Per-record failure classes: decode/parse/rejected are permanent, index/archive are retried
+FAILURE_STAGES = ('decode', 'parse', 'rejected', 'index', 'archive')
+
+def json_loads(data: Any) -> Any:
+    """
+    Decode JSON from bytes (or str) without an intermediate UTF-8 decode
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # Inputs orjson is stricter about (NaN, non-UTF-8 encodings, huge integers)
+            # get the standard library's verdict
+            pass
+    return json.loads(data)
+
+def json_dumps(value: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # e.g. integers beyond 64 bits or lone surrogates
+            pass
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Main Lambda handler for processing Kinesis log events
+
+    Records that fail to index or archive are reported through batchItemFailures
+    (ReportBatchItemFailures) so Kinesis retries from the first failed sequence number.
+    Records that cannot be decoded or parsed would fail again on retry, so they are
+    logged and dropped instead of blocking the shard.
     """
+    records = event.get('Records', [])
+    failures = {stage: [] for stage in FAILURE_STAGES}
+    redactor.reset_hits()
+
     try:
+        stage_executor, io_executor = get_executors()
+        indexer = get_bulk_indexer()
+        now = datetime.utcnow()
+        
         processed_records = []
+        archive_records = []
+        document_ids = []
+        sequence_numbers = []
+        index_jobs = []
+        flushed = 0
         
-        for record in event['Records']:
-            # Decode Kinesis data
-            payload = base64.b64decode(record['kinesis']['data'])
+        # Decode/parse runs here while earlier slices are already being indexed
+        for record, entry_index, processed_log in decode_records(records, failures, now):
+            document_id = record.get('eventID') or record['kinesis']['sequenceNumber']
+            if entry_index:
+                document_id = f"{document_id}:{entry_index}"
             
-            # Handle gzipped logs
-            if payload.startswith(b'\x1f\x8b'):
-                payload = gzip.decompress(payload)
+            # Serialize once here; the indexer and the archiver share the encoded document
+            processed_log.to_json()
+            processed_records.append(processed_log)
+            archive_records.append((record, processed_log))
+            document_ids.append(document_id)
+            sequence_numbers.append(record['kinesis']['sequenceNumber'])
             
-            log_data = json.loads(payload.decode('utf-8'))
-            
-            # Process each log entry
-            processed_log = process_log_entry(log_data)
-            
-            if processed_log:
-                # Index to OpenSearch
-                index_to_opensearch(processed_log)
-                
-                # Archive to S3
-                archive_to_s3(processed_log)
-                
-                processed_records.append(processed_log)
+            if len(processed_records) - flushed >= INDEX_FLUSH_RECORDS:
+                index_jobs.append((flushed, stage_executor.submit(
+                    indexer.index_batch, processed_records[flushed:], now,
+                    document_ids[flushed:], io_executor
+                )))
+                flushed = len(processed_records)
+        
+        # Index the remaining records; ids make retried records overwrite themselves
+        if flushed < len(processed_records):
+            index_jobs.append((flushed, stage_executor.submit(
+                indexer.index_batch, processed_records[flushed:], now,
+                document_ids[flushed:], io_executor
+            )))
+        
+        # Archive the whole batch to S3 alongside indexing; records replayed after a
+        # partial failure are archived again (at-least-once, see S3Archiver)
+        archive_job = stage_executor.submit(get_s3_archiver().archive, archive_records, io_executor)
+        
+        for offset, job in index_jobs:
+            failed, rejected = job.result()
+            failures['index'].extend(sequence_numbers[offset + p] for p in failed)
+            failures['rejected'].extend(sequence_numbers[offset + p] for p in rejected)
+        
+        failures['archive'] = [sequence_numbers[p] for p in archive_job.result()]
+        
+        retry = set(failures['index']) | set(failures['archive'])
+        batch_item_failures = [
+            {'itemIdentifier': record['kinesis']['sequenceNumber']}
+            for record in records if record['kinesis']['sequenceNumber'] in retry
+        ]
+        
+        # Kinesis replays everything from the first retried record, so only entries before
+        # it are rolled up and summarized; the replay counts the rest exactly once
+        cutoff = next((p for p, seq in enumerate(sequence_numbers) if seq in retry), len(sequence_numbers))
+        
+        if ROLLUPS_ENABLED:
+            # Rollups are derived data; failing the batch over them would replay it forever
+            try:
+                accumulator = RollupAccumulator()
+                for processed_log in processed_records[:cutoff]:
+                    accumulator.add(processed_log)
+                failed, rejected = indexer.upsert_rollups(accumulator.documents(), ROLLUP_INDEX_NAME, io_executor)
+                if failed or rejected:
+                    print(f"Failed to update {len(failed) + len(rejected)} rollup documents")
+            except Exception as e:
+                print(f"Error updating rollups: {str(e)}")
+        
+        if METRICS_ENABLED and cutoff:
+            # Like rollups, a failed summary is logged rather than failing the batch
+            try:
+                metrics = BatchMetrics()
+                for processed_log in processed_records[:cutoff]:
+                    metrics.add(processed_log)
+                # Named after the summarized id range so a retried invocation overwrites its summary
+                metrics_id = f"{document_ids[0]}..{document_ids[cutoff - 1]}"
+                actions = indexer.encode_actions(
+                    [metrics.document(now)], f"{METRICS_INDEX_NAME}-{now.strftime('%Y-%m')}", [metrics_id]
+                )
+                failed, rejected = indexer.send_actions(actions)
+                if failed or rejected:
+                    print("Failed to index batch metrics")
+            except Exception as e:
+                print(f"Error indexing batch metrics: {str(e)}")
+        
+        counts = {stage: len(sequences) for stage, sequences in failures.items()}
+        if batch_item_failures or any(counts.values()):
+            print(f"Record failures by stage: {json.dumps(counts)}")
         
         return {
             'statusCode': 200,
+            'batchItemFailures': batch_item_failures,
             'body': json.dumps({
                 'message': f'Processed {len(processed_records)} records',
-                'processed_count': len(processed_records)
+                'processed_count': len(processed_records),
+                'failures': counts,
+                'redactions': {rule: hits for rule, hits in redactor.reset_hits().items() if hits}
             })
         }
     
     except Exception as e:
+        # Unexpected failure: ask Kinesis to retry the whole batch
         print(f"Error processing records: {str(e)}")
         return {
             'statusCode': 500,
+            'batchItemFailures': [
+                {'itemIdentifier': record['kinesis']['sequenceNumber']}
+                for record in records if 'kinesis' in record
+            ],
             'body': json.dumps({'error': str(e)})
         }
 
-def process_log_entry(log_data: Dict[str, Any]) -> Dict[str, Any]:
+def decode_records(records: List[Dict[str, Any]], failures: Dict[str, List[str]],
+                   now: Optional[datetime] = None) -> Iterator[Tuple[Dict[str, Any], int, 'LogRecord']]:
     """
-    Parse and enrich log entries
+    Decode and parse Kinesis records, yielding (record, entry_index, processed_log) tuples
+
+    One Kinesis record can carry several log entries (KPL aggregation, CloudWatch Logs
+    envelopes); entry_index is the position of the entry within its record. Sequence
+    numbers of records that cannot be decoded or parsed are added to failures. Every
+    entry of the batch shares one processing timestamp.
     """
-    try:
-        # Extract common log patterns
-        log_patterns = {
-            'apache': r'(\S+) \S+ \S+ \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)',
-            'nginx': r'(\S+) - - \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)',
-            'application': r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (.+)',
-            'json': None  # Already structured
-        }
+    processed_at = (now or datetime.utcnow()).isoformat()
+    metadata = processing_metadata(processed_at)
+    
+    for record in records:
+        sequence_number = record['kinesis']['sequenceNumber']
         
-        processed_log = {
-            'timestamp': datetime.utcnow().isoformat(),
-            'source': log_data.get('source', 'unknown'),
-            'level': 'INFO',
-            'message': '',
-            'parsed_fields': {},
-            'metadata': {}
+        try:
+            # Decode Kinesis data
+            payload = base64.b64decode(record['kinesis']['data'])
+            
+            for entry_index, log_data in enumerate(expand_payload(payload)):
+                # Process each log entry
+                processed_log = process_log_record(log_data, processed_at, metadata)
+                
+                if processed_log is None:
+                    failures['parse'].append(sequence_number)
+                    continue
+                
+                yield record, entry_index, processed_log
+        except Exception as e:
+            print(f"Error decoding record {sequence_number}: {str(e)}")
+            failures['decode'].append(sequence_number)
+
+def expand_payload(payload: bytes) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily expand a Kinesis payload into the log entries it carries
+    """
+    user_records = deaggregate_kpl(payload)
+    if user_records is not None:
+        for user_record in user_records:
+            yield from expand_payload(user_record)
+        return
+    
+    # Handle gzipped logs
+    if payload.startswith(b'\x1f\x8b'):
+        payload = gzip.decompress(payload)
+    
+    log_data = json_loads(payload)
+    
+    if isinstance(log_data, dict) and 'logEvents' in log_data and 'messageType' in log_data:
+        # CloudWatch Logs subscription envelope; CONTROL_MESSAGE carries no events
+        if log_data['messageType'] == 'DATA_MESSAGE':
+            for log_event in log_data['logEvents']:
+                yield cloudwatch_log_entry(log_data, log_event)
+    else:
+        yield log_data
+
+def cloudwatch_log_entry(envelope: Dict[str, Any], log_event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert one CloudWatch Logs event into the log format process_log_entry expects
+    """
+    message = log_event.get('message', '')
+    log_data = None
+    
+    # Structured application logs forwarded through CloudWatch are JSON lines
+    if message[:1] == '{':
+        try:
+            log_data = json_loads(message)
+        except ValueError:
+            pass
+    
+    if not isinstance(log_data, dict):
+        log_data = {'message': message.rstrip('\n')}
+    
+    log_data.setdefault('source', envelope.get('logGroup', 'cloudwatch'))
+    return log_data
+
+# KPL aggregated records: magic, AggregatedRecord protobuf, MD5 of the protobuf
+KPL_MAGIC = b'\xf3\x89\x9a\xc2'
+KPL_DIGEST_SIZE = 16
+
+def _read_varint(view: memoryview, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = view[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+def _iter_protobuf_fields(view: memoryview) -> Iterator[Tuple[int, int, Any]]:
+    """
+    Yield (field_number, wire_type, value) for a protobuf message without copying payloads
+    """
+    position = 0
+    end = len(view)
+    while position < end:
+        key, position = _read_varint(view, position)
+        field_number, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, position = _read_varint(view, position)
+        elif wire_type == 2:
+            length, position = _read_varint(view, position)
+            value = view[position:position + length]
+            position += length
+        elif wire_type == 1:
+            value = view[position:position + 8]
+            position += 8
+        elif wire_type == 5:
+            value = view[position:position + 4]
+            position += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield field_number, wire_type, value
+
+def deaggregate_kpl(payload: bytes) -> Optional[Iterator[bytes]]:
+    """
+    Return the user record payloads of a KPL aggregated record, or None for plain records
+    """
+    if len(payload) <= len(KPL_MAGIC) + KPL_DIGEST_SIZE or not payload.startswith(KPL_MAGIC):
+        return None
+    
+    view = memoryview(payload)
+    message = view[len(KPL_MAGIC):-KPL_DIGEST_SIZE]
+    if hashlib.md5(message).digest() != view[-KPL_DIGEST_SIZE:]:
+        # Not actually aggregated; treat it as an ordinary record like the KPL deaggregators do
+        return None
+    
+    # AggregatedRecord.records (3) -> Record.data (3)
+    return (
+        bytes(data)
+        for field_number, wire_type, user_record in _iter_protobuf_fields(message)
+        if field_number == 3 and wire_type == 2
+        for data_field, data_wire_type, data in _iter_protobuf_fields(user_record)
+        if data_field == 3 and data_wire_type == 2
+    )
+
+_executors = None
+
+def get_executors() -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    """
+    Lazily create the (stage, io) thread pools shared across warm invocations
+
+    Stage tasks (one indexing slice, the archive step) only wait on io tasks (single
+    _bulk requests and S3 puts), and io tasks never wait, so the bounded pools cannot deadlock.
+    """
+    global _executors
+    if _executors is None:
+        _executors = (
+            ThreadPoolExecutor(max_workers=PIPELINE_CONCURRENCY, thread_name_prefix='stage'),
+            ThreadPoolExecutor(max_workers=PIPELINE_CONCURRENCY, thread_name_prefix='io')
+        )
+    return _executors
+
+class LogRecord:
+    """
+    One processed log entry, serialized to the JSON document that is indexed and archived
+    """
+    __slots__ = ('timestamp', 'source', 'level', 'message', 'service', 'host', 'log_type',
+                 'metadata', '_raw_fields', '_parsed_fields', '_json')
+
+    def __init__(self, timestamp: str, source: str = 'unknown', level: str = 'INFO', message: str = '',
+                 service: Optional[str] = None, host: Optional[str] = None, log_type: Optional[str] = None,
+                 parsed_fields: Any = None, metadata: Optional[Dict[str, Any]] = None):
+        self.timestamp = timestamp
+        self.source = source
+        self.level = level
+        self.message = message
+        self.service = service
+        self.host = host
+        self.log_type = log_type
+        self.metadata = metadata if metadata is not None else {}
+        # Redacted on first access; most consumers only need the serialized form
+        self._raw_fields = parsed_fields
+        self._parsed_fields = None
+        self._json = None
+
+    @property
+    def parsed_fields(self) -> Any:
+        if self._parsed_fields is None:
+            self._parsed_fields = redactor.redact_value(self._raw_fields) if self._raw_fields else {}
+            self._raw_fields = None
+        return self._parsed_fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        document = {
+            'timestamp': self.timestamp,
+            'source': self.source,
+            'level': self.level,
+            'message': self.message,
+            'parsed_fields': self.parsed_fields,
+            'metadata': self.metadata
         }
-        
-        # Determine log type and parse accordingly
+        if self.service is not None:
+            document['service'] = self.service
+        if self.host is not None:
+            document['host'] = self.host
+        if self.log_type is not None:
+            document['log_type'] = self.log_type
+        return document
+
+    def to_json(self) -> bytes:
+        """
+        The encoded document, computed once and shared by the _bulk body and the S3 archive
+        """
+        if self._json is None:
+            self._json = json_dumps(self.to_dict())
+        return self._json
+
+def encode_document(entry: Any) -> bytes:
+    if isinstance(entry, LogRecord):
+        return entry.to_json()
+    return json_dumps(entry)
+
+def processing_metadata(processed_at: str) -> Dict[str, Any]:
+    return {
+        'processing_time': processed_at,
+        'processor': 'logx-lambda',
+        'version': '1.0'
+    }
+
+def process_log_record(log_data: Dict[str, Any], processed_at: str,
+                       metadata: Optional[Dict[str, Any]] = None) -> Optional[LogRecord]:
+    """
+    Parse, enrich and sanitize one log entry into a LogRecord
+    """
+    try:
+        source = log_data.get('source', 'unknown')
         raw_message = log_data.get('message', '')
+        if metadata is None:
+            metadata = processing_metadata(processed_at)
         
         if 'level' in log_data:
             # Structured log
-            processed_log.update({
-                'level': log_data.get('level', 'INFO'),
-                'message': raw_message,
-                'parsed_fields': log_data.get('fields', {}),
-                'service': log_data.get('service', 'unknown'),
-                'host': log_data.get('host', 'unknown')
-            })
-        else:
-            # Parse unstructured logs
-            parsed = parse_unstructured_log(raw_message)
-            processed_log.update(parsed)
-        
-        # Add enrichment data
-        processed_log['metadata'] = {
-            'processing_time': datetime.utcnow().isoformat(),
-            'processor': 'logx-lambda',
-            'version': '1.0'
-        }
+            return LogRecord(
+                processed_at, source,
+                level=log_data.get('level', 'INFO'),
+                message=redactor.redact(raw_message),
+                service=log_data.get('service', 'unknown'),
+                host=log_data.get('host', 'unknown'),
+                parsed_fields=log_data.get('fields', {}),
+                metadata=metadata
+            )
         
-        # Security: Remove sensitive data
-        processed_log = sanitize_log(processed_log)
-        
-        return processed_log
+        # Parse unstructured logs
+        parsed = parse_unstructured_log(raw_message)
+        return LogRecord(
+            processed_at, source,
+            level=parsed.get('level', 'INFO'),
+            message=redactor.redact(parsed.get('message', '')),
+            log_type=parsed.get('log_type'),
+            parsed_fields=parsed.get('parsed_fields'),
+            metadata=metadata
+        )
         
     except Exception as e:
         print(f"Error processing log entry: {str(e)}")
         return None
 
+def process_log_entry(log_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Parse and enrich log entries
+    """
+    processed_log = process_log_record(log_data, datetime.utcnow().isoformat())
+    return processed_log.to_dict() if processed_log is not None else None
+
+class LogFormat:
+    """
+    A named unstructured log format with a compiled pattern and a cheap prefilter
+    """
+    __slots__ = ('name', 'pattern', 'builder', 'first_chars', 'prefilter')
+
+    def __init__(self, name: str, pattern: str, builder: Callable[[re.Match, str], Dict[str, Any]],
+                 first_chars: Optional[str] = None, prefilter: Optional[str] = None):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.builder = builder
+        # Characters a matching line may start with (None means any character)
+        self.first_chars = first_chars
+        # Substring that must be present before the regex is worth running
+        self.prefilter = prefilter
+
+    def parse(self, message: str) -> Optional[Dict[str, Any]]:
+        if self.prefilter is not None and self.prefilter not in message:
+            return None
+        match = self.pattern.match(message)
+        if match is None:
+            return None
+        return self.builder(match, message)
+
+def _build_access_log(match: re.Match, message: str) -> Dict[str, Any]:
+    return {
+        'level': 'INFO',
+        'message': message,
+        'parsed_fields': {
+            'client_ip': match.group(1),
+            'timestamp': match.group(2),
+            'method': match.group(3),
+            'path': match.group(4),
+            'protocol': match.group(5),
+            'status_code': int(match.group(6)),
+            'response_size': int(match.group(7))
+        },
+        'log_type': 'access_log'
+    }
+
+def _build_application_log(match: re.Match, message: str) -> Dict[str, Any]:
+    return {
+        'level': match.group(2),
+        'message': match.group(3),
+        'parsed_fields': {
+            'original_timestamp': match.group(1)
+        },
+        'log_type': 'application_log'
+    }
+
+# Normalized names for the level spellings used by nginx, syslog and logfmt emitters
+LEVEL_ALIASES = {
+    'debug': 'DEBUG', 'info': 'INFO', 'notice': 'INFO', 'warn': 'WARNING', 'warning': 'WARNING',
+    'err': 'ERROR', 'error': 'ERROR', 'crit': 'CRITICAL', 'critical': 'CRITICAL',
+    'alert': 'CRITICAL', 'emerg': 'CRITICAL', 'fatal': 'CRITICAL'
+}
+
+def _build_nginx_error_log(match: re.Match, message: str) -> Dict[str, Any]:
+    parsed_fields = {
+        'original_timestamp': match.group(1),
+        'pid': int(match.group(3)),
+        'tid': int(match.group(4))
+    }
+    if match.group(5):
+        parsed_fields['connection_id'] = int(match.group(5))
+
+    return {
+        'level': LEVEL_ALIASES.get(match.group(2), 'INFO'),
+        'message': match.group(6),
+        'parsed_fields': parsed_fields,
+        'log_type': 'nginx_error_log'
+    }
+
+# Syslog severities (RFC 5424) indexed by PRI % 8
+SYSLOG_LEVELS = ('CRITICAL', 'CRITICAL', 'CRITICAL', 'ERROR', 'WARNING', 'INFO', 'INFO', 'DEBUG')
+
+def _build_syslog(match: re.Match, message: str) -> Dict[str, Any]:
+    parsed_fields = {
+        'original_timestamp': match.group(2),
+        'hostname': match.group(3),
+        'program': match.group(4)
+    }
+    level = 'INFO'
+    if match.group(1):
+        priority = int(match.group(1))
+        parsed_fields['facility'] = priority // 8
+        level = SYSLOG_LEVELS[priority % 8]
+    if match.group(5):
+        parsed_fields['pid'] = int(match.group(5))
+
+    return {
+        'level': level,
+        'message': match.group(6),
+        'parsed_fields': parsed_fields,
+        'log_type': 'syslog'
+    }
+
+LOGFMT_PAIR_PATTERN = re.compile(r'([\w.\-]+)=("(?:[^"\\]|\\.)*"|\S*)')
+
+def _build_logfmt(match: re.Match, message: str) -> Dict[str, Any]:
+    parsed_fields = {}
+    for pair in LOGFMT_PAIR_PATTERN.finditer(message):
+        value = pair.group(2)
+        if value.startswith('"'):
+            value = value[1:-1].replace('\\"', '"')
+        parsed_fields[pair.group(1)] = value
+
+    level = parsed_fields.pop('level', None) or parsed_fields.pop('lvl', None) or 'INFO'
+    text = parsed_fields.pop('msg', None) or parsed_fields.pop('message', None) or message
+
+    return {
+        'level': LEVEL_ALIASES.get(level.lower(), level.upper()),
+        'message': text,
+        'parsed_fields': parsed_fields,
+        'log_type': 'logfmt'
+    }
+
+MONTH_INITIALS = 'ADFJMNOS'
+
+# Registered formats, tried in order; the first match wins
+LOG_FORMATS: List[LogFormat] = [
+    LogFormat(
+        'apache',
+        r'(\S+) \S+ \S+ \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)',
+        _build_access_log,
+        prefilter='] "'
+    ),
+    LogFormat(
+        'application',
+        r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (.+)',
+        _build_application_log,
+        first_chars='0123456789'
+    ),
+]
+
+# A logfmt value: a quoted string, a bare word that does not start with a quote, or nothing.
+# The branches never match the same text, so lines that are not logfmt fail in linear time
+LOGFMT_VALUE = r'(?:"(?:[^"\\]|\\.)*"|[^"\s]\S*|)'
+
+# Formats that are only registered on request (EXTRA_LOG_FORMATS or register_log_format),
+# since they would change the output for lines parsed as unstructured today
+OPTIONAL_LOG_FORMATS: Dict[str, LogFormat] = {
+    log_format.name: log_format for log_format in (
+        LogFormat(
+            'nginx_error',
+            r'(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (\d+)#(\d+): (?:\*(\d+) )?(.*)',
+            _build_nginx_error_log,
+            first_chars='0123456789'
+        ),
+        LogFormat(
+            'syslog',
+            r'(?:<(\d{1,3})>)?(\w{3} [ \d]\d \d{2}:\d{2}:\d{2}) (\S+) ([^\s\[:]+)(?:\[(\d+)\])?: (.*)',
+            _build_syslog,
+            first_chars='<' + MONTH_INITIALS
+        ),
+        LogFormat(
+            'logfmt',
+            rf'[\w.\-]+={LOGFMT_VALUE}(?:\s+[\w.\-]+={LOGFMT_VALUE})*\s*\Z',
+            _build_logfmt,
+            prefilter='='
+        ),
+    )
+}
+
+# Candidate formats per leading character, rebuilt whenever the registry changes
+_formats_by_first_char: Dict[str, Tuple[LogFormat, ...]] = {}
+_formats_any_first_char: Tuple[LogFormat, ...] = ()
+
+def _rebuild_format_index() -> None:
+    global _formats_by_first_char, _formats_any_first_char
+
+    leading_chars = set()
+    for log_format in LOG_FORMATS:
+        if log_format.first_chars:
+            leading_chars.update(log_format.first_chars)
+
+    _formats_by_first_char = {
+        char: tuple(
+            log_format for log_format in LOG_FORMATS
+            if log_format.first_chars is None or char in log_format.first_chars
+        )
+        for char in leading_chars
+    }
+    _formats_any_first_char = tuple(
+        log_format for log_format in LOG_FORMATS if log_format.first_chars is None
+    )
+
+def register_log_format(log_format: LogFormat, before: Optional[str] = None) -> None:
+    """
+    Register an unstructured log format, optionally ahead of an existing one
+    """
+    position = len(LOG_FORMATS)
+    if before is not None:
+        position = next(
+            (i for i, existing in enumerate(LOG_FORMATS) if existing.name == before),
+            position
+        )
+    LOG_FORMATS.insert(position, log_format)
+    _rebuild_format_index()
+
+def register_optional_log_formats(names: str) -> None:
+    """
+    Register optional formats by name from a comma-separated list
+    """
+    for name in filter(None, (name.strip() for name in names.split(','))):
+        if name not in OPTIONAL_LOG_FORMATS:
+            raise ValueError(f"Unknown log format {name!r}; expected one of {', '.join(OPTIONAL_LOG_FORMATS)}")
+        register_log_format(OPTIONAL_LOG_FORMATS[name])
+
+_rebuild_format_index()
+register_optional_log_formats(EXTRA_LOG_FORMATS)
+
 def parse_unstructured_log(message: str) -> Dict[str, Any]:
     """
-    Parse unstructured log messages using regex patterns
+    Parse unstructured log messages using the registered log formats
     """
-    # Apache/Nginx access log pattern
-    apache_pattern = r'(\S+) \S+ \S+ \[(.*?)\] "(\S+) (\S+) (\S+)" (\d+) (\d+)'
-    match = re.match(apache_pattern, message)
-    
-    if match:
-        return {
-            'level': 'INFO',
-            'message': message,
-            'parsed_fields': {
-                'client_ip': match.group(1),
-                'timestamp': match.group(2),
-                'method': match.group(3),
-                'path': match.group(4),
-                'protocol': match.group(5),
-                'status_code': int(match.group(6)),
-                'response_size': int(match.group(7))
-            },
-            'log_type': 'access_log'
-        }
-    
-    # Application log pattern
-    app_pattern = r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) \[(\w+)\] (.+)'
-    match = re.match(app_pattern, message)
-    
-    if match:
-        return {
-            'level': match.group(2),
-            'message': match.group(3),
-            'parsed_fields': {
-                'original_timestamp': match.group(1)
-            },
-            'log_type': 'application_log'
-        }
+    candidates = _formats_by_first_char.get(message[:1], _formats_any_first_char)
+
+    for log_format in candidates:
+        parsed = log_format.parse(message)
+        if parsed is not None:
+            return parsed
     
     # Default fallback
     return {
@@ -161,56 +704,699 @@ def parse_unstructured_log(message: str) -> Dict[str, Any]:
         'log_type': 'unstructured'
     }
 
+# Redaction rules by name; all rules are matched in a single case-insensitive scan
+DEFAULT_REDACTION_RULES = {
+    'password': r'password["\s]*[:=]["\s]*[^"\s,}]+',
+    'token': r'token["\s]*[:=]["\s]*[^"\s,}]+',
+    'key': r'key["\s]*[:=]["\s]*[^"\s,}]+',
+    'secret': r'secret["\s]*[:=]["\s]*[^"\s,}]+',
+    'credit_card': r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'
+}
+
+# Lowercase substrings a text must contain before each default rule is worth running;
+# most messages carry none of them and skip the regex scan entirely
+DEFAULT_REDACTION_TRIGGERS = {
+    'password': ('password',),
+    'token': ('token',),
+    'key': ('key',),
+    'secret': ('secret',),
+    'credit_card': tuple('0123456789')
+}
+
+# Field names whose string values are redacted wholesale when found in parsed_fields.
+# They must match whole key segments, so access_token and apiKey match but prompt_tokens does not
+DEFAULT_SENSITIVE_FIELDS = r'password|passwd|token|secret|api[_-]?key|access[_-]?key|private[_-]?key|card[_-]?number'
+
+class Redactor:
+    """
+    Redact sensitive values and count hits per rule
+
+    A cheap substring prefilter picks the rules a text could match (rules without
+    triggers always run); those are matched in one combined case-insensitive scan.
+    """
+    FIELD_RULE = 'sensitive_field'
+
+    def __init__(self, rules: Optional[Dict[str, str]] = None,
+                 sensitive_fields: Optional[str] = DEFAULT_SENSITIVE_FIELDS,
+                 replacement: str = '[REDACTED]',
+                 triggers: Optional[Dict[str, Tuple[str, ...]]] = None):
+        if rules is None:
+            rules = DEFAULT_REDACTION_RULES
+            triggers = DEFAULT_REDACTION_TRIGGERS if triggers is None else triggers
+        self.rules = rules
+        triggers = triggers or {}
+        self.triggers = [(name, triggers.get(name)) for name in rules]
+        # Combined patterns per set of rules the prefilter let through
+        self.patterns = {}
+        self.field_pattern = re.compile(
+            rf'(?:^|[_\-.\s])(?:{sensitive_fields})(?:$|[_\-.\s])', re.IGNORECASE
+        ) if sensitive_fields else None
+        # The same handful of keys repeat across every record of a batch
+        self.is_sensitive_field = lru_cache(maxsize=4096)(self._is_sensitive_field)
+        self.replacement = replacement
+        self.hits = dict.fromkeys(rules, 0)
+        self.hits[self.FIELD_RULE] = 0
+
+    def _replace(self, match: re.Match) -> str:
+        self.hits[match.lastgroup] += 1
+        return self.replacement
+
+    def _pattern(self, names: Tuple[str, ...]) -> re.Pattern:
+        pattern = self.patterns.get(names)
+        if pattern is None:
+            pattern = self.patterns[names] = re.compile(
+                '|'.join(f'(?P<{name}>{self.rules[name]})' for name in names),
+                re.IGNORECASE
+            )
+        return pattern
+
+    def redact(self, text: str) -> str:
+        if not text:
+            return text
+        contains = text.lower().__contains__
+        names = tuple([
+            name for name, triggers in self.triggers
+            if triggers is None or any(map(contains, triggers))
+        ])
+        if not names:
+            return text
+        return self._pattern(names).sub(self._replace, text)
+
+    def redact_value(self, value: Any) -> Any:
+        """
+        Redact strings inside arbitrarily nested dicts and lists
+        """
+        if isinstance(value, str):
+            return self.redact(value)
+        if isinstance(value, dict):
+            return {key: self.redact_field(key, item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.redact_value(item) for item in value]
+        if isinstance(value, int) and not isinstance(value, bool) and value >= 10 ** 15:
+            # Card numbers logged as integers
+            redacted = self.redact(str(value))
+            return value if redacted == str(value) else redacted
+        return value
+
+    def _is_sensitive_field(self, key: str) -> bool:
+        # Split camelCase keys into segments before matching
+        key = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', key)
+        return bool(self.field_pattern.search(key))
+
+    def redact_field(self, key: Any, value: Any) -> Any:
+        # Only strings are blanked out; counters such as token_count stay numeric
+        if (self.field_pattern is not None and isinstance(key, str)
+                and isinstance(value, str) and value
+                and self.is_sensitive_field(key)):
+            self.hits[self.FIELD_RULE] += 1
+            return self.replacement
+        return self.redact_value(value)
+
+    def reset_hits(self) -> Dict[str, int]:
+        """
+        Return the hit counters and start counting from zero
+        """
+        hits = dict(self.hits)
+        for rule in self.hits:
+            self.hits[rule] = 0
+        return hits
+
+redactor = Redactor()
+
 def sanitize_log(log_entry: Dict[str, Any]) -> Dict[str, Any]:
     """
     Remove sensitive information from logs
     """
-    sensitive_patterns = [
-        r'password["\s]*[:=]["\s]*[^"\s,}]+',
-        r'token["\s]*[:=]["\s]*[^"\s,}]+',
-        r'key["\s]*[:=]["\s]*[^"\s,}]+',
-        r'secret["\s]*[:=]["\s]*[^"\s,}]+',
-        r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'  # Credit card
-    ]
+    log_entry['message'] = redactor.redact(log_entry.get('message', ''))
     
-    message = log_entry.get('message', '')
+    if log_entry.get('parsed_fields'):
+        log_entry['parsed_fields'] = redactor.redact_value(log_entry['parsed_fields'])
     
-    for pattern in sensitive_patterns:
-        message = re.sub(pattern, '[REDACTED]', message, flags=re.IGNORECASE)
-    
-    log_entry['message'] = message
     return log_entry
 
-def index_to_opensearch(log_entry: Dict[str, Any]) -> None:
+# Painless script merging one batch's rollup into the stored document
+ROLLUP_MERGE_SCRIPT = (
+    "ctx._source.count += params.count; "
+    "ctx._source.response_time_count += params.response_time_count; "
+    "ctx._source.response_time_sum += params.response_time_sum; "
+    "if (params.response_time_max > ctx._source.response_time_max) "
+    "{ ctx._source.response_time_max = params.response_time_max; }"
+)
+
+# Dimensions each per-minute rollup document is keyed on; a dimension the log entries lack
+# is left out of the document, as it is missing from their raw documents
+ROLLUP_DIMENSIONS = ('source', 'service', 'level', 'status_code')
+
+def rollup_id(rollup: Dict[str, Any]) -> str:
+    key = '|'.join([rollup['minute']] + [rollup.get(dimension, '\x00') for dimension in ROLLUP_DIMENSIONS])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def fields_of(log_entry: LogRecord) -> Dict[str, Any]:
     """
-    Index log entry to OpenSearch
+    Parsed fields as a dict; structured logs may carry a string, list or number instead
     """
-    try:
-        # Create index if it doesn't exist
-        index_name = f"{INDEX_NAME}-{datetime.utcnow().strftime('%Y-%m')}"
+    fields = log_entry.parsed_fields
+    return fields if isinstance(fields, dict) else {}
+
+def finite_number(value: Any) -> Optional[float]:
+    """
+    The value as a float if it is a finite number; the JSON fallback decoder lets NaN and
+    Infinity through, and either would poison sums and sketch buckets
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        value = float(value)
+        if math.isfinite(value):
+            return value
+    return None
+
+def response_time_of(log_entry: LogRecord) -> Optional[float]:
+    """
+    Response time in milliseconds from parsed fields, if the entry carries one
+    """
+    fields = fields_of(log_entry)
+    for name in ('response_time', 'duration_ms'):
+        value = finite_number(fields.get(name))
+        if value is not None:
+            return value
+    return None
+
+class RollupAccumulator:
+    """
+    Per-minute counts and response-time totals for one batch of processed log entries
+    """
+    def __init__(self):
+        self.buckets = {}
+
+    def add(self, log_entry: LogRecord) -> None:
+        fields = fields_of(log_entry)
+        status_code = fields.get('status_code')
+        key = (
+            # Minute resolution of the ISO timestamp
+            f"{log_entry.timestamp[:16]}:00",
+            str(log_entry.source),
+            str(log_entry.service) if log_entry.service is not None else None,
+            str(log_entry.level),
+            str(status_code) if status_code is not None else None
+        )
+
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {
+                'count': 0,
+                'response_time_count': 0,
+                'response_time_sum': 0.0,
+                'response_time_max': 0.0
+            }
+
+        bucket['count'] += 1
+        response_time = response_time_of(log_entry)
+        if response_time is not None:
+            bucket['response_time_count'] += 1
+            bucket['response_time_sum'] += response_time
+            if response_time > bucket['response_time_max']:
+                bucket['response_time_max'] = response_time
+
+    def documents(self) -> List[Dict[str, Any]]:
+        names = ('minute',) + ROLLUP_DIMENSIONS
+        return [
+            dict(((name, value) for name, value in zip(names, key) if value is not None), **totals)
+            for key, totals in self.buckets.items()
+        ]
+
+class QuantileSketch:
+    """
+    Mergeable log-bucketed quantile sketch (DDSketch): every reported quantile is
+    within relative_accuracy of the true value, whatever the distribution
+    """
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Bucket i counts values in (gamma^(i-1), gamma^i]; zero and below are counted apart
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return min(0.0, self.max)
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Midpoint of the bucket in relative terms, clamped to the observed range
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summary quantiles plus the sparse bins, so sketches can be merged across batches
+        """
+        keys = sorted(self.bins)
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'relative_accuracy': self.relative_accuracy,
+            'zero_count': self.zero_count,
+            'bin_keys': keys,
+            'bin_counts': [self.bins[key] for key in keys]
+        }
+
+def response_size_of(log_entry: LogRecord) -> Optional[float]:
+    return finite_number(fields_of(log_entry).get('response_size'))
+
+class BatchMetrics:
+    """
+    Request counts, status classes and latency/size sketches for one batch, grouped
+    by source, service and path
+    """
+    OVERFLOW_PATH = '__other__'
+
+    def __init__(self, max_groups: Optional[int] = None):
+        self.max_groups = max_groups or METRICS_MAX_GROUPS
+        self.groups = {}
+        self.record_count = 0
+
+    def add(self, log_entry: LogRecord) -> None:
+        fields = fields_of(log_entry)
+        path = fields.get('path') or fields.get('endpoint')
+        # Query strings would make every request its own group
+        path = str(path).split('?', 1)[0] if path else 'none'
+        key = (str(log_entry.source), str(log_entry.service or 'unknown'), path)
+
+        if key not in self.groups and len(self.groups) >= self.max_groups:
+            key = key[:2] + (self.OVERFLOW_PATH,)
+
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {
+                'count': 0,
+                'errors': 0,
+                'status_classes': {},
+                'latency_ms': QuantileSketch(),
+                'response_size': QuantileSketch()
+            }
+
+        self.record_count += 1
+        group['count'] += 1
+        if log_entry.level in ('ERROR', 'CRITICAL'):
+            group['errors'] += 1
+
+        status_code = fields.get('status_code')
+        if isinstance(status_code, int):
+            status_class = f"{status_code // 100}xx"
+            group['status_classes'][status_class] = group['status_classes'].get(status_class, 0) + 1
+
+        response_time = response_time_of(log_entry)
+        if response_time is not None:
+            group['latency_ms'].add(response_time)
+        response_size = response_size_of(log_entry)
+        if response_size is not None:
+            group['response_size'].add(response_size)
+
+    def document(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        groups = []
+        for (source, service, path), group in self.groups.items():
+            summary = {
+                'source': source,
+                'service': service,
+                'path': path,
+                'count': group['count'],
+                'errors': group['errors']
+            }
+            for status_class, count in group['status_classes'].items():
+                summary[f"status_{status_class}"] = count
+            for name in ('latency_ms', 'response_size'):
+                if group[name].count:
+                    summary[name] = group[name].to_dict()
+            groups.append(summary)
+
+        return {
+            'timestamp': (now or datetime.utcnow()).isoformat(),
+            'record_count': self.record_count,
+            'groups': groups
+        }
+
+class AWSSigV4Auth(AuthBase):
+    """
+    Sign OpenSearch requests with the Lambda execution role credentials
+    """
+    def __init__(self, region: str, service: str = 'es'):
+        self.region = region
+        self.service = service
+        self.credentials = boto3.Session().get_credentials()
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        aws_request = AWSRequest(
+            method=request.method,
+            url=request.url,
+            data=request.body,
+            headers={'Content-Type': request.headers.get('Content-Type', 'application/json')}
+        )
+        SigV4Auth(self.credentials.get_frozen_credentials(), self.service, self.region).add_auth(aws_request)
+        request.headers.update(dict(aws_request.headers.items()))
+        return request
+
+class BulkIndexer:
+    """
+    Index batches of log entries through the OpenSearch _bulk API
+    """
+    # Item statuses worth retrying: throttling and transient server errors
+    RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, endpoint: str, index_prefix: str = 'logs', max_bytes: int = 5 * 1024 * 1024,
+                 max_retries: int = 3, backoff_seconds: float = 0.2, timeout: float = 30.0,
+                 auth: Optional[AuthBase] = None, pool_size: int = 4):
+        # Endpoints without a scheme are AWS domain hostnames
+        self.url = endpoint if endpoint.startswith(('http://', 'https://')) else f"https://{endpoint}"
+        self.index_prefix = index_prefix
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+
+        # One pooled keep-alive session, reused across warm invocations
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.headers['Content-Type'] = 'application/x-ndjson'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def index_name(self, now: Optional[datetime] = None) -> str:
+        return f"{self.index_prefix}-{(now or datetime.utcnow()).strftime('%Y-%m')}"
+
+    def encode_actions(self, log_entries: List[Dict[str, Any]], index_name: str,
+                       ids: Optional[List[str]] = None) -> List[bytes]:
+        if ids is None:
+            action = json_dumps({'index': {'_index': index_name}}) + b'\n'
+            return [action + encode_document(entry) + b'\n' for entry in log_entries]
+
+        return [
+            json_dumps({'index': {'_index': index_name, '_id': doc_id}}) + b'\n'
+            + encode_document(entry) + b'\n'
+            for doc_id, entry in zip(ids, log_entries)
+        ]
+
+    def chunk_actions(self, positions: List[int], actions: List[bytes]) -> List[List[int]]:
+        """
+        Group action positions into requests no larger than max_bytes
+        """
+        chunks = []
+        current = []
+        current_size = 0
+
+        for position in positions:
+            size = len(actions[position])
+            if current and current_size + size > self.max_bytes:
+                chunks.append(current)
+                current = []
+                current_size = 0
+            current.append(position)
+            current_size += size
+
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def send_chunk(self, chunk: List[int], actions: List[bytes]) -> Tuple[List[int], List[int]]:
+        """
+        Send one _bulk request and split its failed positions into (retryable, rejected)
+        """
+        try:
+            response = self.session.post(
+                f"{self.url}/_bulk",
+                data=b''.join(actions[position] for position in chunk),
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            print(f"Error sending bulk request: {str(e)}")
+            return chunk, []
+
+        if response.status_code != 200:
+            # A request-level error (expired credentials, access policy, request too large)
+            # says nothing about the documents, so they stay retryable and Kinesis replays
+            # them once retries run out; only item-level statuses reject documents
+            if response.status_code not in self.RETRYABLE_STATUSES:
+                print(f"Bulk request failed: {response.status_code} {response.text[:200]}")
+            return chunk, []
+
+        result = json_loads(response.content)
+        if not result.get('errors'):
+            return [], []
+
+        retryable = []
+        rejected = []
+        for position, item in zip(chunk, result.get('items', [])):
+            outcome = next(iter(item.values()))
+            status = outcome.get('status', 500)
+            if status < 300:
+                continue
+            if status in self.RETRYABLE_STATUSES:
+                retryable.append(position)
+            else:
+                print(f"Error indexing document: {outcome.get('error')}")
+                rejected.append(position)
+        return retryable, rejected
+
+    def index_batch(self, log_entries: List[Dict[str, Any]], now: Optional[datetime] = None,
+                    ids: Optional[List[str]] = None,
+                    executor: Optional[Executor] = None) -> Tuple[List[int], List[int]]:
+        """
+        Bulk index log entries and return the (failed, rejected) positions
+
+        Failed positions were still throttled or erroring after all retries, including whole
+        requests OpenSearch refused; rejected positions were refused item by item (e.g. mapping
+        errors) and will not succeed on retry.
+        When an executor is given, the _bulk requests of each attempt are sent concurrently.
+        """
+        if not log_entries:
+            return [], []
+
+        actions = self.encode_actions(log_entries, self.index_name(now), ids)
+        return self.send_actions(actions, executor)
+
+    def send_actions(self, actions: List[bytes],
+                     executor: Optional[Executor] = None) -> Tuple[List[int], List[int]]:
+        """
+        Send encoded _bulk actions with retries and return the (failed, rejected) positions
+        """
+        pending = list(range(len(actions)))
+        rejected = []
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff_seconds * (2 ** (attempt - 1)))
+
+            chunks = self.chunk_actions(pending, actions)
+            if executor is not None and len(chunks) > 1:
+                results = executor.map(lambda chunk: self.send_chunk(chunk, actions), chunks)
+            else:
+                results = (self.send_chunk(chunk, actions) for chunk in chunks)
+
+            retryable = []
+            for chunk_retryable, chunk_rejected in results:
+                retryable.extend(chunk_retryable)
+                rejected.extend(chunk_rejected)
+
+            pending = retryable
+            if not pending:
+                break
+
+        return sorted(pending), sorted(rejected)
+
+    def upsert_rollups(self, rollups: List[Dict[str, Any]], index_prefix: str,
+                       executor: Optional[Executor] = None) -> Tuple[List[int], List[int]]:
+        """
+        Merge rollup documents into their monthly rollup index with scripted upserts
+        """
+        actions = []
+        for rollup in rollups:
+            action = {'update': {
+                '_index': f"{index_prefix}-{rollup['minute'][:7]}",
+                '_id': rollup_id(rollup),
+                'retry_on_conflict': 5
+            }}
+            update = {
+                'script': {'source': ROLLUP_MERGE_SCRIPT, 'lang': 'painless', 'params': rollup},
+                'upsert': rollup
+            }
+            actions.append(json_dumps(action) + b'\n' + json_dumps(update) + b'\n')
+        return self.send_actions(actions, executor)
+
+    def index(self, log_entries: List[Dict[str, Any]], now: Optional[datetime] = None,
+              ids: Optional[List[str]] = None, executor: Optional[Executor] = None) -> List[int]:
+        """
+        Bulk index log entries and return the positions that could not be indexed
+        """
+        failed, rejected = self.index_batch(log_entries, now, ids, executor)
+        return sorted(failed + rejected)
+
+_bulk_indexer = None
+
+def get_bulk_indexer() -> BulkIndexer:
+    """
+    Lazily create the module-wide bulk indexer so warm invocations share its connections
+    """
+    global _bulk_indexer
+    if _bulk_indexer is None:
+        if not OPENSEARCH_ENDPOINT:
+            raise RuntimeError("OPENSEARCH_ENDPOINT is not set")
         
-        # Index document (implement actual OpenSearch indexing)
-        # This is a placeholder - you'll need to implement actual OpenSearch client
-        print(f"Indexing to OpenSearch: {index_name}")
+        auth = None
+        if OPENSEARCH_USERNAME:
+            auth = HTTPBasicAuth(OPENSEARCH_USERNAME, OPENSEARCH_PASSWORD)
+        elif not OPENSEARCH_ENDPOINT.startswith('http://'):
+            auth = AWSSigV4Auth(AWS_REGION)
+
+        _bulk_indexer = BulkIndexer(
+            OPENSEARCH_ENDPOINT,
+            index_prefix=INDEX_NAME,
+            max_bytes=BULK_MAX_BYTES,
+            max_retries=BULK_MAX_RETRIES,
+            auth=auth,
+            pool_size=PIPELINE_CONCURRENCY
+        )
+    return _bulk_indexer
+
+def index_to_opensearch(log_entry: Dict[str, Any]) -> None:
+    """
+    Index a single log entry to OpenSearch
+    """
+    if get_bulk_indexer().index([log_entry]):
+        print("Error indexing to OpenSearch: document rejected")
+
+class S3Archiver:
+    """
+    Archive batches of log entries to S3 as gzip-compressed NDJSON objects
+
+    Archives are at-least-once. A batch is archived while it is being indexed, and Kinesis
+    replays a partially failed batch from its first failed record. Records after that
+    point that were already archived are written again, under a key for the replayed
+    sequence range, so readers must tolerate duplicates; objects of one shard whose key
+    ranges overlap hold records archived more than once.
+    """
+    def __init__(self, bucket: str, client: Any, prefix: str = 'logs'):
+        self.bucket = bucket
+        self.client = client
+        self.prefix = prefix
+
+    @staticmethod
+    def partition(kinesis_record: Dict[str, Any], log_entry: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Return the (source, hour) partition of a record, using the Kinesis arrival time when known
+        """
+        arrival = kinesis_record.get('kinesis', {}).get('approximateArrivalTimestamp')
+        moment = datetime.utcfromtimestamp(arrival) if arrival is not None else datetime.utcnow()
+        source = log_entry.source if isinstance(log_entry, LogRecord) else log_entry.get('source', 'unknown')
+        source = re.sub(r'[^\w.\-]', '_', str(source)) or 'unknown'
+        return source, moment.strftime('%Y/%m/%d/%H')
+
+    def object_key(self, source: str, hour: str, records: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+                   body: bytes) -> str:
+        """
+        Build a deterministic key from the shard and sequence range, so replaying exactly the
+        same records overwrites their object; a replay starting mid-batch gets a new key
+        """
+        sequence_numbers = [r.get('kinesis', {}).get('sequenceNumber') for r, _ in records]
+        if all(sequence_numbers):
+            shard_id = records[0][0].get('eventID', 'shardId-unknown').split(':')[0]
+            name = f"{shard_id}-{sequence_numbers[0]}-{sequence_numbers[-1]}"
+        else:
+            # No Kinesis metadata (e.g. direct invocation): name the object after its content
+            name = hashlib.sha1(body).hexdigest()
+        return f"{self.prefix}/source={source}/{hour}/{name}.ndjson.gz"
+
+    def archive(self, records: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+                executor: Optional[Executor] = None) -> List[int]:
+        """
+        Write (kinesis_record, log_entry) pairs grouped by partition and return failed positions
+
+        When an executor is given, partitions are uploaded concurrently.
+        """
+        partitions = {}
+        for position, (kinesis_record, log_entry) in enumerate(records):
+            partitions.setdefault(self.partition(kinesis_record, log_entry), []).append(position)
+
+        if executor is not None and len(partitions) > 1:
+            results = executor.map(lambda item: self.put_partition(records, *item), partitions.items())
+        else:
+            results = (self.put_partition(records, *item) for item in partitions.items())
+
+        failed = []
+        for partition_failed in results:
+            failed.extend(partition_failed)
+        return sorted(failed)
+
+    def put_partition(self, records: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+                      partition: Tuple[str, str], positions: List[int]) -> List[int]:
+        """
+        Write one partition's records as a single object and return its positions on failure
+        """
+        source, hour = partition
+        lines = b''.join(encode_document(records[p][1]) + b'\n' for p in positions)
+        body = gzip.compress(lines)
+        key = self.object_key(source, hour, [records[p] for p in positions], lines)
+
+        try:
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=body,
+                ContentType='application/x-ndjson',
+                ContentEncoding='gzip'
+            )
+        except Exception as e:
+            print(f"Error archiving to S3: {str(e)}")
+            return positions
+        return []
+
+_s3_archiver = None
+
+def get_s3_archiver() -> S3Archiver:
+    """
+    Lazily create the module-wide S3 archiver
+    """
+    global _s3_archiver
+    if _s3_archiver is None:
+        if not S3_BUCKET:
+            raise RuntimeError("S3_BUCKET is not set")
         
-    except Exception as e:
-        print(f"Error indexing to OpenSearch: {str(e)}")
+        # AWS clients are created on first use, not at import
+        s3_client = boto3.client('s3', config=Config(max_pool_connections=PIPELINE_CONCURRENCY))
+        _s3_archiver = S3Archiver(S3_BUCKET, s3_client)
+    return _s3_archiver
 
 def archive_to_s3(log_entry: Dict[str, Any]) -> None:
     """
-    Archive log entry to S3
+    Archive a single log entry to S3
     """
-    try:
-        # Create S3 key with date partitioning
-        date_partition = datetime.utcnow().strftime('%Y/%m/%d')
-        key = f"logs/{date_partition}/{datetime.utcnow().timestamp()}.json"
-        
-        s3_client.put_object(
-            Bucket=S3_BUCKET,
-            Key=key,
-            Body=json.dumps(log_entry),
-            ContentType='application/json'
-        )
-        
-    except Exception as e:
-        print(f"Error archiving to S3: {str(e)}")
\ No newline at end of file
+    get_s3_archiver().archive([({}, log_entry)])
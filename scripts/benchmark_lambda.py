@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Offline Replay/Benchmark Harness for the Ingest Lambda
+Replays synthetic Kinesis batches through lambda_handler with stubbed OpenSearch and S3
+sinks and prints machine-readable throughput, per-stage timings and memory figures
+"""
+
+import argparse
+import base64
+import gzip
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from faker import Faker
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(SCRIPTS_DIR), 'lambda')
+sys.path.insert(0, LAMBDA_DIR)
+sys.path.insert(0, SCRIPTS_DIR)
+
+import log_parser
+from log_generator import LogGenerator
+
+STAGES = ('decode', 'parse', 'sanitize', 'serialize', 'index', 'archive')
+
+class StageTimer:
+    """
+    Accumulate exclusive time per stage: time spent in a nested stage is not also
+    counted for the stage that called it. Stages running on pipeline threads are summed
+    across threads, so they can add up to more than the wall-clock time.
+    """
+    def __init__(self):
+        self.totals = dict.fromkeys(STAGES, 0.0)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _enter(self) -> list:
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append([time.perf_counter(), 0.0])
+        return stack
+
+    def _exit(self, stage: str, stack: list) -> None:
+        started, nested = stack.pop()
+        elapsed = time.perf_counter() - started
+        if stack:
+            stack[-1][1] += elapsed
+        with self.lock:
+            self.totals[stage] += elapsed - nested
+
+    def wrap(self, stage: str, function):
+        def timed(*args, **kwargs):
+            stack = self._enter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit(stage, stack)
+        return timed
+
+    def wrap_iterator(self, stage: str, function):
+        """
+        Time each step of a generator function, not the consumer's work between steps
+        """
+        def timed(*args, **kwargs):
+            iterator = iter(function(*args, **kwargs))
+            while True:
+                stack = self._enter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit(stage, stack)
+                yield item
+        return timed
+
+    def reset(self) -> None:
+        with self.lock:
+            self.totals = dict.fromkeys(STAGES, 0.0)
+
+class StubBulkSession:
+    """
+    Stands in for the indexer's requests session; every document is accepted
+    """
+    class Response:
+        status_code = 200
+        content = b'{"took":1,"errors":false,"items":[]}'
+        text = content.decode('utf-8')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def post(self, url, data=None, timeout=None):
+        self.requests += 1
+        self.bytes_sent += len(data)
+        return self.Response()
+
+class StubS3Client:
+    """
+    Stands in for the boto3 S3 client; objects are counted and discarded
+    """
+    def __init__(self):
+        self.objects = 0
+        self.bytes_written = 0
+
+    def put_object(self, **kwargs):
+        self.objects += 1
+        self.bytes_written += len(kwargs['Body'])
+        return {}
+
+def load_corpus(path: str) -> list:
+    """
+    Read payloads recorded by log_generator's file sink (NDJSON, optionally gzipped)
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as corpus:
+        payloads = [line.rstrip(b'\n') for line in corpus if line.strip()]
+    if not payloads:
+        raise ValueError(f"Corpus {path} contains no records")
+    return payloads
+
+def pad_message(payload: bytes, message_bytes: int) -> bytes:
+    """
+    Pad a JSON log's message with filler words up to message_bytes characters
+    """
+    log = json.loads(payload)
+    message = str(log.get('message', ''))
+    if len(message) < message_bytes:
+        filler = ' lorem ipsum dolor sit amet' * (message_bytes // 27 + 1)
+        log['message'] = (message + filler)[:message_bytes]
+    return json.dumps(log).encode('utf-8')
+
+def build_events(batch_size: int, batches: int, seed: int, corpus: list = None, message_bytes: int = 0):
+    """
+    Build Kinesis event batches from a recorded corpus, replayed in order and wrapped
+    around as needed, or else from log_generator's templates, reproducibly for a seed.
+    With message_bytes, each message is padded to that length to exercise long lines
+    """
+    if corpus is not None:
+        payloads = itertools.cycle(corpus)
+    else:
+        random.seed(seed)
+        Faker.seed(seed)
+        generator = LogGenerator()
+        payloads = (json.dumps(generator.generate_log()).encode('utf-8') for _ in itertools.count())
+    if message_bytes > 0:
+        payloads = (pad_message(payload, message_bytes) for payload in payloads)
+
+    events = []
+    sequence_number = 0
+    arrival = time.time()
+    for _ in range(batches):
+        records = []
+        for payload in itertools.islice(payloads, batch_size):
+            sequence_number += 1
+            records.append({
+                'eventID': f'shardId-000000000000:{sequence_number}',
+                'eventSource': 'aws:kinesis',
+                'kinesis': {
+                    'sequenceNumber': str(sequence_number),
+                    'partitionKey': str(sequence_number % 10),
+                    'approximateArrivalTimestamp': arrival,
+                    'data': base64.b64encode(payload).decode('ascii')
+                }
+            })
+        events.append({'Records': records})
+    return events
+
+def instrument(timer: StageTimer, indexer: log_parser.BulkIndexer, archiver: log_parser.S3Archiver) -> list:
+    """
+    Patch the handler's stage entry points and sinks; returns the patches to start
+    """
+    base64_module = SimpleNamespace(b64decode=timer.wrap('decode', base64.b64decode))
+    redactor = log_parser.redactor
+    return [
+        patch.object(log_parser, 'get_bulk_indexer', lambda: indexer),
+        patch.object(log_parser, 'get_s3_archiver', lambda: archiver),
+        patch.object(log_parser, 'base64', base64_module),
+        patch.object(log_parser, 'expand_payload', timer.wrap_iterator('decode', log_parser.expand_payload)),
+        patch.object(log_parser, 'process_log_record', timer.wrap('parse', log_parser.process_log_record)),
+        patch.object(redactor, 'redact', timer.wrap('sanitize', redactor.redact)),
+        patch.object(redactor, 'redact_value', timer.wrap('sanitize', redactor.redact_value)),
+        patch.object(log_parser.LogRecord, 'to_json', timer.wrap('serialize', log_parser.LogRecord.to_json)),
+        patch.object(indexer, 'index_batch', timer.wrap('index', indexer.index_batch)),
+        patch.object(archiver, 'archive', timer.wrap('archive', archiver.archive))
+    ]
+
+def run_batches(events: list) -> float:
+    started = time.perf_counter()
+    for event in events:
+        result = log_parser.lambda_handler(event, None)
+        if result['statusCode'] != 200 or result['batchItemFailures']:
+            raise RuntimeError(f"Benchmark batch failed: {result['body']}")
+    return time.perf_counter() - started
+
+def benchmark_batch_size(batch_size: int, batches: int, seed: int, corpus: list = None,
+                         message_bytes: int = 0) -> dict:
+    """
+    Measure one batch size: a warm-up batch, the timed run, then a tracemalloc run for peak memory
+    """
+    events = build_events(batch_size, batches + 1, seed, corpus, message_bytes)
+    session = StubBulkSession()
+    indexer = log_parser.BulkIndexer('http://benchmark:9200', index_prefix=log_parser.INDEX_NAME)
+    indexer.session = session
+    s3_client = StubS3Client()
+    archiver = log_parser.S3Archiver('benchmark-bucket', s3_client)
+    timer = StageTimer()
+
+    patches = instrument(timer, indexer, archiver)
+    for active_patch in patches:
+        active_patch.start()
+    try:
+        run_batches(events[:1])
+        timer.reset()
+        session.requests = s3_client.objects = 0
+
+        seconds = run_batches(events[1:])
+        stages = dict(timer.totals)
+        bulk_requests, s3_objects = session.requests, s3_client.objects
+
+        # Tracing slows everything down, so memory is measured on a separate pass
+        tracemalloc.start()
+        try:
+            run_batches(events[1:2])
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        for active_patch in reversed(patches):
+            active_patch.stop()
+
+    records = batch_size * batches
+    return {
+        'batch_size': batch_size,
+        'batches': batches,
+        'records': records,
+        'seconds': seconds,
+        'records_per_second': records / seconds if seconds else None,
+        'seconds_per_batch': seconds / batches,
+        'stage_seconds': stages,
+        'peak_traced_memory_bytes': peak_memory,
+        'bulk_requests': bulk_requests,
+        's3_objects': s3_objects
+    }
+
+def measure_import_time(repeats: int) -> dict:
+    """
+    Time a cold import of log_parser in fresh interpreters with no configuration
+    """
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); "
+        "started = time.perf_counter(); import log_parser; print(time.perf_counter() - started)"
+    )
+    env = {key: value for key, value in os.environ.items()
+           if key not in ('OPENSEARCH_ENDPOINT', 'S3_BUCKET', 'INDEX_NAME')}
+
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', code, LAMBDA_DIR],
+            env=env, capture_output=True, text=True, check=True
+        )
+        samples.append(float(output.stdout.strip()))
+
+    return {
+        'repeats': repeats,
+        'median_seconds': statistics.median(samples),
+        'min_seconds': min(samples),
+        'max_seconds': max(samples)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the LogX ingest Lambda offline')
+    parser.add_argument('--batch-sizes', default='100,500,1000',
+                        help='Comma-separated Kinesis batch sizes')
+    parser.add_argument('--batches', type=int, default=5, help='Timed batches per batch size')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic logs')
+    parser.add_argument('--import-repeats', type=int, default=5,
+                        help='Fresh interpreters used to time the cold import (0 to skip)')
+    parser.add_argument('--corpus',
+                        help='Replay this NDJSON (or .ndjson.gz) corpus from log_generator --sink file')
+    parser.add_argument('--message-bytes', type=int, default=0,
+                        help='Pad each log message to this many characters (0 keeps them as generated)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus) if args.corpus else None
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': {'path': args.corpus, 'records': len(corpus)} if corpus else None,
+        'message_bytes': args.message_bytes or None,
+        'json_codec': 'orjson' if log_parser.orjson is not None else 'json',
+        'settings': {
+            'pipeline_concurrency': log_parser.PIPELINE_CONCURRENCY,
+            'index_flush_records': log_parser.INDEX_FLUSH_RECORDS,
+            'rollups_enabled': log_parser.ROLLUPS_ENABLED,
+            'metrics_enabled': log_parser.METRICS_ENABLED
+        },
+        'cold_import': measure_import_time(args.import_repeats) if args.import_repeats > 0 else None,
+        'results': [
+            benchmark_batch_size(int(size), args.batches, args.seed, corpus, args.message_bytes)
+            for size in args.batch_sizes.split(',') if size.strip()
+        ]
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
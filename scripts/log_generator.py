@@ -4,20 +4,430 @@ Log Generator Script for Testing LogX Platform
 Generates realistic log entries and sends them to Kinesis
 """
 
+import base64
+import gzip
+import http.client
+import io
+import itertools
 import json
+import multiprocessing
+import queue
 import random
+import sys
+import threading
 import time
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import boto3
+from botocore.config import Config
 from faker import Faker
 import argparse
 
+from traffic_profiles import LoadProfile, RateScheduler, TrafficShaper, ZipfSampler
+
 fake = Faker()
 
+# PutRecords limits: records and total bytes (data plus partition keys) per call
+KINESIS_MAX_BATCH_RECORDS = 500
+KINESIS_MAX_BATCH_BYTES = 5 * 1024 * 1024
+KINESIS_MAX_RECORD_BYTES = 1024 * 1024
+# Kinesis maps partition keys onto a 128-bit hash key space split between the shards
+KINESIS_HASH_KEY_SPACE = 2 ** 128
+
+# Distinct pre-rendered values per Faker field in the template engine
+TEMPLATE_POOL_SIZE = 4096
+# Payloads per chunk handed from a worker process to the producer
+WORKER_CHUNK_SIZE = 500
+
+class LogTemplateEngine:
+    """Assemble log entries from pre-rendered pools of Faker values
+    
+    Faker is only called while the pools are built; each record is then put together
+    from cheap random indexing into the pools, so one process renders tens of thousands
+    of logs per second. Output has the same shape as LogGenerator's templates. skew maps
+    a load profile's skew dimensions to Zipf exponents for the values picked along them.
+    """
+    
+    def __init__(self, seed: int = None, pool_size: int = TEMPLATE_POOL_SIZE, skew: dict = None):
+        self.rng = random.Random(seed)
+        self.skew = dict(skew or {})
+        self.samplers = {}
+        faker = Faker()
+        faker.seed_instance(seed)
+        
+        self.ips = [faker.ipv4() for _ in range(pool_size)]
+        self.hostnames = [faker.hostname() for _ in range(pool_size)]
+        self.sentences = [faker.sentence() for _ in range(pool_size)]
+        self.user_agents = [faker.user_agent() for _ in range(pool_size)]
+        self.stack_traces = [faker.text(max_nb_chars=200) for _ in range(max(1, pool_size // 8))]
+        
+        self.log_templates = {
+            'apache': self._render_apache_log,
+            'application': self._render_application_log,
+            'error': self._render_error_log,
+            'api': self._render_api_log
+        }
+        self.log_types = list(self.log_templates)
+        # Share of rendered logs that are ERROR logs, which error storms top up
+        if 'sources' in self.skew:
+            self.error_share = ZipfSampler(len(self.log_types), self.skew['sources']).probability(
+                self.log_types.index('error'))
+        else:
+            self.error_share = 1 / len(self.log_types)
+        self._clock_second = None
+        self._clock_iso = ''
+        self._clock_apache = ''
+    
+    def _pick(self, values: list, dimension: str = None):
+        if dimension in self.skew:
+            sampler = self.samplers.get((dimension, len(values)))
+            if sampler is None:
+                sampler = self.samplers[dimension, len(values)] = ZipfSampler(
+                    len(values), self.skew[dimension], self.rng)
+            return values[sampler.sample()]
+        return values[int(self.rng.random() * len(values))]
+    
+    def _now(self) -> tuple:
+        """(ISO timestamp, Apache timestamp) of the current time, formatted once per second"""
+        now = time.time()
+        second = int(now)
+        if second != self._clock_second:
+            moment = datetime.fromtimestamp(second)
+            self._clock_second = second
+            self._clock_iso = moment.isoformat()
+            self._clock_apache = moment.strftime('%d/%b/%Y:%H:%M:%S %z')
+        return f'{self._clock_iso}.{int((now - second) * 1e6):06d}', self._clock_apache
+    
+    def _uuid(self) -> str:
+        value = f'{self.rng.getrandbits(128):032x}'
+        return f'{value[:8]}-{value[8:12]}-4{value[13:16]}-{value[16:20]}-{value[20:]}'
+    
+    def _render_apache_log(self) -> dict:
+        timestamp, apache_timestamp = self._now()
+        method = self._pick(['GET', 'POST', 'PUT', 'DELETE'])
+        path = self._pick(['/api/users', '/api/orders', '/health', '/metrics'], 'paths')
+        status = self._pick([200, 404, 500, 301, 403])
+        size = self.rng.randint(100, 5000)
+        
+        return {
+            'source': 'apache',
+            'message': f'{self._pick(self.ips)} - - [{apache_timestamp}] "{method} {path} HTTP/1.1" {status} {size}',
+            'timestamp': timestamp
+        }
+    
+    def _render_application_log(self) -> dict:
+        return {
+            'source': 'application',
+            'level': self._pick(['INFO', 'DEBUG', 'WARNING']),
+            'service': self._pick(['user-service', 'order-service', 'payment-service'], 'services'),
+            'host': self._pick(self.hostnames, 'hosts'),
+            'message': self._pick(self.sentences),
+            'timestamp': self._now()[0],
+            'fields': {
+                'request_id': self._uuid(),
+                'user_id': self.rng.randint(1, 10000),
+                'duration_ms': self.rng.randint(10, 1000)
+            }
+        }
+    
+    def _render_error_log(self) -> dict:
+        return {
+            'source': 'application',
+            'level': 'ERROR',
+            'service': self._pick(['api-server', 'database', 'cache'], 'services'),
+            'host': self._pick(self.hostnames, 'hosts'),
+            'message': self._pick([
+                'Database connection timeout',
+                'Authentication failed',
+                'Memory allocation error',
+                'Network connection refused',
+                'File not found'
+            ]),
+            'timestamp': self._now()[0],
+            'fields': {
+                'error_code': f'ERR{self.rng.randint(1000, 9999)}',
+                'stack_trace': self._pick(self.stack_traces)
+            }
+        }
+    
+    def _render_api_log(self) -> dict:
+        return {
+            'source': 'api-gateway',
+            'level': 'INFO',
+            'message': 'API Request processed',
+            'timestamp': self._now()[0],
+            'fields': {
+                'endpoint': self._pick(['/api/v1/users', '/api/v1/orders', '/api/v1/products'], 'paths'),
+                'method': self._pick(['GET', 'POST', 'PUT', 'DELETE']),
+                'response_time': self.rng.randint(10, 2000),
+                'status_code': self._pick([200, 201, 400, 404, 500]),
+                'client_ip': self._pick(self.ips),
+                'user_agent': self._pick(self.user_agents)
+            }
+        }
+    
+    def generate_log(self, log_type: str = None) -> dict:
+        """Render a single log entry"""
+        if log_type is None:
+            log_type = self._pick(self.log_types, 'sources')
+        
+        return self.log_templates[log_type]()
+    
+    def render_payloads(self, count: int) -> list:
+        """Render count log entries as JSON-encoded bytes"""
+        templates = [self.log_templates[log_type] for log_type in self.log_types]
+        return [json.dumps(self._pick(templates, 'sources')()).encode('utf-8') for _ in range(count)]
+    
+    def render_oversized(self, size: int) -> bytes:
+        """Render an error log whose stack trace pads the encoded payload out to about size bytes"""
+        log = self._render_error_log()
+        trace = log['fields']['stack_trace'].replace('\n', ' ') + ' '
+        log['fields']['stack_trace'] = ''
+        padding = max(0, size - len(json.dumps(log)))
+        log['fields']['stack_trace'] = (trace * (padding // len(trace) + 1))[:padding]
+        return json.dumps(log).encode('utf-8')
+
+def _render_worker(seed: int, pool_size: int, chunk_size: int, chunks: multiprocessing.Queue, stop,
+                   skew: dict = None):
+    """Worker process body: render chunks of payloads until told to stop"""
+    engine = LogTemplateEngine(seed, pool_size, skew)
+    while not stop.is_set():
+        chunk = engine.render_payloads(chunk_size)
+        while not stop.is_set():
+            try:
+                chunks.put(chunk, timeout=0.2)
+                break
+            except queue.Full:
+                continue
+
+def parallel_payloads(workers: int, seed: int = None, pool_size: int = TEMPLATE_POOL_SIZE,
+                      chunk_size: int = WORKER_CHUNK_SIZE, skew: dict = None):
+    """Yield JSON-encoded log payloads rendered by a pool of worker processes
+    
+    Worker i is seeded with seed + i, so each worker's stream is reproducible. The
+    workers are stopped when the generator is closed.
+    """
+    base_seed = seed if seed is not None else random.randrange(2 ** 32)
+    chunks = multiprocessing.Queue(maxsize=workers * 4)
+    stop = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(
+            target=_render_worker, args=(base_seed + index, pool_size, chunk_size, chunks, stop, skew), daemon=True
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    
+    try:
+        while True:
+            yield from chunks.get()
+    finally:
+        stop.set()
+        # Drain so workers blocked on a full queue can see the stop event and exit
+        while any(process.is_alive() for process in processes):
+            try:
+                chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in processes:
+            process.join()
+
+class ProducerStats:
+    """Thread-safe counters for a producer run"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.records_sent = 0
+        self.records_failed = 0
+        self.bytes_sent = 0
+        self.requests = 0
+        self.retried_records = 0
+        self.throttled_records = 0
+        self.errors = {}
+    
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+    
+    def add_error(self, code: str, count: int = 1):
+        with self.lock:
+            self.errors[code] = self.errors.get(code, 0) + count
+    
+    def summary(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'records_sent': self.records_sent,
+                'records_failed': self.records_failed,
+                'records_per_second': round(self.records_sent / elapsed, 1) if elapsed else 0.0,
+                'megabytes_per_second': round(self.bytes_sent / elapsed / 1024 / 1024, 3) if elapsed else 0.0,
+                'put_records_calls': self.requests,
+                'retried_records': self.retried_records,
+                'throttled_records': self.throttled_records,
+                'errors': dict(self.errors)
+            }
+
+# Local sinks hand data to files, stdout or HTTP in blocks of about this size
+SINK_BLOCK_BYTES = 1024 * 1024
+
+class NDJSONSink:
+    """Write payloads as NDJSON lines to a binary stream, one block per batch"""
+    
+    def __init__(self, stream, owns_stream: bool = True):
+        self.stream = stream
+        self.owns_stream = owns_stream
+    
+    @classmethod
+    def open(cls, path: str, compress: bool = None) -> 'NDJSONSink':
+        """NDJSON file sink, gzip-compressed when compress is set or the path ends in .gz"""
+        if compress is None:
+            compress = path.endswith('.gz')
+        if compress:
+            return cls(io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6), SINK_BLOCK_BYTES))
+        return cls(open(path, 'wb', buffering=SINK_BLOCK_BYTES))
+    
+    def write(self, payloads: list) -> int:
+        block = b'\n'.join(payloads) + b'\n'
+        self.stream.write(block)
+        return len(block)
+    
+    def close(self):
+        self.stream.flush()
+        if self.owns_stream:
+            self.stream.close()
+
+class KinesisEventSink:
+    """Write Lambda Kinesis events, one JSON event per line, that lambda_handler can consume directly
+    
+    Like real event source mappings, each event carries records of a single shard with
+    increasing sequence numbers.
+    """
+    
+    def __init__(self, path: str, shards: int = 10, records_per_event: int = 100, region: str = 'us-east-1',
+                 stream_name: str = 'log-generator', shard_sampler: ZipfSampler = None):
+        self.sink = NDJSONSink.open(path)
+        self.shards = max(1, shards)
+        self.records_per_event = records_per_event
+        self.region = region
+        self.stream_arn = f'arn:aws:kinesis:{region}:000000000000:stream/{stream_name}'
+        self.shard_sampler = shard_sampler
+        self.next_shard = 0
+        self.sequence_numbers = [0] * self.shards
+        self.pending = [[] for _ in range(self.shards)]
+    
+    def record(self, payload: bytes, shard: int) -> dict:
+        self.sequence_numbers[shard] += 1
+        sequence_number = f'{self.sequence_numbers[shard]:020d}'
+        return {
+            'kinesis': {
+                'kinesisSchemaVersion': '1.0',
+                'partitionKey': f'shard-{shard}',
+                'sequenceNumber': sequence_number,
+                'data': base64.b64encode(payload).decode('ascii'),
+                'approximateArrivalTimestamp': time.time()
+            },
+            'eventSource': 'aws:kinesis',
+            'eventVersion': '1.0',
+            'eventID': f'shardId-{shard:012d}:{sequence_number}',
+            'eventName': 'aws:kinesis:record',
+            'awsRegion': self.region,
+            'eventSourceARN': self.stream_arn
+        }
+    
+    def write(self, payloads: list) -> int:
+        events = []
+        for payload in payloads:
+            if self.shard_sampler is not None:
+                shard = self.shard_sampler.sample()
+            else:
+                shard = self.next_shard
+                self.next_shard = (shard + 1) % self.shards
+            pending = self.pending[shard]
+            pending.append(self.record(payload, shard))
+            if len(pending) == self.records_per_event:
+                events.append(json.dumps({'Records': pending}).encode('utf-8'))
+                self.pending[shard] = []
+        
+        return self.sink.write(events) if events else 0
+    
+    def close(self):
+        events = [json.dumps({'Records': pending}).encode('utf-8') for pending in self.pending if pending]
+        if events:
+            self.sink.write(events)
+        self.sink.close()
+
+class HTTPSink:
+    """POST payloads as NDJSON to a local HTTP endpoint over one keep-alive connection"""
+    
+    def __init__(self, url: str, timeout: float = 30.0):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=timeout)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += f'?{parts.query}'
+        self.buffer = []
+        self.buffered_bytes = 0
+    
+    def post(self, body: bytes):
+        # One reconnect covers a keep-alive connection the server has since closed
+        for attempt in range(2):
+            try:
+                self.connection.request('POST', self.path, body=body,
+                                        headers={'Content-Type': 'application/x-ndjson'})
+                response = self.connection.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                if attempt:
+                    raise
+        
+        if response.status >= 300:
+            raise RuntimeError(f'HTTP sink returned {response.status} {response.reason}')
+    
+    def write(self, payloads: list) -> int:
+        block = b'\n'.join(payloads) + b'\n'
+        self.buffer.append(block)
+        self.buffered_bytes += len(block)
+        if self.buffered_bytes >= SINK_BLOCK_BYTES:
+            self.flush()
+        return len(block)
+    
+    def flush(self):
+        if self.buffer:
+            body = b''.join(self.buffer)
+            self.buffer = []
+            self.buffered_bytes = 0
+            self.post(body)
+    
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+
 class LogGenerator:
-    def __init__(self, stream_name: str, region: str = 'us-east-1'):
-        self.kinesis_client = boto3.client('kinesis', region_name=region)
+    def __init__(self, stream_name: str = None, region: str = 'us-east-1', shards: int = 10,
+                 concurrency: int = 8, max_retries: int = 5):
+        # One pooled connection per concurrent put_records call; local sinks need no client
+        self.kinesis_client = boto3.client(
+            'kinesis', region_name=region,
+            config=Config(max_pool_connections=max(concurrency, 10))
+        ) if stream_name else None
         self.stream_name = stream_name
+        self.shards = max(1, shards)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.next_shard = 0
+        # Set to a ZipfSampler over the shards to concentrate records on hot shards
+        self.shard_sampler = None
+        self.stats = ProducerStats()
         
         # Log templates
         self.log_templates = {
@@ -113,13 +523,28 @@ class LogGenerator:
         
         return self.log_templates[log_type]()
     
+    def partition(self) -> dict:
+        """Partition key and explicit hash key for the next record, cycling evenly over the shards
+        unless a shard sampler skews them"""
+        if self.shard_sampler is not None:
+            shard = self.shard_sampler.sample()
+        else:
+            shard = self.next_shard
+            self.next_shard = (shard + 1) % self.shards
+        # The middle of the shard's slice of the hash key space, assuming evenly split shards
+        width = KINESIS_HASH_KEY_SPACE // self.shards
+        return {
+            'PartitionKey': f'shard-{shard}',
+            'ExplicitHashKey': str(width * shard + width // 2)
+        }
+    
     def send_to_kinesis(self, log_entry: dict):
         """Send log entry to Kinesis stream"""
         try:
             response = self.kinesis_client.put_record(
                 StreamName=self.stream_name,
                 Data=json.dumps(log_entry),
-                PartitionKey=str(random.randint(1, 10))
+                **self.partition()
             )
             return response
         except Exception as e:
@@ -145,17 +570,265 @@ class LogGenerator:
         
         print(f"Generated {count} logs in {duration} seconds")
 
+    def build_batches(self, payloads):
+        """Pack JSON-encoded log payloads into put_records batches within the record count and size limits"""
+        batch = []
+        batch_bytes = 0
+        
+        for payload in payloads:
+            record = dict(Data=payload, **self.partition())
+            size = len(record['Data']) + len(record['PartitionKey'])
+            if size > KINESIS_MAX_RECORD_BYTES:
+                self.stats.add(records_failed=1)
+                self.stats.add_error('RecordTooLarge')
+                continue
+            
+            if batch and (len(batch) == KINESIS_MAX_BATCH_RECORDS or batch_bytes + size > KINESIS_MAX_BATCH_BYTES):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            
+            batch.append(record)
+            batch_bytes += size
+        
+        if batch:
+            yield batch
+    
+    def send_batch(self, records: list):
+        """Send one put_records batch, retrying only the entries that failed"""
+        pending = records
+        
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.add(retried_records=len(pending))
+                # Exponential backoff with full jitter, capped at two seconds
+                time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+            
+            try:
+                response = self.kinesis_client.put_records(StreamName=self.stream_name, Records=pending)
+            except Exception as e:
+                code = getattr(e, 'response', {}).get('Error', {}).get('Code', type(e).__name__)
+                self.stats.add(requests=1)
+                self.stats.add_error(code)
+                if code == 'ProvisionedThroughputExceededException':
+                    self.stats.add(throttled_records=len(pending))
+                continue
+            
+            failed = []
+            sent_bytes = 0
+            for record, result in zip(pending, response['Records']):
+                error_code = result.get('ErrorCode')
+                if error_code is None:
+                    sent_bytes += len(record['Data']) + len(record['PartitionKey'])
+                    continue
+                failed.append(record)
+                if error_code == 'ProvisionedThroughputExceededException':
+                    self.stats.add(throttled_records=1)
+                else:
+                    self.stats.add_error(error_code)
+            
+            self.stats.add(requests=1, records_sent=len(pending) - len(failed), bytes_sent=sent_bytes)
+            
+            pending = failed
+            if not pending:
+                return
+        
+        self.stats.add(records_failed=len(pending))
+    
+    def generate_batched_logs(self, rate: int = 1000, duration: int = 60, report_interval: float = 5.0,
+                              workers: int = 0, seed: int = None, sink=None, count: int = None,
+                              profile: LoadProfile = None):
+        """Generate logs for the duration (or until count logs) and send them in batches
+        
+        Batches go to Kinesis as concurrent put_records calls, or to sink (NDJSONSink,
+        KinesisEventSink or HTTPSink) when one is given; progress then goes to stderr so
+        stdout can carry the logs. With workers > 0 logs are rendered from pre-rendered
+        pools by that many processes instead of calling Faker per record in this one.
+        
+        Records are released by a RateScheduler following profile (a steady rate when none
+        is given), with rate as its base rate; rate 0 sends as fast as possible. A profile's
+        skew and traffic shaping render logs through LogTemplateEngine even without workers.
+        """
+        status = sys.stderr if sink is not None else sys.stdout
+        target = type(sink).__name__ if sink is not None else \
+            f"{self.concurrency} concurrent batches over {self.shards} shards"
+        shape = f", profile {profile.name}" if profile is not None else ""
+        print(f"Generating {count or 'unlimited'} logs at {rate or 'unlimited'} logs/second for {duration} seconds "
+              f"({target}{shape})...", file=status)
+        
+        self.stats = ProducerStats()
+        skew = {}
+        engine = shaper = None
+        if profile is not None:
+            # Partition key skew is applied by the shard sampler, not while rendering
+            skew = {dimension: exponent for dimension, exponent in profile.skew.items()
+                    if dimension != 'partition_keys'}
+            engine = LogTemplateEngine(seed, skew=skew)
+            shaper = TrafficShaper(profile, engine, random.Random(seed))
+        elif rate:
+            profile = LoadProfile.from_dict({'phases': [{'duration': duration, 'rate': 1.0}]}, 'steady')
+        scheduler = RateScheduler(profile, rate) if rate else None
+        # Bound the batches waiting for a sender so generation cannot run ahead of Kinesis
+        in_flight = threading.BoundedSemaphore(self.concurrency * 2)
+        started = deadline = next_report = None
+        
+        def rendered_payloads():
+            if workers:
+                source = parallel_payloads(workers, seed, skew=skew)
+                try:
+                    yield from source
+                finally:
+                    source.close()
+            elif engine is not None:
+                # One at a time, so timestamps match when the schedule releases each log
+                while True:
+                    yield json.dumps(engine.generate_log()).encode('utf-8')
+            else:
+                while True:
+                    yield json.dumps(self.generate_log()).encode('utf-8')
+        
+        def payload_chunks():
+            """Lists of up to one batch of payloads, each released when the schedule makes it due
+            
+            The clocks start once the first log is rendered, so building template pools and
+            starting worker processes does not eat into the run.
+            """
+            nonlocal started, deadline, next_report
+            produced = 0
+            rendered = rendered_payloads()
+            try:
+                source = itertools.chain([next(rendered)], rendered)
+                self.stats = ProducerStats()
+                started = time.monotonic()
+                deadline = started + duration
+                next_report = started + report_interval
+                while True:
+                    size = KINESIS_MAX_BATCH_RECORDS if count is None else \
+                        min(KINESIS_MAX_BATCH_RECORDS, count - produced)
+                    if size <= 0 or time.monotonic() >= deadline:
+                        return
+                    if scheduler is not None:
+                        # A zero-rate phase can outlast the run; stop waiting at the deadline
+                        size = scheduler.wait(size, timeout=deadline - time.monotonic())
+                        if not size:
+                            return
+                    
+                    chunk = list(itertools.islice(source, size))
+                    if shaper is not None:
+                        shaper.shape(chunk, scheduler.elapsed() if scheduler is not None else
+                                     time.monotonic() - started)
+                    produced += len(chunk)
+                    yield chunk
+                    
+                    if time.monotonic() >= next_report:
+                        next_report += report_interval
+                        summary = self.stats.summary()
+                        print(f"Sent {summary['records_sent']} logs ({summary['records_per_second']}/s), "
+                              f"throttled {summary['throttled_records']}, failed {summary['records_failed']}",
+                              file=status)
+            finally:
+                rendered.close()
+        
+        def send(batch):
+            try:
+                self.send_batch(batch)
+            finally:
+                in_flight.release()
+        
+        if sink is not None:
+            try:
+                for chunk in payload_chunks():
+                    self.stats.add(records_sent=len(chunk), bytes_sent=sink.write(chunk))
+            finally:
+                sink.close()
+        else:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                for chunk in payload_chunks():
+                    for batch in self.build_batches(chunk):
+                        in_flight.acquire()
+                        executor.submit(send, batch)
+        
+        summary = self.stats.summary()
+        if scheduler is not None:
+            summary['max_schedule_lag_seconds'] = round(scheduler.max_lag, 4)
+        if shaper is not None:
+            summary['error_storm_records'] = shaper.storm_records
+            summary['oversized_records'] = shaper.oversized_records
+        print(json.dumps(summary, indent=2), file=status)
+        return summary
+
 def main():
     parser = argparse.ArgumentParser(description='Generate logs for LogX platform')
-    parser.add_argument('--stream', required=True, help='Kinesis stream name')
-    parser.add_argument('--rate', type=int, default=10, help='Logs per second')
-    parser.add_argument('--duration', type=int, default=60, help='Duration in seconds')
+    parser.add_argument('--sink', choices=['kinesis', 'file', 'stdout', 'events', 'http'], default='kinesis',
+                        help='kinesis: the --stream; file: NDJSON (gzip for .gz) at --output; stdout: NDJSON; '
+                             'events: Lambda Kinesis events, one per line, at --output; http: NDJSON POSTs to --url')
+    parser.add_argument('--stream', help='Kinesis stream name (kinesis sink)')
+    parser.add_argument('--output', help='Output file (file and events sinks)')
+    parser.add_argument('--url', help='Endpoint URL (http sink)')
+    parser.add_argument('--records-per-event', type=int, default=100, help='Records per Lambda event (events sink)')
+    parser.add_argument('--count', type=int, help='Stop after this many logs (batch mode and local sinks)')
+    parser.add_argument('--rate', type=int, default=10,
+                        help='Logs per second; the base rate that --profile rates are multiples of')
+    parser.add_argument('--duration', type=int,
+                        help='Duration in seconds (default: one cycle of --profile, otherwise 60)')
+    parser.add_argument('--profile',
+                        help='Traffic shape: a built-in profile (steady, ramp, step, diurnal, burst, error-storm, '
+                             'hot-shard, oversized) or a JSON profile file; implies batch mode')
     parser.add_argument('--region', default='us-east-1', help='AWS region')
+    parser.add_argument('--mode', choices=['record', 'batch'], default='record',
+                        help='record: one put_record per log; batch: concurrent put_records batches')
+    parser.add_argument('--shards', type=int, default=10, help='Shards to spread partition keys over')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent put_records calls (batch mode)')
+    parser.add_argument('--max-retries', type=int, default=5, help='Retries for failed entries (batch mode)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Processes rendering logs from pre-rendered pools (batch mode; 0 renders in-process with Faker)')
+    parser.add_argument('--seed', type=int, help='Random seed; worker i uses seed + i')
     
     args = parser.parse_args()
     
-    generator = LogGenerator(args.stream, args.region)
-    generator.generate_continuous_logs(args.rate, args.duration)
+    if args.sink == 'kinesis' and not args.stream:
+        parser.error('--stream is required for the kinesis sink')
+    if args.sink in ('file', 'events') and not args.output:
+        parser.error(f'--output is required for the {args.sink} sink')
+    if args.sink == 'http' and not args.url:
+        parser.error('--url is required for the http sink')
+    
+    profile = None
+    if args.profile:
+        try:
+            profile = LoadProfile.load(args.profile)
+        except (ValueError, KeyError, TypeError) as e:
+            parser.error(f'invalid --profile: {e}')
+        if not args.rate:
+            parser.error('--profile needs a base --rate above 0')
+    duration = args.duration if args.duration is not None else (int(profile.duration) if profile else 60)
+    
+    if args.seed is not None:
+        random.seed(args.seed)
+        Faker.seed(args.seed)
+    
+    generator = LogGenerator(args.stream, args.region, shards=args.shards,
+                             concurrency=args.concurrency, max_retries=args.max_retries)
+    shard_sampler = None
+    if profile is not None and 'partition_keys' in profile.skew:
+        shard_sampler = ZipfSampler(generator.shards, profile.skew['partition_keys'], random.Random(args.seed))
+        generator.shard_sampler = shard_sampler
+    sink = None
+    if args.sink == 'file':
+        sink = NDJSONSink.open(args.output)
+    elif args.sink == 'stdout':
+        sink = NDJSONSink(sys.stdout.buffer, owns_stream=False)
+    elif args.sink == 'events':
+        sink = KinesisEventSink(args.output, shards=args.shards, records_per_event=args.records_per_event,
+                                region=args.region, shard_sampler=shard_sampler)
+    elif args.sink == 'http':
+        sink = HTTPSink(args.url)
+    
+    if sink is not None or args.mode == 'batch' or profile is not None:
+        generator.generate_batched_logs(args.rate, duration, workers=args.workers, seed=args.seed,
+                                        sink=sink, count=args.count, profile=profile)
+    else:
+        generator.generate_continuous_logs(args.rate, duration)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
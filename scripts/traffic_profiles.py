@@ -0,0 +1,340 @@
+"""
+Traffic Shape Profiles for the Log Generator
+Declarative load profiles (ramp, step, sinusoidal diurnal, error storms, Zipf-skewed keys
+and oversized messages) and the open-loop scheduler that paces records along them
+"""
+
+import bisect
+import json
+import math
+import os
+import random
+import time
+
+# The scheduler releases records on ticks of this length, so a record is at most one
+# tick late while the producer keeps up, and batches hold about rate * tick records
+SCHEDULER_TICK = 0.01
+
+# Dimensions a profile can skew: the log template mix, the service, host and request path
+# fields inside the logs, and the shard each record's partition key lands on
+SKEW_DIMENSIONS = ('sources', 'services', 'hosts', 'paths', 'partition_keys')
+
+SHAPES = ('constant', 'ramp', 'step', 'sine')
+
+# Built-in profiles. Rates are multiples of the generator's --rate; times are in seconds
+# from the start of the profile, which repeats once its phases run out.
+PROFILES = {
+    'steady': {
+        'phases': [{'shape': 'constant', 'duration': 60, 'rate': 1.0}]
+    },
+    'ramp': {
+        'phases': [{'shape': 'ramp', 'duration': 300, 'from': 0.1, 'to': 1.0}]
+    },
+    'step': {
+        'phases': [{'shape': 'step', 'duration': 300, 'from': 0.25, 'to': 1.0, 'steps': 4}]
+    },
+    'diurnal': {
+        'phases': [{'shape': 'sine', 'duration': 600, 'mean': 0.55, 'amplitude': 0.45}]
+    },
+    'burst': {
+        'phases': [
+            {'shape': 'constant', 'duration': 50, 'rate': 0.2},
+            {'shape': 'constant', 'duration': 10, 'rate': 1.0}
+        ]
+    },
+    'error-storm': {
+        'phases': [{'shape': 'constant', 'duration': 120, 'rate': 1.0}],
+        'storms': [{'start': 60, 'duration': 20, 'error_ratio': 0.9}]
+    },
+    'hot-shard': {
+        'phases': [{'shape': 'constant', 'duration': 60, 'rate': 1.0}],
+        'skew': {'partition_keys': 2.0, 'services': 1.2, 'hosts': 1.1, 'paths': 1.2}
+    },
+    'oversized': {
+        'phases': [{'shape': 'constant', 'duration': 60, 'rate': 1.0}],
+        'oversized': {'ratio': 0.001, 'bytes': 512 * 1024}
+    }
+}
+
+class ZipfSampler:
+    """Draw ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** exponent
+
+    Rank 0 is the hottest key; an exponent of 0 is uniform and larger exponents
+    concentrate more of the traffic on the first few ranks.
+    """
+
+    def __init__(self, n: int, exponent: float, rng: random.Random = None):
+        self.rng = rng or random.Random()
+        self.cumulative = []
+        total = 0.0
+        for rank in range(n):
+            total += 1.0 / (rank + 1) ** exponent
+            self.cumulative.append(total)
+        self.total = total
+
+    def probability(self, rank: int) -> float:
+        previous = self.cumulative[rank - 1] if rank else 0.0
+        return (self.cumulative[rank] - previous) / self.total
+
+    def sample(self) -> int:
+        return bisect.bisect_right(self.cumulative, self.rng.random() * self.total)
+
+class Phase:
+    """One segment of a profile's rate curve, with the rate and its integral at a time into the segment"""
+
+    def __init__(self, spec: dict):
+        self.shape = spec.get('shape', 'constant')
+        if self.shape not in SHAPES:
+            raise ValueError(f"Unknown phase shape {self.shape!r}; expected one of {', '.join(SHAPES)}")
+        self.duration = float(spec['duration'])
+        if self.duration <= 0:
+            raise ValueError('Phase duration must be positive')
+
+        if self.shape == 'constant':
+            self.start_rate = self.end_rate = float(spec['rate'])
+        elif self.shape in ('ramp', 'step'):
+            self.start_rate = float(spec['from'])
+            self.end_rate = float(spec['to'])
+        else:
+            self.mean = float(spec['mean'])
+            self.amplitude = float(spec['amplitude'])
+            self.period = float(spec.get('period', self.duration))
+            if not 0 <= self.amplitude <= self.mean or self.period <= 0:
+                raise ValueError('Sine phases need 0 <= amplitude <= mean and a positive period')
+            self.start_rate = self.end_rate = self.mean - self.amplitude
+        if min(self.start_rate, self.end_rate) < 0:
+            raise ValueError('Phase rates cannot be negative')
+
+        if self.shape == 'step':
+            steps = int(spec.get('steps', 4))
+            if steps < 1:
+                raise ValueError('Step phases need at least one step')
+            span = self.end_rate - self.start_rate
+            self.levels = [self.start_rate + span * index / max(1, steps - 1) for index in range(steps)]
+            self.step_width = self.duration / steps
+            self.level_volumes = [0.0]
+            for level in self.levels:
+                self.level_volumes.append(self.level_volumes[-1] + level * self.step_width)
+
+    def rate(self, t: float) -> float:
+        if self.shape == 'constant':
+            return self.start_rate
+        if self.shape == 'ramp':
+            return self.start_rate + (self.end_rate - self.start_rate) * t / self.duration
+        if self.shape == 'step':
+            return self.levels[min(int(t / self.step_width), len(self.levels) - 1)]
+        # Starts at the trough, like traffic climbing out of the night
+        return self.mean - self.amplitude * math.cos(2 * math.pi * t / self.period)
+
+    def volume(self, t: float) -> float:
+        """Integral of the rate from the start of the phase to t"""
+        if self.shape == 'constant':
+            return self.start_rate * t
+        if self.shape == 'ramp':
+            return self.start_rate * t + (self.end_rate - self.start_rate) * t * t / (2 * self.duration)
+        if self.shape == 'step':
+            index = min(int(t / self.step_width), len(self.levels) - 1)
+            return self.level_volumes[index] + self.levels[index] * (t - index * self.step_width)
+        angle = 2 * math.pi * t / self.period
+        return self.mean * t - self.amplitude * self.period / (2 * math.pi) * math.sin(angle)
+
+class LoadProfile:
+    """A declarative traffic shape: rate phases, error storms, key skew and oversized messages
+
+    Profiles are plain dicts (or JSON files) of this form, with rates given as multiples of
+    the base rate and times in seconds:
+
+        {
+            "phases": [{"shape": "ramp", "duration": 120, "from": 0.1, "to": 1.0},
+                       {"shape": "sine", "duration": 600, "mean": 0.6, "amplitude": 0.4}],
+            "storms": [{"start": 300, "duration": 30, "error_ratio": 0.8}],
+            "skew": {"partition_keys": 1.5, "paths": 1.1},
+            "oversized": {"ratio": 0.001, "bytes": 524288}
+        }
+
+    Phase shapes are constant (rate), ramp (from, to), step (from, to, steps) and sine
+    (mean, amplitude, optional period). The profile repeats after its last phase.
+    """
+
+    def __init__(self, phases: list, storms: list = (), skew: dict = None, oversized: dict = None,
+                 name: str = 'custom'):
+        if not phases:
+            raise ValueError('A load profile needs at least one phase')
+        self.name = name
+        self.phases = [Phase(spec) for spec in phases]
+        self.starts = []
+        self.volumes = []
+        elapsed = volume = 0.0
+        for phase in self.phases:
+            self.starts.append(elapsed)
+            self.volumes.append(volume)
+            elapsed += phase.duration
+            volume += phase.volume(phase.duration)
+        self.duration = elapsed
+        self.cycle_volume = volume
+        if volume <= 0:
+            raise ValueError('A load profile needs a non-zero rate in at least one phase')
+
+        self.storms = []
+        for storm in storms:
+            ratio = float(storm['error_ratio'])
+            if not 0 <= ratio <= 1:
+                raise ValueError('Storm error_ratio must be between 0 and 1')
+            self.storms.append((float(storm['start']), float(storm['start']) + float(storm['duration']), ratio))
+
+        self.skew = {dimension: float(exponent) for dimension, exponent in (skew or {}).items()}
+        unknown = set(self.skew) - set(SKEW_DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown skew dimensions {sorted(unknown)}; expected {', '.join(SKEW_DIMENSIONS)}")
+
+        oversized = oversized or {}
+        self.oversized_ratio = float(oversized.get('ratio', 0.0))
+        self.oversized_bytes = int(oversized.get('bytes', 512 * 1024))
+        if not 0 <= self.oversized_ratio <= 1:
+            raise ValueError('Oversized ratio must be between 0 and 1')
+
+    @classmethod
+    def from_dict(cls, spec: dict, name: str = 'custom') -> 'LoadProfile':
+        unknown = set(spec) - {'phases', 'storms', 'skew', 'oversized'}
+        if unknown:
+            raise ValueError(f'Unknown load profile keys {sorted(unknown)}')
+        return cls(spec.get('phases', []), spec.get('storms', []), spec.get('skew'), spec.get('oversized'), name)
+
+    @classmethod
+    def load(cls, name_or_path: str) -> 'LoadProfile':
+        """A built-in profile by name, or a profile from a JSON file"""
+        if name_or_path in PROFILES:
+            return cls.from_dict(PROFILES[name_or_path], name_or_path)
+        if not os.path.exists(name_or_path):
+            raise ValueError(f"Unknown load profile {name_or_path!r}; built-in profiles are "
+                             f"{', '.join(PROFILES)}, or pass a JSON file")
+        with open(name_or_path) as profile_file:
+            return cls.from_dict(json.load(profile_file), os.path.basename(name_or_path))
+
+    def _locate(self, elapsed: float) -> tuple:
+        """(cycles completed, phase index, time into that phase)"""
+        cycles, offset = divmod(elapsed, self.duration)
+        index = bisect.bisect_right(self.starts, offset) - 1
+        return cycles, index, offset - self.starts[index]
+
+    def rate(self, elapsed: float) -> float:
+        """Relative rate at elapsed seconds into the run"""
+        _, index, t = self._locate(elapsed)
+        return self.phases[index].rate(t)
+
+    def volume(self, elapsed: float) -> float:
+        """Integral of the relative rate from the start of the run to elapsed seconds"""
+        cycles, index, t = self._locate(elapsed)
+        return cycles * self.cycle_volume + self.volumes[index] + self.phases[index].volume(t)
+
+    def error_ratio(self, elapsed: float):
+        """Share of ERROR logs a storm calls for at elapsed seconds, or None outside storms"""
+        offset = elapsed % self.duration
+        ratios = [ratio for start, end, ratio in self.storms if start <= offset < end]
+        return max(ratios) if ratios else None
+
+class RateScheduler:
+    """Release records along a profile at a base rate, open-loop
+
+    The number of records due at any moment is the integral of the rate since a fixed
+    start, so oversleeping or a stalled sender never shifts the schedule: the records it
+    delayed are simply due at once on the next call, as they would be for real clients.
+    max_lag is the longest a record waited between falling due and being released.
+    """
+
+    def __init__(self, profile: LoadProfile, base_rate: float, tick: float = SCHEDULER_TICK):
+        self.profile = profile
+        self.base_rate = base_rate
+        self.tick = tick
+        self.started = None
+        self.next_tick = None
+        self.released = 0
+        self.max_lag = 0.0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started if self.started is not None else 0.0
+
+    def _advance_tick(self, now: float):
+        """Move next_tick to the first tick boundary after now"""
+        ticks = math.floor((now - self.started) / self.tick) + 1
+        self.next_tick = self.started + ticks * self.tick
+        if self.next_tick <= now:
+            # elapsed / tick rounded down across a boundary; sleeping zero would spin
+            self.next_tick += self.tick
+
+    def due_time(self, record: int, elapsed: float) -> float:
+        """Seconds into the run at which the record-th record fell due, given it has by elapsed"""
+        low, high = 0.0, elapsed
+        for _ in range(32):
+            middle = (low + high) / 2
+            if self.base_rate * self.profile.volume(middle) >= record:
+                high = middle
+            else:
+                low = middle
+        return high
+
+    def wait(self, limit: int, timeout: float = None) -> int:
+        """Block until records are due, then release up to limit of them
+
+        Records are released on tick boundaries, or as soon as limit of them are due.
+        Returns 0 if timeout seconds pass first, e.g. during a zero-rate phase.
+        """
+        if self.started is None:
+            self.started = self.next_tick = time.perf_counter()
+        stop = time.perf_counter() + timeout if timeout is not None else None
+
+        while True:
+            now = time.perf_counter()
+            elapsed = now - self.started
+            due = int(self.base_rate * self.profile.volume(elapsed)) - self.released
+            if due >= limit or (due > 0 and now >= self.next_tick):
+                break
+            if stop is not None and now >= stop:
+                return 0
+            if now >= self.next_tick:
+                self._advance_tick(now)
+            time.sleep(min(self.next_tick, stop) - now if stop is not None else self.next_tick - now)
+
+        if now >= self.next_tick:
+            self._advance_tick(now)
+        self.max_lag = max(self.max_lag, elapsed - self.due_time(self.released + 1, elapsed))
+
+        released = min(due, limit)
+        self.released += released
+        return released
+
+class TrafficShaper:
+    """Apply a profile's error storms and oversized messages to chunks of rendered payloads
+
+    The rate curve and key skew are applied where records are scheduled and rendered; the
+    time-dependent parts are applied here, on the producer side, so they line up with the
+    schedule even when payloads are rendered ahead by worker processes. engine is a
+    LogTemplateEngine rendering the replacement logs.
+    """
+
+    def __init__(self, profile: LoadProfile, engine, rng: random.Random = None):
+        self.profile = profile
+        self.engine = engine
+        self.rng = rng or random.Random()
+        self.storm_records = 0
+        self.oversized_records = 0
+
+    def shape(self, payloads: list, elapsed: float) -> list:
+        """Replace payloads in place with storm errors and oversized logs as the profile calls for"""
+        oversized = self.profile.oversized_ratio
+        # Rendered streams already carry error_share errors; top them up to the storm's ratio
+        storm_ratio = self.profile.error_ratio(elapsed)
+        base = self.engine.error_share
+        storm = (storm_ratio - base) / (1 - base) if storm_ratio is not None and storm_ratio > base else 0.0
+        if not oversized and not storm:
+            return payloads
+
+        for index in range(len(payloads)):
+            draw = self.rng.random()
+            if draw < oversized:
+                payloads[index] = self.engine.render_oversized(self.profile.oversized_bytes)
+                self.oversized_records += 1
+            elif draw < oversized + storm:
+                payloads[index] = json.dumps(self.engine.generate_log('error')).encode('utf-8')
+                self.storm_records += 1
+        return payloads
@@ -13,6 +13,10 @@ resource "aws_lambda_function" "log_parser" {
       OPENSEARCH_ENDPOINT = aws_opensearch_domain.logs.endpoint
       S3_BUCKET          = aws_s3_bucket.log_archive.bucket
       INDEX_NAME         = "logs"
+      # Fine-grained access control uses the internal user database and maps no IAM roles,
+      # so SigV4-signed requests would be refused; use the master user instead
+      OPENSEARCH_USERNAME = "admin"
+      OPENSEARCH_PASSWORD = random_password.opensearch_password.result
     }
   }
 
@@ -100,6 +104,9 @@ resource "aws_lambda_event_source_mapping" "kinesis_trigger" {
   function_name     = aws_lambda_function.log_parser.arn
   starting_position = "LATEST"
   batch_size        = 10
+
+  # Retry only from the first record the handler reports as failed
+  function_response_types = ["ReportBatchItemFailures"]
   
   depends_on = [aws_iam_role_policy.lambda_policy]
 }
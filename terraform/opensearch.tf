@@ -1,6 +1,7 @@
 resource "aws_opensearch_domain" "logs" {
   domain_name    = "${local.project_name}-logs"
-  engine_version = "OpenSearch_1.3"
+  # Point in time search, used by paginated search and export in the API, needs 2.4 or later
+  engine_version = "OpenSearch_2.11"
 
   cluster_config {
     instance_type  = var.opensearch_instance_type
@@ -1,7 +1,18 @@
+import gzip
+import json
 import pytest
-from api.search_api import app, LogSearchAPI
+import threading
+from api.search_api import app, LogSearchAPI, TTLCache, search_api, resolve_indices, snap_time_range, \
+    json_dumps, json_loads
 from unittest.mock import Mock, patch
 
+def opensearch_response(payload, status_code=200):
+    """Build a stubbed OpenSearch HTTP response from a dict or raw bytes"""
+    response = Mock()
+    response.status_code = status_code
+    response.content = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+    return response
+
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
@@ -17,13 +28,13 @@ class TestSearchAPI:
         data = response.get_json()
         assert data['status'] == 'healthy'
     
-    @patch('api.search_api.requests.post')
+    @patch('api.search_api.search_api.session.post')
     def test_search_logs(self, mock_post, client):
         """Test log search functionality"""
         # Mock OpenSearch response
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             'hits': {
                 'total': {'value': 1},
                 'hits': [
@@ -36,7 +47,7 @@ class TestSearchAPI:
                     }
                 ]
             }
-        }
+        }).encode('utf-8')
         mock_post.return_value = mock_response
         
         response = client.get('/api/search?q=error&level=ERROR')
@@ -44,6 +55,323 @@ class TestSearchAPI:
         data = response.get_json()
         assert 'hits' in data
     
+    @patch('api.search_api.search_api.session.post')
+    def test_search_uses_pooled_session(self, mock_post, client):
+        """Test that searches go through the shared session with timeouts"""
+        search_api.cache.clear()
+        mock_post.return_value = opensearch_response({'hits': {'total': {'value': 0}, 'hits': []}})
+        
+        client.get('/api/search?q=error')
+        client.get('/api/search?q=timeout')
+        
+        assert mock_post.call_count == 2
+        for call in mock_post.call_args_list:
+            assert call.args[0].endswith('/logs-*/_search')
+            assert call.kwargs['timeout'] is not None
+    
+    def test_large_request_bodies_are_gzipped(self):
+        """Test gzip request compression above the size threshold"""
+        api = LogSearchAPI(compression=True)
+        with patch.object(api.session, 'post') as mock_post:
+            api._post('logs-*/_search', {'query': {'match': {'message': 'x' * 4096}}})
+        
+        assert mock_post.call_args.kwargs['headers'] == {'Content-Encoding': 'gzip'}
+        body = json.loads(gzip.decompress(mock_post.call_args.kwargs['data']))
+        assert body['query']['match']['message'] == 'x' * 4096
+    
+    @patch('api.search_api.search_api.session.post')
+    def test_stats_single_query_cached(self, mock_post, client):
+        """Test that stats come from one aggregation query and are cached"""
+        search_api.cache.clear()
+        mock_post.return_value = opensearch_response({
+            'aggregations': {
+                'levels': {'buckets': [{'key': 'ERROR', 'doc_count': 3}, {'key': 'INFO', 'doc_count': 7}]},
+                'sources': {'buckets': [{'key': 'apache', 'doc_count': 10}]},
+                'timeline': {'buckets': [{'key_as_string': '2023-10-10T13:00:00.000Z', 'doc_count': 10}]}
+            }
+        })
+        
+        first = client.get('/api/stats').get_json()
+        second = client.get('/api/stats').get_json()
+        
+        assert mock_post.call_count == 1
+        assert first == second
+        assert first['total_logs'] == 10
+        assert first['error_logs'] == 3
+        assert first['sources'] == [{'name': 'apache', 'count': 10}]
+        assert len(first['timeline']) == 1
+    
+    def test_ttl_cache_single_flight(self):
+        """Test that concurrent misses share one computation"""
+        cache = TTLCache()
+        calls = []
+        release = threading.Event()
+        
+        def compute():
+            calls.append(1)
+            release.wait(1)
+            return 'value'
+        
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', 60, compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        
+        assert len(calls) == 1
+        assert results == ['value'] * 5
+    
+    def test_resolve_indices_for_time_range(self):
+        """Test that bounded time ranges target only their monthly indices"""
+        assert resolve_indices('2023-10-10T13:00:00', '2023-10-10T14:00:00') == 'logs-2023-10'
+        assert resolve_indices('2023-11-20T00:00:00Z', '2024-01-05T00:00:00Z') == \
+            'logs-2023-11,logs-2023-12,logs-2024-01'
+        # Documents indexed just before midnight can land in the previous month's index
+        assert resolve_indices('2023-11-01T00:05:00+00:00', '2023-11-01T01:00:00+00:00') == \
+            'logs-2023-10,logs-2023-11'
+    
+    def test_resolve_indices_falls_back_to_wildcard(self):
+        """Test the wildcard for open-ended, invalid or very long ranges"""
+        assert resolve_indices(None, '2023-10-10T14:00:00') == 'logs-*'
+        assert resolve_indices('2023-10-10T13:00:00', None) == 'logs-*'
+        assert resolve_indices('yesterday', 'today') == 'logs-*'
+        assert resolve_indices('2015-01-01T00:00:00', '2023-10-10T00:00:00') == 'logs-*'
+    
+    @patch('api.search_api.search_api.session.delete')
+    @patch('api.search_api.search_api.session.post')
+    def test_search_cursor_pagination(self, mock_post, mock_delete, client):
+        """Test point-in-time pagination with search_after cursors"""
+        def hit(n):
+            return {'_id': str(n), '_source': {'message': f'log {n}'}, 'sort': [1000 - n, str(n)]}
+        
+        mock_post.side_effect = [
+            opensearch_response({'pit_id': 'pit-1'}),
+            opensearch_response({'pit_id': 'pit-1', 'hits': {'hits': [hit(1), hit(2)]}}),
+            opensearch_response({'pit_id': 'pit-1', 'hits': {'hits': [hit(3)]}})
+        ]
+        
+        first = client.get('/api/search?q=error&paginate=1&limit=2&fields=timestamp,message').get_json()
+        assert first['next_cursor']
+        assert mock_post.call_args_list[0].args[0].endswith('/_search/point_in_time')
+        
+        second = client.get(f"/api/search?cursor={first['next_cursor']}").get_json()
+        assert second['next_cursor'] is None
+        assert [h['_id'] for h in second['hits']['hits']] == ['3']
+        
+        page_query = json.loads(mock_post.call_args_list[2].kwargs['data'])
+        assert page_query['pit']['id'] == 'pit-1'
+        assert page_query['search_after'] == [998, '2']
+        assert page_query['_source'] == ['timestamp', 'message']
+        assert page_query['size'] == 2
+        mock_delete.assert_called_once()
+    
+    def test_search_with_invalid_cursor(self, client):
+        """Test that a malformed cursor is reported as an error"""
+        response = client.get('/api/search?cursor=not-a-cursor')
+        assert 'error' in response.get_json()
+    
+    @patch('api.search_api.search_api.session.delete')
+    @patch('api.search_api.search_api.session.post')
+    def test_export_streams_ndjson(self, mock_post, mock_delete, client):
+        """Test that exports page through a point in time and stream NDJSON"""
+        def hits(start, stop):
+            return {'hits': {'hits': [{'_source': {'message': f'log {n}'}, 'sort': [n, str(n)]}
+                                      for n in range(start, stop)]}}
+        
+        mock_post.side_effect = [
+            opensearch_response({'pit_id': 'pit-1'}),
+            opensearch_response(hits(0, 2)),
+            opensearch_response(hits(2, 3))
+        ]
+        
+        with patch('api.search_api.EXPORT_PAGE_SIZE', 2):
+            response = client.get('/api/export?level=ERROR', headers={'Accept-Encoding': 'gzip'})
+            body = gzip.decompress(response.get_data())
+        
+        assert response.headers['Content-Type'] == 'application/x-ndjson'
+        assert [json.loads(line)['message'] for line in body.splitlines()] == ['log 0', 'log 1', 'log 2']
+        mock_delete.assert_called_once()
+    
+    @patch('api.search_api.search_api.session.delete')
+    @patch('api.search_api.search_api.session.post')
+    def test_export_respects_limit(self, mock_post, mock_delete, client):
+        """Test that the export stops after the requested number of documents"""
+        mock_post.side_effect = [
+            opensearch_response({'pit_id': 'pit-1'}),
+            opensearch_response({'hits': {'hits': [{'_source': {'message': 'only'}, 'sort': [1, '1']}]}})
+        ]
+        
+        body = client.get('/api/export?limit=1').get_data()
+        
+        assert body.splitlines() == [b'{"message":"only"}']
+        assert json.loads(mock_post.call_args.kwargs['data'])['size'] == 1
+    
+    @patch('api.search_api.search_api.session.delete')
+    @patch('api.search_api.search_api.session.post')
+    def test_export_setup_failures_return_500(self, mock_post, mock_delete, client):
+        """Test that failures before the first page are real errors, not a streamed 200"""
+        mock_post.return_value = opensearch_response({'error': 'unavailable'}, status_code=503)
+        
+        response = client.get('/api/export')
+        
+        assert response.status_code == 500
+        assert 'point in time' in response.get_json()['error']
+        mock_delete.assert_not_called()
+        
+        mock_post.side_effect = [
+            opensearch_response({'pit_id': 'pit-1'}),
+            opensearch_response({'error': 'bad query'}, status_code=400)
+        ]
+        
+        response = client.get('/api/export?q=broken')
+        
+        assert response.status_code == 500
+        assert 'Export failed' in response.get_json()['error']
+        mock_delete.assert_called_once()
+    
+    @patch('api.search_api.search_api.session.delete')
+    @patch('api.search_api.search_api.session.post')
+    def test_export_reports_mid_stream_failures_inline(self, mock_post, mock_delete, client):
+        """Test that a failure after the first page ends the stream with an error line"""
+        mock_post.side_effect = [
+            opensearch_response({'pit_id': 'pit-1'}),
+            opensearch_response({'hits': {'hits': [{'_source': {'message': 'first'}, 'sort': [1, '1']}]}}),
+            opensearch_response({'error': 'timeout'}, status_code=504)
+        ]
+        
+        with patch('api.search_api.EXPORT_PAGE_SIZE', 1):
+            response = client.get('/api/export')
+            lines = response.get_data().splitlines()
+        
+        assert response.status_code == 200
+        assert json.loads(lines[0]) == {'message': 'first'}
+        assert 'Export failed' in json.loads(lines[1])['error']
+        mock_delete.assert_called_once()
+    
+    def test_asgi_mode_serves_search_and_stats(self):
+        """Test the async app against a stubbed OpenSearch transport"""
+        httpx = pytest.importorskip('httpx')
+        pytest.importorskip('starlette')
+        from starlette.testclient import TestClient
+        from api.search_api import create_asgi_app
+        
+        search_api.cache.clear()
+        requests_seen = []
+        
+        def opensearch(request):
+            requests_seen.append(request)
+            body = json.loads(request.content)
+            if 'aggs' in body:
+                return httpx.Response(200, json={'aggregations': {
+                    'levels': {'buckets': [{'key': 'WARNING', 'doc_count': 4}]},
+                    'sources': {'buckets': []},
+                    'timeline': {'buckets': []}
+                }})
+            return httpx.Response(200, json={'hits': {'total': {'value': 0}, 'hits': []}})
+        
+        with TestClient(create_asgi_app(transport=httpx.MockTransport(opensearch))) as asgi_client:
+            assert asgi_client.get('/health').json()['status'] == 'healthy'
+            assert 'hits' in asgi_client.get('/api/search?q=error&level=ERROR').json()
+            window = 'start_time=2023-10-10T13:00:01Z&end_time=2023-10-10T14:00:01Z'
+            asgi_client.get(f'/api/search?q=cached&{window}')
+            asgi_client.get(f'/api/search?q=cached&{window}')
+            assert asgi_client.get('/api/stats').json()['warning_logs'] == 4
+            asgi_client.get('/api/stats')
+            assert asgi_client.get('/api/search?limit=invalid').status_code == 500
+        
+        assert len(requests_seen) == 3
+        search_body = json.loads(requests_seen[0].content)
+        assert search_body['query']['bool']['filter'] == [{'term': {'level.keyword': 'ERROR'}}]
+        window_body = json.loads(requests_seen[1].content)
+        assert window_body['query']['bool']['filter'][0]['range']['timestamp'] == \
+            {'gte': '2023-10-10T13:00:01Z', 'lte': '2023-10-10T14:00:01Z'}
+    
+    @patch('api.search_api.search_api.session.post')
+    def test_search_results_cached_by_normalized_query(self, mock_post, client):
+        """Test that equivalent queries share a cache entry and keep the caller's time bounds"""
+        search_api.cache.clear()
+        mock_post.return_value = opensearch_response({'hits': {'total': {'value': 0}, 'hits': []}})
+        before = search_api.cache.metrics()
+        
+        client.get('/api/search?q=error&level=ERROR&start_time=2023-10-10T13:00:01.123Z&end_time=2023-10-10T14:00:01.123Z')
+        client.get('/api/search?level=ERROR&q=error&start_time=2023-10-10T13:00:01.123%2B00:00'
+                   '&end_time=2023-10-10T14:00:01.123%2B00:00')
+        client.get('/api/search?q=error&level=ERROR&start_time=2023-10-10T13:00:02Z&end_time=2023-10-10T14:00:02Z')
+        
+        assert mock_post.call_count == 2
+        metrics = client.get('/api/cache/stats').get_json()
+        assert metrics['hits'] - before['hits'] == 1
+        assert metrics['misses'] - before['misses'] == 2
+        time_filter = json.loads(mock_post.call_args_list[0].kwargs['data'])['query']['bool']['filter'][0]
+        assert time_filter['range']['timestamp'] == {'gte': '2023-10-10T13:00:01.123Z', 'lte': '2023-10-10T14:00:01.123Z'}
+    
+    @patch('api.search_api.search_api.session.post')
+    def test_aggregations_served_from_rollups(self, mock_post, client):
+        """Test that rollup dimensions read summed per-minute counts and other fields scan raw logs"""
+        search_api.cache.clear()
+        mock_post.return_value = opensearch_response({
+            'aggregations': {
+                'field_values': {'buckets': [{'key': 'ERROR', 'doc_count': 2, 'count': {'value': 130.0}}]},
+                'timeline': {'buckets': []}
+            }
+        })
+        
+        data = client.get('/api/aggregations/level?start_time=2023-10-10T13:00:00&end_time=2023-10-10T14:00:00').get_json()
+        client.get('/api/aggregations/host?start_time=2023-10-10T13:00:00&end_time=2023-10-10T14:00:00')
+        client.get('/api/aggregations/status_code?start_time=2023-10-10T13:00:00&end_time=2023-10-10T14:00:00')
+        client.get('/api/aggregations/level?start_time=2023-10-10T13:00:00')
+        
+        assert data['aggregations']['field_values']['buckets'] == [{'key': 'ERROR', 'doc_count': 130}]
+        rollup_call, *raw_calls = mock_post.call_args_list
+        assert rollup_call.args[0].endswith('/rollup-logs-2023-10/_search')
+        rollup_body = json.loads(rollup_call.kwargs['data'])
+        assert rollup_body['query']['bool']['filter'][0]['range']['minute'] == \
+            {'gte': '2023-10-10T13:00:00', 'lt': '2023-10-10T14:00:00'}
+        # status_code only lives in raw parsed_fields, and open-ended ranges predate the rollups
+        assert [call.args[0].rsplit('/', 2)[-2] for call in raw_calls] == ['logs-2023-10', 'logs-2023-10', 'logs-*']
+    
+    @patch('api.search_api.search_api.session.post')
+    def test_search_passes_opensearch_body_through(self, mock_post, client):
+        """Test that plain searches serve the OpenSearch response bytes without re-encoding them"""
+        search_api.cache.clear()
+        body = b'{"took": 3, "hits": {"total": {"value": 0}, "hits": []}}'
+        mock_post.return_value = opensearch_response(body)
+        
+        first = client.get('/api/search?q=passthrough')
+        second = client.get('/api/search?q=passthrough')
+        
+        assert first.get_data() == body
+        assert second.get_data() == body
+        assert first.headers['Content-Type'] == 'application/json'
+        assert mock_post.call_count == 1
+    
+    def test_json_codec_falls_back_to_stdlib(self):
+        """Test that values the fast codec rejects still round-trip"""
+        assert json_loads(b'{"value": NaN}')['value'] != json_loads(b'{"value": NaN}')['value']
+        assert json_loads(json_dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
+        assert json_dumps({'level': 'INFO'}) == b'{"level":"INFO"}'
+    
+    def test_snap_time_range(self):
+        """Test that time bounds widen outwards to whole buckets"""
+        assert snap_time_range('2023-10-10T13:00:59Z', '2023-10-10T13:05:00Z', 60) == \
+            ('2023-10-10T13:00:00', '2023-10-10T13:05:00')
+        assert snap_time_range(None, '2023-10-10T13:05:00.5', 300) == (None, '2023-10-10T13:10:00')
+    
+    def test_cache_lru_eviction_under_memory_cap(self):
+        """Test that least recently used entries are evicted past the memory cap"""
+        cache = TTLCache(max_bytes=10, sizeof=lambda value: 4)
+        cache.get_or_compute('a', 60, lambda: 'a')
+        cache.get_or_compute('b', 60, lambda: 'b')
+        cache.get_or_compute('a', 60, lambda: 'stale')
+        cache.get_or_compute('c', 60, lambda: 'c')
+        
+        assert cache.get_or_compute('a', 60, lambda: 'recomputed') == 'a'
+        assert cache.get_or_compute('b', 60, lambda: 'recomputed') == 'recomputed'
+        assert cache.metrics()['evictions'] == 2
+    
     def test_search_with_invalid_params(self, client):
         """Test search with invalid parameters"""
         response = client.get('/api/search?limit=invalid')
@@ -0,0 +1,85 @@
+import os
+import sys
+import pytest
+from unittest.mock import Mock, patch
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from log_generator import LogGenerator, KINESIS_MAX_BATCH_RECORDS, KINESIS_MAX_RECORD_BYTES
+
+THROTTLED = 'ProvisionedThroughputExceededException'
+
+@pytest.fixture
+def generator():
+    generator = LogGenerator(shards=4, max_retries=2)
+    generator.kinesis_client = Mock()
+    return generator
+
+def record(n):
+    return {'Data': f'{{"n": {n}}}'.encode('utf-8'), 'PartitionKey': f'shard-{n % 4}'}
+
+class TestLogGenerator:
+
+    def test_build_batches_respects_record_count(self, generator):
+        """Test that batches hold at most the put_records record limit"""
+        batches = list(generator.build_batches(b'{}' for _ in range(2 * KINESIS_MAX_BATCH_RECORDS + 1)))
+
+        assert [len(batch) for batch in batches] == [KINESIS_MAX_BATCH_RECORDS, KINESIS_MAX_BATCH_RECORDS, 1]
+        assert [r['PartitionKey'] for r in batches[0][:5]] == ['shard-0', 'shard-1', 'shard-2', 'shard-3', 'shard-0']
+
+    def test_build_batches_respects_byte_limit_and_skips_oversized(self, generator):
+        """Test the 5 MB batch limit and that records over 1 MB are dropped and counted"""
+        payloads = [b'x' * 900 * 1024] * 3 + [b'x' * KINESIS_MAX_RECORD_BYTES] + [b'x' * 900 * 1024] * 3
+
+        batches = list(generator.build_batches(payloads))
+
+        assert [len(batch) for batch in batches] == [5, 1]
+        assert generator.stats.records_failed == 1
+        assert generator.stats.errors == {'RecordTooLarge': 1}
+
+    @patch('log_generator.time.sleep')
+    def test_send_batch_resends_only_failed_records(self, mock_sleep, generator):
+        """Test that a partially throttled batch resends only its failed entries"""
+        records = [record(n) for n in range(4)]
+        generator.kinesis_client.put_records.side_effect = [
+            {'FailedRecordCount': 2, 'Records': [
+                {'SequenceNumber': '1'},
+                {'ErrorCode': THROTTLED, 'ErrorMessage': 'Rate exceeded'},
+                {'SequenceNumber': '3'},
+                {'ErrorCode': 'InternalFailure', 'ErrorMessage': 'Internal error'}
+            ]},
+            {'FailedRecordCount': 0, 'Records': [{'SequenceNumber': '2'}, {'SequenceNumber': '4'}]}
+        ]
+
+        generator.send_batch(records)
+
+        retry = generator.kinesis_client.put_records.call_args_list[1]
+        assert retry.kwargs['Records'] == [records[1], records[3]]
+        summary = generator.stats.summary()
+        assert summary['records_sent'] == 4
+        assert summary['records_failed'] == 0
+        assert summary['put_records_calls'] == 2
+        assert summary['retried_records'] == 2
+        assert summary['throttled_records'] == 1
+        assert summary['errors'] == {'InternalFailure': 1}
+        assert generator.stats.bytes_sent == sum(len(r['Data']) + len(r['PartitionKey']) for r in records)
+        mock_sleep.assert_called_once()
+
+    @patch('log_generator.time.sleep')
+    def test_send_batch_gives_up_after_max_retries(self, mock_sleep, generator):
+        """Test that a batch throttled on every attempt is counted as failed"""
+        records = [record(n) for n in range(3)]
+        generator.kinesis_client.put_records.side_effect = ClientError(
+            {'Error': {'Code': THROTTLED, 'Message': 'Rate exceeded'}}, 'PutRecords'
+        )
+
+        generator.send_batch(records)
+
+        summary = generator.stats.summary()
+        assert generator.kinesis_client.put_records.call_count == 3
+        assert summary['records_sent'] == 0
+        assert summary['records_failed'] == 3
+        assert summary['throttled_records'] == 9
+        assert summary['retried_records'] == 6
+        assert summary['errors'] == {THROTTLED: 3}
@@ -1,7 +1,65 @@
 import unittest
 import pytest
+import gzip
+import hashlib
 import json
-from lambda.log_parser import process_log_entry, parse_unstructured_log, sanitize_log
+import os
+import sys
+import threading
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+from http.server import BaseHTTPRequestHandler, HTTPServer
+# lambda/ is not importable as a package (lambda is a keyword), so load the module directly
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda'))
+
+import log_parser
+from log_parser import process_log_entry, parse_unstructured_log, sanitize_log, BulkIndexer, S3Archiver, lambda_handler, Redactor, expand_payload, \
+    RollupAccumulator, QuantileSketch, BatchMetrics, LogRecord, process_log_record
+
+
+class BulkStubHandler(BaseHTTPRequestHandler):
+    """Emulates the OpenSearch _bulk endpoint, rejecting documents listed in `server.reject`"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        lines = body.decode('utf-8').splitlines()
+        documents = [json.loads(line) for line in lines[1::2]]
+        self.server.requests.append(documents)
+
+        items = []
+        for document in documents:
+            status = self.server.reject.get(document['message'], [201])
+            items.append({'index': {'status': status.pop(0) if len(status) > 1 else status[0]}})
+
+        payload = json.dumps({'errors': any(i['index']['status'] >= 300 for i in items), 'items': items})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(payload.encode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def bulk_stub():
+    server = HTTPServer(('127.0.0.1', 0), BulkStubHandler)
+    server.requests = []
+    server.reject = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+@pytest.fixture
+def optional_formats():
+    saved = list(log_parser.LOG_FORMATS)
+    log_parser.register_optional_log_formats('nginx_error,syslog,logfmt')
+    yield
+    log_parser.LOG_FORMATS[:] = saved
+    log_parser._rebuild_format_index()
 
 class TestLogParser:
 
@@ -26,6 +84,18 @@ class TestLogParser:
         assert result['service'] == 'api-server'
         assert result['parsed_fields']['error_code'] == 'DB001'
 
+    def test_log_record_serializes_like_process_log_entry(self):
+        """Test that the internal record encodes to the same document as the dict adapter"""
+        log_data = {'source': 'apache', 'message': '10.0.0.1 - - [10/Oct/2023:13:55:36 +0000] "GET /login?token=abc HTTP/1.1" 200 512'}
+
+        record = process_log_record(log_data, '2023-10-10T13:55:40')
+        document = process_log_entry(log_data)
+
+        assert json.loads(record.to_json()) == dict(document, timestamp='2023-10-10T13:55:40', metadata=dict(
+            document['metadata'], processing_time='2023-10-10T13:55:40'))
+        assert record.parsed_fields['path'] == '/login?[REDACTED]'
+        assert record.to_json() is record.to_json()
+
     def test_parse_apache_log(self):
         """Test parsing Apache access logs"""
         apache_log = '192.168.1.100 - - [10/Oct/2023:13:55:36 +0000] "GET /api/users HTTP/1.1" 200 1024'
@@ -38,6 +108,100 @@ class TestLogParser:
         assert result['parsed_fields']['path'] == '/api/users'
         assert result['parsed_fields']['status_code'] == 200
 
+    def test_parse_application_log(self):
+        """Test parsing application logs with an embedded level"""
+        result = parse_unstructured_log('2023-10-10 13:55:36 [ERROR] Disk full')
+
+        assert result['log_type'] == 'application_log'
+        assert result['level'] == 'ERROR'
+        assert result['message'] == 'Disk full'
+        assert result['parsed_fields']['original_timestamp'] == '2023-10-10 13:55:36'
+
+    def test_parse_syslog(self, optional_formats):
+        """Test parsing syslog lines with a priority prefix"""
+        result = parse_unstructured_log('<11>Oct 11 22:14:15 web-01 sshd[4321]: Connection closed')
+
+        assert result['log_type'] == 'syslog'
+        assert result['level'] == 'ERROR'
+        assert result['message'] == 'Connection closed'
+        assert result['parsed_fields']['program'] == 'sshd'
+        assert result['parsed_fields']['pid'] == 4321
+
+    def test_parse_logfmt(self, optional_formats):
+        """Test parsing logfmt key/value lines"""
+        result = parse_unstructured_log('level=warn msg="cache miss" key=user:42 took=12ms')
+
+        assert result['log_type'] == 'logfmt'
+        assert result['level'] == 'WARNING'
+        assert result['message'] == 'cache miss'
+        assert result['parsed_fields'] == {'key': 'user:42', 'took': '12ms'}
+
+    def test_optional_formats_are_not_registered_by_default(self):
+        """Test that syslog and logfmt lines stay unstructured unless their formats are registered"""
+        for line in ('<11>Oct 11 22:14:15 web-01 sshd[4321]: Connection closed', 'level=warn msg="cache miss"'):
+            assert parse_unstructured_log(line)['log_type'] == 'unstructured'
+
+    def test_logfmt_rejects_long_lines_in_linear_time(self, optional_formats):
+        """Test that near-logfmt lines fall through without catastrophic backtracking"""
+        for line in ('a="b" ' * 2000 + '!', 'a=b ' * 2000 + '!', 'a= ' * 2000 + '!'):
+            started = time.perf_counter()
+            assert parse_unstructured_log(line)['log_type'] == 'unstructured'
+            assert time.perf_counter() - started < 0.5
+
+    def test_parse_unrecognized_log(self):
+        """Test fallback for messages matching no registered format"""
+        result = parse_unstructured_log('something happened')
+
+        assert result['log_type'] == 'unstructured'
+        assert result['message'] == 'something happened'
+        assert result['parsed_fields'] == {}
+
+    def test_expand_cloudwatch_envelope(self):
+        """Test expanding a gzipped CloudWatch Logs subscription envelope"""
+        envelope = {
+            'messageType': 'DATA_MESSAGE',
+            'logGroup': '/aws/lambda/checkout',
+            'logStream': '2023/10/10/[$LATEST]abc',
+            'logEvents': [
+                {'id': '1', 'timestamp': 1696946136000, 'message': 'START RequestId: 42\n'},
+                {'id': '2', 'timestamp': 1696946136001,
+                 'message': '{"level": "ERROR", "message": "Card declined", "service": "checkout"}'}
+            ]
+        }
+
+        entries = list(expand_payload(gzip.compress(json.dumps(envelope).encode('utf-8'))))
+
+        assert entries == [
+            {'message': 'START RequestId: 42', 'source': '/aws/lambda/checkout'},
+            {'level': 'ERROR', 'message': 'Card declined', 'service': 'checkout',
+             'source': '/aws/lambda/checkout'}
+        ]
+
+    def test_expand_cloudwatch_control_message(self):
+        """Test that CloudWatch control messages carry no log entries"""
+        envelope = {'messageType': 'CONTROL_MESSAGE', 'logGroup': '', 'logEvents': [
+            {'id': '', 'timestamp': 0, 'message': 'CWL CONTROL MESSAGE: Checking health of destination'}
+        ]}
+
+        assert list(expand_payload(gzip.compress(json.dumps(envelope).encode('utf-8')))) == []
+
+    def test_expand_kpl_aggregated_record(self):
+        """Test deaggregating a KPL aggregated record into its user records"""
+        def field(number, payload):
+            assert len(payload) < 128
+            return bytes([number << 3 | 2, len(payload)]) + payload
+
+        user_records = [json.dumps({'source': 'apache', 'message': f'log {i}'}).encode('utf-8')
+                        for i in range(3)]
+        aggregated = field(1, b'pk') + b''.join(
+            field(3, b'\x08\x00' + field(3, data)) for data in user_records
+        )
+        payload = b'\xf3\x89\x9a\xc2' + aggregated + hashlib.md5(aggregated).digest()
+
+        entries = list(expand_payload(payload))
+
+        assert [entry['message'] for entry in entries] == ['log 0', 'log 1', 'log 2']
+
     def test_sanitize_sensitive_data(self):
         """Test removal of sensitive information"""
         log_entry = {
@@ -63,26 +227,315 @@ class TestLogParser:
         assert '[REDACTED]' in result['message']
         assert '4532-1234-5678-9012' not in result['message']
 
-    def test_parse_logs_valid(self):
-        # Test with a valid log input
-        log_data = "INFO: User logged in\nERROR: Failed to load resource"
-        expected_output = [
-            {"level": "INFO", "message": "User logged in"},
-            {"level": "ERROR", "message": "Failed to load resource"}
+    def test_sanitize_nested_fields(self):
+        """Test redaction of sensitive values inside parsed_fields"""
+        log_entry = {
+            'message': 'Checkout complete',
+            'parsed_fields': {
+                'api_key': 'sk_live_123',
+                'request': {'headers': ['Authorization: token=abc123def'], 'retries': 2},
+                'card': 4532123456789012
+            }
+        }
+
+        result = sanitize_log(log_entry)
+
+        fields = result['parsed_fields']
+        assert fields['api_key'] == '[REDACTED]'
+        assert 'abc123def' not in fields['request']['headers'][0]
+        assert fields['request']['retries'] == 2
+        assert fields['card'] == '[REDACTED]'
+
+    def test_sensitive_fields_match_whole_key_segments(self):
+        """Test that field redaction matches key segments and leaves numbers alone"""
+        log_entry = {
+            'message': 'Completion finished',
+            'parsed_fields': {
+                'access_token': 'abc123def',
+                'apiKey': 'sk_live_123',
+                'userPassword': 'hunter2',
+                'prompt_tokens': 12,
+                'completion_tokens': '34',
+                'token_count': 46,
+                'secretary': 'Jane'
+            }
+        }
+
+        fields = sanitize_log(log_entry)['parsed_fields']
+
+        assert fields['access_token'] == '[REDACTED]'
+        assert fields['apiKey'] == '[REDACTED]'
+        assert fields['userPassword'] == '[REDACTED]'
+        assert fields['prompt_tokens'] == 12
+        assert fields['completion_tokens'] == '34'
+        assert fields['token_count'] == 46
+        assert fields['secretary'] == 'Jane'
+
+    def test_redactor_custom_rules_and_hit_counts(self):
+        """Test a custom rule set and its per-rule hit counters"""
+        redactor = Redactor({'email': r'[\w.+-]+@[\w-]+\.[\w.]+', 'ssn': r'\b\d{3}-\d{2}-\d{4}\b'})
+
+        text = redactor.redact('user a@example.com and b@example.com, ssn 123-45-6789')
+
+        assert text == 'user [REDACTED] and [REDACTED], ssn [REDACTED]'
+        assert redactor.reset_hits() == {'email': 2, 'ssn': 1, 'sensitive_field': 0}
+        assert redactor.hits['email'] == 0
+
+    def test_rollup_accumulator_per_minute(self):
+        """Test per-minute rollups of counts and response times"""
+        accumulator = RollupAccumulator()
+        for second, response_time in [(1, 120), (30, 80), (59, None)]:
+            accumulator.add(LogRecord(
+                f'2023-10-10T13:55:{second:02d}.000000', 'api-gateway', level='INFO', service='orders',
+                parsed_fields={'status_code': 200, 'response_time': response_time}
+            ))
+        accumulator.add(LogRecord('2023-10-10T13:56:00.000000', 'apache', level='ERROR',
+                                  parsed_fields={'status_code': 500}))
+
+        documents = sorted(accumulator.documents(), key=lambda d: d['minute'])
+
+        assert len(documents) == 2
+        assert documents[0] == {
+            'minute': '2023-10-10T13:55:00', 'source': 'api-gateway', 'service': 'orders',
+            'level': 'INFO', 'status_code': '200', 'count': 3,
+            'response_time_count': 2, 'response_time_sum': 200.0, 'response_time_max': 120.0
+        }
+        assert documents[1]['status_code'] == '500'
+        assert 'service' not in documents[1]
+
+    def test_bulk_index_batches_documents(self, bulk_stub):
+        """Test that a batch is sent as size-capped _bulk requests"""
+        indexer = BulkIndexer(f"http://127.0.0.1:{bulk_stub.server_port}", max_bytes=200)
+        entries = [{'message': f'log {i}', 'level': 'INFO'} for i in range(5)]
+
+        failed = indexer.index(entries)
+
+        assert failed == []
+        assert len(bulk_stub.requests) > 1
+        assert sum(len(r) for r in bulk_stub.requests) == 5
+
+    def test_bulk_index_retries_only_failed_documents(self, bulk_stub):
+        """Test that throttled items are retried and rejected items are reported"""
+        bulk_stub.reject = {'log 1': [429, 201], 'log 3': [400]}
+        indexer = BulkIndexer(f"http://127.0.0.1:{bulk_stub.server_port}", backoff_seconds=0)
+        entries = [{'message': f'log {i}', 'level': 'INFO'} for i in range(4)]
+
+        failed = indexer.index(entries)
+
+        assert failed == [3]
+        assert [d['message'] for d in bulk_stub.requests[1]] == ['log 1']
+
+    def test_bulk_request_errors_are_retryable(self):
+        """Test that request-level errors leave documents to be replayed, not rejected"""
+        indexer = BulkIndexer('http://opensearch:9200', max_retries=1, backoff_seconds=0)
+        entries = [{'message': f'log {i}', 'level': 'INFO'} for i in range(2)]
+
+        for status in (403, 413, 400):
+            indexer.session = Mock()
+            indexer.session.post.return_value = Mock(status_code=status, text='denied')
+
+            assert indexer.index_batch(entries) == ([0, 1], [])
+            assert indexer.session.post.call_count == 2
+
+    def test_bulk_index_sends_chunks_concurrently(self, bulk_stub):
+        """Test that chunked _bulk requests can be sent through an executor"""
+        bulk_stub.reject = {'log 7': [503, 201]}
+        indexer = BulkIndexer(f"http://127.0.0.1:{bulk_stub.server_port}", max_bytes=200,
+                              backoff_seconds=0)
+        entries = [{'message': f'log {i}', 'level': 'INFO'} for i in range(10)]
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            failed = indexer.index(entries, executor=executor)
+
+        assert failed == []
+        messages = [d['message'] for r in bulk_stub.requests for d in r]
+        assert sorted(messages) == sorted([f'log {i}' for i in range(10)] + ['log 7'])
+
+    def test_s3_archive_batches_by_source_and_hour(self):
+        """Test that a batch is written as one gzipped NDJSON object per partition"""
+        client = Mock()
+        archiver = S3Archiver('archive-bucket', client)
+        records = [
+            ({'eventID': f'shardId-000000000001:{seq}',
+              'kinesis': {'sequenceNumber': str(seq), 'approximateArrivalTimestamp': 1696946136.0}},
+             {'source': source, 'message': f'log {seq}'})
+            for seq, source in [(100, 'apache'), (101, 'application'), (102, 'apache')]
         ]
-        self.assertEqual(parse_logs(log_data), expected_output)
-
-    def test_parse_logs_empty(self):
-        # Test with empty log input
-        log_data = ""
-        expected_output = []
-        self.assertEqual(parse_logs(log_data), expected_output)
-
-    def test_parse_logs_invalid_format(self):
-        # Test with invalid log input
-        log_data = "INVALID LOG FORMAT"
-        with self.assertRaises(ValueError):
-            parse_logs(log_data)
+
+        failed = archiver.archive(records)
+
+        assert failed == []
+        assert client.put_object.call_count == 2
+        calls = {c.kwargs['Key']: c.kwargs for c in client.put_object.call_args_list}
+        key = 'logs/source=apache/2023/10/10/13/shardId-000000000001-100-102.ndjson.gz'
+        assert key in calls
+        lines = gzip.decompress(calls[key]['Body']).decode('utf-8').splitlines()
+        assert [json.loads(line)['message'] for line in lines] == ['log 100', 'log 102']
+
+    def test_s3_archive_reports_failed_partitions(self):
+        """Test that records in a failed upload are reported back"""
+        client = Mock()
+        client.put_object.side_effect = Exception('SlowDown')
+        archiver = S3Archiver('archive-bucket', client)
+
+        failed = archiver.archive([({}, {'source': 'apache', 'message': 'a'}),
+                                   ({}, {'source': 'apache', 'message': 'b'})])
+
+        assert failed == [0, 1]
+
+    def test_quantile_sketch_relative_accuracy(self):
+        """Test that sketch quantiles stay within the relative accuracy of the exact values"""
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in range(1, 1001):
+            sketch.add(float(value))
+
+        assert sketch.count == 1000
+        assert abs(sketch.quantile(0.5) - 500) <= 500 * 0.01
+        assert abs(sketch.quantile(0.99) - 990) <= 990 * 0.01
+        assert sketch.to_dict()['max'] == 1000
+        assert sum(sketch.to_dict()['bin_counts']) == 1000
+
+    def test_batch_metrics_groups_by_path(self):
+        """Test that batch metrics group access logs by path and cap the number of groups"""
+        metrics = BatchMetrics(max_groups=3)
+        metrics.add(LogRecord('2023-10-10T13:55:00', 'app', level='ERROR', service='api',
+                              parsed_fields={'duration_ms': 250}))
+        for path, status, size in [('/api/users?id=1', 200, 512), ('/api/users?id=2', 503, 128),
+                                   ('/login', 302, 64), ('/logout', 200, 32)]:
+            metrics.add(LogRecord('2023-10-10T13:55:00', 'apache',
+                                  parsed_fields={'path': path, 'status_code': status, 'response_size': size}))
+
+        groups = {group['path']: group for group in metrics.document()['groups']}
+
+        assert metrics.record_count == 5
+        assert groups['/api/users']['count'] == 2
+        assert groups['/api/users']['status_5xx'] == 1
+        assert groups['/api/users']['response_size']['max'] == 512
+        assert groups['__other__']['count'] == 1
+        assert groups['none']['errors'] == 1
+        assert groups['none']['latency_ms']['p50'] == pytest.approx(250, rel=0.01)
+
+    @patch('log_parser.get_s3_archiver')
+    @patch('log_parser.get_bulk_indexer')
+    def test_handler_reports_batch_item_failures(self, mock_indexer, mock_archiver):
+        """Test that only retryable record failures are reported back to Kinesis"""
+        mock_indexer.return_value.index_batch.return_value = ([1], [])
+        mock_indexer.return_value.upsert_rollups.return_value = ([], [])
+        mock_indexer.return_value.send_actions.return_value = ([], [])
+        mock_archiver.return_value.archive.return_value = []
+
+        def kinesis_record(sequence_number, payload):
+            return {'eventID': f'shardId-000000000000:{sequence_number}',
+                    'kinesis': {'sequenceNumber': sequence_number,
+                                'data': base64.b64encode(payload).decode('utf-8')}}
+
+        event = {'Records': [
+            kinesis_record('1', json.dumps({'level': 'INFO', 'message': 'ok'}).encode('utf-8')),
+            kinesis_record('2', b'not json'),
+            kinesis_record('3', json.dumps({'level': 'ERROR', 'message': 'retry me'}).encode('utf-8'))
+        ]}
+
+        result = lambda_handler(event, None)
+
+        assert result['batchItemFailures'] == [{'itemIdentifier': '3'}]
+        # Record 3 will be replayed, so only record 1 is rolled up now
+        rollups = mock_indexer.return_value.upsert_rollups.call_args.args[0]
+        assert [(r['level'], r['count']) for r in rollups] == [('INFO', 1)]
+        metrics, index_name, ids = mock_indexer.return_value.encode_actions.call_args.args
+        assert metrics[0]['record_count'] == 1
+        assert index_name.startswith('metrics-')
+        assert ids == ['shardId-000000000000:1..shardId-000000000000:1']
+        body = json.loads(result['body'])
+        assert body['processed_count'] == 2
+        assert body['failures']['decode'] == 1
+        assert body['failures']['index'] == 1
+
+    @patch('log_parser.get_s3_archiver')
+    @patch('log_parser.get_bulk_indexer')
+    def test_handler_accepts_non_dict_fields(self, mock_indexer, mock_archiver):
+        """Test that structured logs whose fields are not an object are rolled up, not failed"""
+        mock_indexer.return_value.index_batch.return_value = ([], [])
+        mock_indexer.return_value.upsert_rollups.return_value = ([], [])
+        mock_indexer.return_value.send_actions.return_value = ([], [])
+        mock_archiver.return_value.archive.return_value = []
+
+        event = {'Records': [
+            {'eventID': f'shardId-000000000000:{seq}',
+             'kinesis': {'sequenceNumber': str(seq),
+                         'data': base64.b64encode(json.dumps({'level': 'INFO', 'message': 'x', 'fields': fields}).encode('utf-8')).decode('utf-8')}}
+            for seq, fields in enumerate(['abc', [1, 2], 5])
+        ]}
+
+        result = lambda_handler(event, None)
+
+        assert result['statusCode'] == 200
+        assert result['batchItemFailures'] == []
+        rollups = mock_indexer.return_value.upsert_rollups.call_args.args[0]
+        assert [(r['level'], r['count'], r.get('status_code')) for r in rollups] == [('INFO', 3, None)]
+        metrics = mock_indexer.return_value.encode_actions.call_args.args[0]
+        assert metrics[0]['record_count'] == 3
+
+        # Failing rollup and metrics updates are logged; the indexed records are not replayed
+        mock_indexer.return_value.upsert_rollups.side_effect = Exception('rollup index unavailable')
+        mock_indexer.return_value.send_actions.side_effect = Exception('metrics index unavailable')
+        result = lambda_handler(event, None)
+
+        assert result['statusCode'] == 200
+        assert result['batchItemFailures'] == []
+
+    @patch('log_parser.get_s3_archiver')
+    @patch('log_parser.get_bulk_indexer')
+    def test_handler_skips_non_finite_measurements(self, mock_indexer, mock_archiver):
+        """Test that NaN and Infinity durations are left out of rollups and sketches"""
+        mock_indexer.return_value.index_batch.return_value = ([], [])
+        mock_indexer.return_value.upsert_rollups.return_value = ([], [])
+        mock_indexer.return_value.send_actions.return_value = ([], [])
+        mock_archiver.return_value.archive.return_value = []
+
+        payloads = [b'{"level": "INFO", "message": "x", "fields": {"duration_ms": NaN, "response_size": Infinity}}',
+                    b'{"level": "INFO", "message": "y", "fields": {"duration_ms": -Infinity}}',
+                    b'{"level": "INFO", "message": "z", "fields": {"duration_ms": 40}}']
+        event = {'Records': [
+            {'eventID': f'shardId-000000000000:{seq}',
+             'kinesis': {'sequenceNumber': str(seq), 'data': base64.b64encode(payload).decode('utf-8')}}
+            for seq, payload in enumerate(payloads)
+        ]}
+
+        result = lambda_handler(event, None)
+
+        assert result['statusCode'] == 200
+        assert result['batchItemFailures'] == []
+        rollup = mock_indexer.return_value.upsert_rollups.call_args.args[0][0]
+        assert (rollup['count'], rollup['response_time_count'], rollup['response_time_sum']) == (3, 1, 40.0)
+        group = mock_indexer.return_value.encode_actions.call_args.args[0][0]['groups'][0]
+        assert group['latency_ms']['count'] == 1
+        assert 'response_size' not in group
+
+    @patch('log_parser.INDEX_FLUSH_RECORDS', 2)
+    @patch('log_parser.get_s3_archiver')
+    @patch('log_parser.get_bulk_indexer')
+    def test_handler_indexes_slices_while_parsing(self, mock_indexer, mock_archiver):
+        """Test that failures from each indexing slice map back to the right records"""
+        # Slices are [0, 1], [2, 3], [4]: record 2 stays throttled, record 4 is rejected
+        outcomes = {'shardId-000000000000:2': ([0], []), 'shardId-000000000000:4': ([], [0])}
+        mock_indexer.return_value.index_batch.side_effect = \
+            lambda entries, now, ids, executor: outcomes.get(ids[0], ([], []))
+        mock_indexer.return_value.upsert_rollups.return_value = ([], [])
+        mock_indexer.return_value.send_actions.return_value = ([], [])
+        mock_archiver.return_value.archive.return_value = []
+
+        event = {'Records': [
+            {'eventID': f'shardId-000000000000:{seq}',
+             'kinesis': {'sequenceNumber': str(seq),
+                         'data': base64.b64encode(json.dumps({'level': 'INFO', 'message': f'log {seq}'}).encode('utf-8')).decode('utf-8')}}
+            for seq in range(5)
+        ]}
+
+        result = lambda_handler(event, None)
+
+        assert mock_indexer.return_value.index_batch.call_count == 3
+        assert result['batchItemFailures'] == [{'itemIdentifier': '2'}]
+        assert json.loads(result['body'])['failures']['rejected'] == 1
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import json
+import os
+import random
+import sys
+import pytest
+from unittest.mock import Mock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from traffic_profiles import LoadProfile, Phase, PROFILES, RateScheduler, SCHEDULER_TICK, TrafficShaper, \
+    ZipfSampler
+
+class FakeClock:
+    """Stands in for time.perf_counter and time.sleep, advancing only when slept"""
+
+    def __init__(self, now: float = 100.0):
+        self.now = now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(0.0, seconds)
+
+def integrate(rate, t, steps=20000):
+    """Midpoint rule integral of rate over [0, t]"""
+    width = t / steps
+    return sum(rate((index + 0.5) * width) for index in range(steps)) * width
+
+class TestTrafficProfiles:
+
+    @pytest.mark.parametrize('spec', [
+        {'shape': 'constant', 'duration': 60, 'rate': 0.7},
+        {'shape': 'ramp', 'duration': 300, 'from': 0.1, 'to': 1.0},
+        {'shape': 'ramp', 'duration': 100, 'from': 1.0, 'to': 0.0},
+        {'shape': 'step', 'duration': 300, 'from': 0.25, 'to': 1.0, 'steps': 4},
+        {'shape': 'step', 'duration': 10, 'from': 0.5, 'to': 2.0, 'steps': 1},
+        {'shape': 'sine', 'duration': 600, 'mean': 0.55, 'amplitude': 0.45},
+        {'shape': 'sine', 'duration': 500, 'mean': 1.0, 'amplitude': 0.3, 'period': 120}
+    ])
+    def test_phase_volume_is_integral_of_rate(self, spec):
+        """Test that each shape's closed-form volume matches its rate curve"""
+        phase = Phase(spec)
+
+        for fraction in (0.13, 0.5, 0.77, 1.0):
+            t = phase.duration * fraction
+            assert phase.volume(t) == pytest.approx(integrate(phase.rate, t), rel=1e-3, abs=1e-6)
+
+    def test_profile_volume_and_rate_cycle(self):
+        """Test that rates, volumes and storms continue across phases and repeat each cycle"""
+        burst = LoadProfile.load('burst')
+        assert burst.duration == 60
+        assert burst.cycle_volume == pytest.approx(0.2 * 50 + 1.0 * 10)
+        assert burst.rate(49) == 0.2
+        assert burst.rate(55) == 1.0
+        assert burst.rate(115) == 1.0
+        assert burst.volume(55) == pytest.approx(10 + 5)
+        assert burst.volume(130) == pytest.approx(2 * 20 + 0.2 * 10)
+
+        storm = LoadProfile.load('error-storm')
+        assert storm.error_ratio(50) is None
+        assert storm.error_ratio(70) == 0.9
+        assert storm.error_ratio(190) == 0.9
+        assert storm.error_ratio(200) is None
+
+    def test_profile_validation(self, tmp_path):
+        """Test that malformed profiles are rejected and built-in or file profiles load"""
+        for name in PROFILES:
+            assert LoadProfile.load(name).name == name
+
+        path = tmp_path / 'custom.json'
+        path.write_text(json.dumps({'phases': [{'shape': 'constant', 'duration': 5, 'rate': 2}]}))
+        assert LoadProfile.load(str(path)).volume(5) == 10
+
+        constant = {'shape': 'constant', 'duration': 10, 'rate': 1}
+        invalid = [
+            {'phases': []},
+            {'phases': [{'shape': 'square', 'duration': 10}]},
+            {'phases': [dict(constant, duration=0)]},
+            {'phases': [dict(constant, rate=-1)]},
+            {'phases': [{'shape': 'sine', 'duration': 10, 'mean': 0.2, 'amplitude': 0.5}]},
+            {'phases': [{'shape': 'step', 'duration': 10, 'from': 0, 'to': 1, 'steps': 0}]},
+            {'phases': [constant], 'storms': [{'start': 0, 'duration': 5, 'error_ratio': 1.5}]},
+            {'phases': [constant], 'skew': {'regions': 1.0}},
+            {'phases': [constant], 'oversized': {'ratio': 2}},
+            {'phases': [constant], 'rate': 1},
+            {'phases': [dict(constant, rate=0), {'shape': 'ramp', 'duration': 5, 'from': 0, 'to': 0}]}
+        ]
+        for spec in invalid:
+            with pytest.raises(ValueError):
+                LoadProfile.from_dict(spec)
+        with pytest.raises(ValueError):
+            LoadProfile.load(str(tmp_path / 'missing.json'))
+
+    def test_scheduler_releases_base_rate_times_volume(self):
+        """Test that the open-loop scheduler releases base_rate * volume(t) records on ticks"""
+        clock = FakeClock()
+        profile = LoadProfile.from_dict({'phases': [
+            {'shape': 'ramp', 'duration': 1, 'from': 0.1, 'to': 1.0},
+            {'shape': 'sine', 'duration': 2, 'mean': 0.6, 'amplitude': 0.4}
+        ]})
+        scheduler = RateScheduler(profile, base_rate=1000)
+
+        with patch('traffic_profiles.time', clock):
+            while clock.now < 104.5:
+                assert scheduler.wait(10 ** 6) > 0
+                elapsed = clock.now - 100.0
+                assert scheduler.released == int(1000 * profile.volume(elapsed))
+            assert scheduler.max_lag <= SCHEDULER_TICK + 1e-9
+
+            # A stalled sender gets the records it missed at once, capped at the limit
+            clock.now += 1.0
+            assert scheduler.wait(50) == 50
+            assert scheduler.max_lag == pytest.approx(1.0, abs=SCHEDULER_TICK)
+
+    def test_scheduler_wait_stops_at_timeout(self):
+        """Test that a zero-rate phase cannot hold the scheduler past the caller's deadline"""
+        clock = FakeClock()
+        profile = LoadProfile.from_dict({'phases': [
+            {'shape': 'constant', 'duration': 1, 'rate': 1.0},
+            {'shape': 'constant', 'duration': 15, 'rate': 0.0}
+        ]})
+        scheduler = RateScheduler(profile, base_rate=100)
+
+        with patch('traffic_profiles.time', clock):
+            released = 0
+            while released < 100:
+                released += scheduler.wait(10 ** 6, timeout=3.0)
+            assert scheduler.wait(10 ** 6, timeout=2.0) == 0
+            assert clock.now == pytest.approx(103.0)
+
+    def test_scheduler_due_time(self):
+        """Test that due_time inverts the scheduled volume"""
+        profile = LoadProfile.from_dict({'phases': [{'shape': 'ramp', 'duration': 10, 'from': 0.0, 'to': 2.0}]})
+        scheduler = RateScheduler(profile, base_rate=100)
+
+        assert scheduler.due_time(100, 10) == pytest.approx(10 ** 0.5, rel=1e-6)
+        for record in (1, 250, 999):
+            assert 100 * profile.volume(scheduler.due_time(record, 10)) == pytest.approx(record, rel=1e-6)
+
+    def test_zipf_sampler(self):
+        """Test Zipf probabilities and that sampling follows them"""
+        uniform = ZipfSampler(4, 0.0)
+        assert [uniform.probability(rank) for rank in range(4)] == pytest.approx([0.25] * 4)
+
+        sampler = ZipfSampler(4, 1.5, rng=random.Random(7))
+        probabilities = [sampler.probability(rank) for rank in range(4)]
+        assert sum(probabilities) == pytest.approx(1.0)
+        assert probabilities[0] / probabilities[1] == pytest.approx(2 ** 1.5)
+
+        counts = [0] * 4
+        for _ in range(20000):
+            counts[sampler.sample()] += 1
+        assert [count / 20000 for count in counts] == pytest.approx(probabilities, abs=0.02)
+
+    def test_shaper_tops_up_errors_during_storms(self):
+        """Test that storms replace just enough payloads to reach the storm's error ratio"""
+        engine = Mock(error_share=0.1)
+        engine.generate_log.return_value = {'level': 'ERROR'}
+        profile = LoadProfile.from_dict({
+            'phases': [{'shape': 'constant', 'duration': 100, 'rate': 1.0}],
+            'storms': [{'start': 10, 'duration': 10, 'error_ratio': 0.55},
+                       {'start': 50, 'duration': 10, 'error_ratio': 0.05}]
+        })
+        shaper = TrafficShaper(profile, engine, rng=random.Random(3))
+
+        calm = [b'{}'] * 100
+        assert shaper.shape(calm, 5) is calm
+        assert shaper.shape([b'{}'] * 100, 55) == [b'{}'] * 100
+        assert shaper.storm_records == 0
+
+        # (0.55 - 0.1) / (1 - 0.1): half the payloads become errors on top of the 10% already there
+        payloads = shaper.shape([b'{}'] * 10000, 15)
+        assert shaper.storm_records == payloads.count(b'{"level": "ERROR"}')
+        assert shaper.storm_records / 10000 == pytest.approx(0.5, abs=0.02)
+        engine.generate_log.assert_called_with('error')